@@ -0,0 +1,92 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, Response
+
+from core import config, profiling
+from core.finalizer import route_finalizer
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+)
+
+# Media type and file extension of the profiles of core.profiling.captures
+PROFILE_FORMATS = {
+    "pstats": ("application/octet-stream", "pstats"),
+    "collapsed": ("text/plain", "txt"),
+}
+
+
+@router.get("/finalizer/")
+def finalizer_status():
+    return route_finalizer.status()
+
+
+def profiles_not_found():
+    # Profiles expose request paths and code, they are served only
+    # where profiling was switched on
+    return JSONResponse(
+        status_code=404,
+        content={"message": ["No such profile!"]},
+    )
+
+
+@router.get("/profiles/", responses={404: {"description": "Not found"}})
+def list_profiles():
+    """
+    Profiled and slow requests, the latest last.
+    Not found unless PROFILE_HEADER_ENABLED.
+    """
+    if not config.PROFILE_HEADER_ENABLED:
+        return profiles_not_found()
+    return {
+        "profiles": [
+            {
+                **{
+                    name: value
+                    for name, value in capture.items()
+                    if name not in PROFILE_FORMATS
+                },
+                "formats": [
+                    name for name in PROFILE_FORMATS if capture[name] is not None
+                ],
+            }
+            for capture in list(profiling.captures)
+        ]
+    }
+
+
+@router.get(
+    "/profiles/{capture_id}/{profile_format}",
+    responses={404: {"description": "Not found"}},
+)
+def download_profile(capture_id: int, profile_format: str):
+    """
+    Profile of a request, as a pstats file (see pstats.Stats)
+    or as collapsed stacks (see flamegraph.pl)
+    """
+    if not config.PROFILE_HEADER_ENABLED:
+        return profiles_not_found()
+    capture = next(
+        (
+            capture
+            for capture in list(profiling.captures)
+            if capture["id"] == capture_id
+        ),
+        None,
+    )
+    if (
+        capture is None
+        or profile_format not in PROFILE_FORMATS
+        or capture[profile_format] is None
+    ):
+        return profiles_not_found()
+    media_type, extension = PROFILE_FORMATS[profile_format]
+    return Response(
+        capture[profile_format],
+        media_type=media_type,
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="request-{capture_id}.{extension}"'
+            )
+        },
+    )
@@ -0,0 +1,78 @@
+"""
+Responses of closed routes.
+
+Length and longest paths of a closed route never change, so their JSON
+bodies are serialized once, kept on the route and served as they are,
+with a strong ETag. A request whose If-None-Match matches gets a 304
+without the route data being read.
+"""
+import datetime
+import hashlib
+import json
+from typing import Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from core import metrics
+from core.models import Route
+
+CACHE_CONTROL = "public, max-age=86400, immutable"
+
+
+class CachedJSONResponse(Response):
+    """
+    JSON response with an already serialized body
+    """
+
+    media_type = "application/json"
+
+
+def _headers(etag: str):
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match uses the weak comparison
+    return "*" in tags or etag in (
+        tag[2:] if tag.startswith("W/") else tag for tag in tags
+    )
+
+
+def cached_response(
+    route: Optional[Route], name: str, request: Request
+) -> Optional[Response]:
+    """
+    The cached `name` response of a route, or None if there is none yet
+    """
+    cached = route.responses.get(name) if route is not None else None
+    if cached is None:
+        return None
+
+    etag, body = cached
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=_headers(etag))
+    return CachedJSONResponse(body, headers=_headers(etag))
+
+
+def route_response(route: Optional[Route], name: str, content):
+    """
+    Serialize and cache `content` as the `name` response of a closed route.
+    Content of open routes is returned as it is.
+    """
+    if route is None or route.created == datetime.date.today():
+        return content
+
+    with metrics.serialization_seconds.time():
+        body = json.dumps(
+            jsonable_encoder(content),
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
+    etag = '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+    route.responses[name] = (etag, body)
+    return CachedJSONResponse(body, headers=_headers(etag))
@@ -1,9 +1,30 @@
-from fastapi import APIRouter
+import datetime
+import json
+
+from decimal import Decimal
+from typing import Optional
+
+from fastapi import APIRouter, Query, Request, Response, WebSocket
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic.types import UUID
 
-from core import crud
-from core.schemas import Route, WayPoint, LongestPaths
-from core.crud import get_calculated_route_data
+from api import responses
+from core import config, crud, geometry, stream
+from core.database import get_routes_db
+from core.excpetions import ServerBusyException
+from core.ingest import ingest_queue
+from core.offload import compute_pool
+from core.schemas import (
+    Route,
+    RouteQuery,
+    WayPoint,
+    WayPointBatch,
+    LongestPaths,
+    RouteIds,
+    Segments,
+)
 
 router = APIRouter(
     prefix="/route",
@@ -12,14 +33,56 @@ router = APIRouter(
 )
 
 
+@router.get("/search/", response_model=RouteIds)
+async def search_routes(
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lon: Optional[float] = Query(None, ge=-180, le=180),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lon: Optional[float] = Query(None, ge=-180, le=180),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: Optional[float] = Query(None, gt=0, le=100),
+):
+    """
+    Routes passing through a bounding box (min_lon > max_lon crosses the
+    antimeridian), or within radius_km of the point (lat, lon)
+    """
+    box = (min_lat, min_lon, max_lat, max_lon)
+    if None not in box:
+        route_ids = await run_in_threadpool(crud.search_routes_in_box, *box)
+    elif None not in (lat, lon, radius_km):
+        route_ids = await run_in_threadpool(
+            crud.search_routes_near, lat, lon, radius_km
+        )
+    else:
+        raise ValueError(
+            "Pass min_lat, min_lon, max_lat and max_lon, or lat, lon and radius_km!"
+        )
+    return {"route_ids": route_ids}
+
+
 @router.post("/", status_code=201)
-def create_route(route: Route):
+async def create_route(route: Route):
     crud.create_route(route_id=route.route_id)
     return {"message": "success"}
 
 
 @router.post("/{route_id}/way_point/", status_code=201)
-def add_way_point(route_id: UUID, way_point: WayPoint):
+async def add_way_point(route_id: UUID, way_point: WayPoint, response: Response):
+    """
+    With the ingest queue, 202 once the way point is queued,
+    or 201 once it is appended with INGEST_QUEUE_SYNC_ACK
+    """
+    if ingest_queue.enabled:
+        future = ingest_queue.put(route_id, way_point.lat, way_point.lon)
+        if future is None:
+            response.status_code = 202
+            return {"message": "accepted"}
+        error = await future
+        if error is not None:
+            raise error
+        return {"message": "success"}
+
     crud.add_way_point_to_route(
         route_id=route_id,
         lat=way_point.lat,
@@ -28,14 +91,218 @@ def add_way_point(route_id: UUID, way_point: WayPoint):
     return {"message": "success"}
 
 
+# The router prefix is not applied to websocket routes
+@router.websocket(router.prefix + "/{route_id}/way_points/stream/")
+async def stream_way_points(
+    websocket: WebSocket,
+    route_id: UUID,
+    ack_window: int = Query(config.STREAM_ACK_WINDOW, ge=1),
+):
+    """
+    Way points of a route pushed continuously, see core.stream
+    """
+    await websocket.accept()
+    received = appended = frames = 0
+    while True:
+        route = await run_in_threadpool(get_routes_db().get, route_id)
+        if not route:
+            await close_stream(websocket, 1008, "Route does not already exist!")
+            return
+        elif route.created != datetime.date.today():
+            await close_stream(websocket, 1008, "This route is already closed!")
+            return
+
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        try:
+            way_points = stream.decode_frame(
+                message["bytes"] if message.get("text") is None else message["text"]
+            )
+        except ValueError as exc:
+            await close_stream(websocket, 1003, *exc.args)
+            return
+
+        if way_points:
+            errors = await run_in_threadpool(
+                crud.add_way_points_to_routes,
+                [(route_id, lat, lon) for lat, lon in way_points],
+            )
+            received += len(way_points)
+            appended += errors.count(None)
+            frames += 1
+        if not way_points or frames % ack_window == 0:
+            await websocket.send_json({"received": received, "appended": appended})
+
+
+async def close_stream(websocket: WebSocket, code: int, *message: str):
+    await websocket.send_json({"message": message})
+    await websocket.close(code=code)
+
+
+@router.post("/way_points/", status_code=201)
+async def add_way_points(batch: WayPointBatch):
+    """
+    Up to MAX_BATCH_WAY_POINTS way points of any routes, appended off the
+    event loop
+    """
+    errors = await run_in_threadpool(
+        crud.add_way_points_to_routes,
+        [
+            (way_point.route_id, way_point.lat, way_point.lon)
+            for way_point in batch.way_points
+        ],
+    )
+    return {
+        "results": [
+            (
+                {"status": 201, "message": "success"}
+                if error is None
+                else {"status": 422, "message": error.args}
+            )
+            for error in errors
+        ]
+    }
+
+
 @router.get("/{route_id}/length/")
-def calculate_length(route_id: UUID):
-    route = get_calculated_route_data(route_id=route_id)
-    length_km = route.length_km
-    return {"km": length_km}
+async def calculate_length(request: Request, route_id: UUID, live: bool = False):
+    route = get_routes_db().get(route_id)
+    cached = responses.cached_response(route, "length", request)
+    if cached is not None:
+        return cached
+
+    await compute_pool.prepare_route(route_id)
+    length_km = crud.get_route_length_km(route_id=route_id, live=live)
+    return responses.route_response(route, "length", {"km": length_km})
 
 
 @router.get("/{route_id}/longest_paths/", response_model=LongestPaths)
-def calculate_longest_paths(route_id: UUID):
-    route = get_calculated_route_data(route_id=route_id)
-    return {"longest_paths": route.longest_paths}
+async def calculate_longest_paths(request: Request, route_id: UUID, live: bool = False):
+    route = get_routes_db().get(route_id)
+    cached = responses.cached_response(route, "longest_paths", request)
+    if cached is not None:
+        return cached
+
+    if not live and crud.longest_paths_prunable(route):
+        # Bounds of all paths are computed off the event loop
+        longest_paths = await compute_pool.find_longest_paths(route)
+    else:
+        await compute_pool.prepare_route(route_id)
+        longest_paths = crud.get_route_longest_paths(route_id=route_id, live=live)
+    return responses.route_response(
+        route, "longest_paths", {"longest_paths": longest_paths}
+    )
+
+
+@router.get("/{route_id}/segments/", response_model=Segments)
+async def get_segments(
+    route_id: UUID,
+    top: Optional[int] = Query(None, ge=1),
+    min_km: Optional[Decimal] = Query(None, ge=0),
+    offset: int = Query(0, ge=0),
+):
+    """
+    Paths of a closed route from the longest down: the `top` longest,
+    those of at least `min_km`, or the `top` longest of those. Pages hold
+    up to SEGMENTS_PAGE_SIZE paths, the next one starts at `next_offset`.
+    """
+    await compute_pool.prepare_route(route_id)
+    # One more path tells whether there is a next page
+    segments = await run_in_threadpool(
+        crud.get_route_segments,
+        route_id=route_id,
+        top=top,
+        min_km=min_km,
+        offset=offset,
+        limit=config.SEGMENTS_PAGE_SIZE + 1,
+    )
+    next_offset = None
+    if len(segments) > config.SEGMENTS_PAGE_SIZE:
+        segments = segments[: config.SEGMENTS_PAGE_SIZE]
+        next_offset = offset + len(segments)
+    return {"segments": segments, "next_offset": next_offset}
+
+
+@router.get(
+    "/{route_id}/geometry/",
+    responses={
+        200: {"content": {media_type: {} for media_type in geometry.MEDIA_TYPES}},
+        406: {"description": "Not acceptable"},
+    },
+)
+async def get_geometry(
+    request: Request,
+    route_id: UUID,
+    precision: Optional[int] = Query(None, ge=0, le=geometry.MAX_PRECISION),
+):
+    """
+    Way points of a route as an encoded polyline (the default) or in the
+    packed binary format, see core.geometry. Coordinates are rounded to
+    `precision` decimal places, 5 for polylines and 7 for packed.
+    """
+    media_type = geometry.negotiate(request.headers.get("accept"))
+    if media_type is None:
+        return JSONResponse(
+            status_code=406,
+            content={"message": [f"Accept one of {', '.join(geometry.MEDIA_TYPES)}!"]},
+        )
+    if precision is None:
+        precision = geometry.DEFAULT_PRECISION[media_type]
+
+    count, chunks = crud.get_route_coordinates(
+        route_id=route_id, chunk_size=geometry.CHUNK_WAY_POINTS
+    )
+    return StreamingResponse(
+        geometry.encode(media_type, chunks, count, precision),
+        media_type=media_type,
+        headers={"Vary": "Accept"},
+    )
+
+
+@router.post("/query/")
+async def query_routes(query: RouteQuery):
+    """
+    Length and/or longest paths of many closed routes, streamed as
+    one JSON object per line in the order of `route_ids`
+    """
+
+    async def lines():
+        route_ids = query.route_ids
+        for start in range(0, len(route_ids), crud.QUERY_CHUNK_SIZE):
+            chunk = route_ids[start : start + crud.QUERY_CHUNK_SIZE]
+            uncalculated = await run_in_threadpool(crud.uncalculated_routes, chunk)
+            busy, error = set(), None
+            try:
+                await compute_pool.update_routes_statistics(uncalculated)
+            except ServerBusyException as exc:
+                # The response has started, so the routes the pool
+                # refused fail on their own lines
+                busy, error = {route.route_id for route in uncalculated}, exc
+            # Reading and encoding the routes of a chunk hits the store
+            yield await run_in_threadpool(query_lines, query, chunk, busy, error)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def query_lines(query: RouteQuery, chunk, busy, error) -> str:
+    results = crud.query_routes(route_id for route_id in chunk if route_id not in busy)
+    lines = []
+    for route_id in chunk:
+        result = error if route_id in busy else next(results)[1]
+        item = query_item(query, route_id, result)
+        lines.append(json.dumps(jsonable_encoder(item)) + "\n")
+    return "".join(lines)
+
+
+def query_item(query: RouteQuery, route_id: UUID, result):
+    if isinstance(result, ServerBusyException):
+        return {"route_id": route_id, "status": 503, "message": result.args}
+    if isinstance(result, Exception):
+        return {"route_id": route_id, "status": 422, "message": result.args}
+    item = {"route_id": route_id, "status": 200}
+    if query.length:
+        item["km"] = result.length_km
+    if query.longest_paths:
+        item["longest_paths"] = result.longest_paths
+    return item
@@ -0,0 +1,62 @@
+"""
+Offline calculation of way point files with core.batch: way points per
+second in this process and on a process pool, and the peak memory of this
+process as the file grows, which stays flat as routes are streamed.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_batch
+"""
+import os
+import resource
+import tempfile
+import time
+import uuid
+
+from benchmarks.traces import generate_traces
+from core import batch
+
+POINTS = 1000
+ROUTES = (250, 1000, 4000)
+
+
+def write_file(path, routes):
+    traces = generate_traces(50, POINTS)
+    with open(path, "w") as file:
+        file.write("route_id,lat,lon\n")
+        for index in range(routes):
+            route_id = uuid.UUID(int=index)
+            lats, lons = traces[index % len(traces)]
+            file.writelines(
+                f"{route_id},{lat!r},{lon!r}\n"
+                for lat, lon in zip(lats.tolist(), lons.tolist())
+            )
+
+
+def run(path, workers):
+    start = time.perf_counter()
+    with open(path, newline="") as input_file, open(os.devnull, "w") as output_file:
+        summary = batch.calculate_file(input_file, output_file, "csv", workers)
+    return summary.way_points / (time.perf_counter() - start)
+
+
+def main():
+    workers = os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "way_points.csv")
+        for routes in ROUTES:
+            write_file(path, routes)
+            pooled = run(path, workers)
+            # Kilobytes on Linux
+            peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            line = (
+                f"{routes * POINTS:>8} way points: {pooled:8.0f}/s"
+                f" on {workers} workers, peak {peak_mb:6.1f} MB"
+            )
+            if routes == ROUTES[0]:
+                line += f", {run(path, 0):8.0f}/s in process"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
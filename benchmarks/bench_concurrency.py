@@ -0,0 +1,94 @@
+"""
+Throughput and lock contention of multithreaded ingestion with live reads,
+with one lock for all routes against striped per-route locks.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_concurrency
+"""
+import random
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from core import crud
+from core.database import RouteLocks, reset_routes_db
+
+ROUTES = 256
+OPERATIONS_PER_THREAD = 2000
+READ_SHARE = 0.2
+
+
+class CountingRouteLocks(RouteLocks):
+    def __init__(self, stripes):
+        super().__init__(stripes)
+        self.acquired = 0
+        self.contended = 0
+
+    def __call__(self, route_id):
+        return _CountingLock(self, super().__call__(route_id))
+
+
+class _CountingLock:
+    def __init__(self, locks, lock):
+        self._locks = locks
+        self._lock = lock
+
+    def __enter__(self):
+        self._locks.acquired += 1
+        if not self._lock.acquire(blocking=False):
+            self._locks.contended += 1
+            self._lock.acquire()
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+
+
+def worker(seed, route_ids, barrier):
+    rng = random.Random(seed)
+    barrier.wait()
+    for _ in range(OPERATIONS_PER_THREAD):
+        route_id = rng.choice(route_ids)
+        if rng.random() < READ_SHARE:
+            crud.get_route_length_km(route_id, live=True)
+        else:
+            lat = Decimal(rng.randint(-9000, 9000)).scaleb(-2)
+            lon = Decimal(rng.randint(-18000, 18000)).scaleb(-2)
+            crud.add_way_point_to_route(route_id, lat, lon)
+
+
+def run(threads, stripes):
+    reset_routes_db()
+    route_locks = CountingRouteLocks(stripes)
+    crud.route_lock = route_locks
+    rng = random.Random(0)
+    route_ids = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(ROUTES)]
+    for route_id in route_ids:
+        crud.create_route(route_id)
+
+    barrier = threading.Barrier(threads + 1)
+    workers = [
+        threading.Thread(target=worker, args=(seed, route_ids, barrier))
+        for seed in range(threads)
+    ]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    throughput = threads * OPERATIONS_PER_THREAD / (time.perf_counter() - start)
+    return throughput, route_locks.contended / route_locks.acquired
+
+
+def main():
+    print("threads stripes   ops/s  contended")
+    for threads in (8, 16, 32):
+        for stripes in (1, 64):
+            throughput, contended = run(threads, stripes)
+            print(f"{threads:7} {stripes:7} {throughput:7.0f} {contended:10.2%}")
+
+
+if __name__ == "__main__":
+    main()
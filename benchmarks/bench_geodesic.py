@@ -0,0 +1,42 @@
+"""
+Compare the vectorized geodesic engine with one geopy call per segment.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_geodesic
+"""
+import time
+
+import numpy as np
+from geopy.distance import geodesic
+
+from core.geodesic import geodesic_lengths_km
+
+WAY_POINTS = 100_000
+
+
+def main():
+    rng = np.random.default_rng(0)
+    lats = 52.2296756 + np.cumsum(rng.normal(0, 0.0005, WAY_POINTS))
+    lons = 21.0122287 + np.cumsum(rng.normal(0, 0.0005, WAY_POINTS))
+    coordinates = list(zip(lats.tolist(), lons.tolist()))
+
+    start = time.perf_counter()
+    expected = [
+        geodesic(coordinates[i], coordinates[i + 1]).km for i in range(WAY_POINTS - 1)
+    ]
+    scalar = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lengths_km = geodesic_lengths_km(lats, lons)
+    vectorized = time.perf_counter() - start
+
+    error = np.max(np.abs(lengths_km - np.array(expected)))
+    print(f"     geopy: {scalar:8.3f} s")
+    print(f"vectorized: {vectorized:8.3f} s")
+    print(f"   speedup: {scalar / vectorized:8.1f}x")
+    print(f" max error: {error:.3e} km")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+GET /route/{route_id}/geometry/ of a 100k way point route: response size
+and time of the encoded polyline and packed formats, against a JSON list
+of {"lat", "lon"} objects built from the route's way points.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_geometry
+"""
+import json
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+
+from benchmarks.traces import generate_trace
+from core import crud, geometry
+from core.database import get_routes_db, reset_routes_db
+from main import app
+
+client = TestClient(app)
+
+WAY_POINTS = 100_000
+REPEAT = 5
+
+
+def best_of(function):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    reset_routes_db()
+    route_id = uuid.uuid4()
+    crud.create_route(route_id)
+    lats, lons = generate_trace(WAY_POINTS)
+    get_routes_db().append_way_points(
+        get_routes_db().get(route_id), list(zip(lats.tolist(), lons.tolist()))
+    )
+    url = f"/route/{route_id}/geometry/"
+
+    def as_json():
+        route = get_routes_db().get(route_id)
+        return json.dumps(
+            [{"lat": lat, "lon": lon} for lat, lon in zip(route.lats, route.lons)]
+        ).encode()
+
+    print("format        bytes    ms")
+    seconds, body = best_of(as_json)
+    print(f"{'json':<10} {len(body):>8} {seconds * 1000:>5.1f}")
+    for media_type in geometry.MEDIA_TYPES:
+        seconds, response = best_of(
+            lambda: client.get(url, headers={"Accept": media_type})
+        )
+        name = "polyline" if media_type == geometry.POLYLINE else "packed"
+        print(f"{name:<10} {len(response.content):>8} {seconds * 1000:>5.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Compare way point ingestion throughput of the single and the batch endpoint.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_ingest
+"""
+
+import random
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+
+from core.database import reset_routes_db
+from main import app
+
+client = TestClient(app)
+
+WAY_POINTS = 2000
+BATCH_SIZE = 500
+
+
+def random_way_points(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        (f"{rng.uniform(-90, 90):.7f}", f"{rng.uniform(-180, 180):.7f}")
+        for _ in range(count)
+    ]
+
+
+def bench_single(route_id, way_points):
+    start = time.perf_counter()
+    for lat, lon in way_points:
+        client.post(f"/route/{route_id}/way_point/", json={"lat": lat, "lon": lon})
+    return time.perf_counter() - start
+
+
+def bench_batch(route_id, way_points):
+    start = time.perf_counter()
+    for i in range(0, len(way_points), BATCH_SIZE):
+        client.post(
+            "/route/way_points/",
+            json={
+                "way_points": [
+                    {"route_id": route_id, "lat": lat, "lon": lon}
+                    for lat, lon in way_points[i : i + BATCH_SIZE]
+                ]
+            },
+        )
+    return time.perf_counter() - start
+
+
+def main():
+    way_points = random_way_points(WAY_POINTS)
+    results = {}
+    for name, bench in [("single", bench_single), ("batch", bench_batch)]:
+        reset_routes_db()
+        route_id = str(uuid.uuid4())
+        client.post("/route/", json={"route_id": route_id})
+        elapsed = bench(route_id, way_points)
+        results[name] = WAY_POINTS / elapsed
+        print(f"{name:>6}: {results[name]:10.0f} way points/s")
+    print(f"speedup: {results['batch'] / results['single']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
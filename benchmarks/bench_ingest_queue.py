@@ -0,0 +1,80 @@
+"""
+Concurrent single way point appends through the add_way_point handler:
+appended directly, queued and acknowledged at once, and queued with
+INGEST_QUEUE_SYNC_ACK. Thousands of trackers post at the same time to a
+few hundred routes; reports throughput, until every way point is
+appended, and p50/p99 latency, from a tracker's turn to its response.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_ingest_queue
+"""
+import asyncio
+import random
+import time
+import uuid
+from decimal import Decimal
+
+import numpy as np
+from fastapi import Response
+
+from api.v1 import add_way_point
+from core import crud
+from core.database import reset_routes_db
+from core.ingest import ingest_queue
+from core.schemas import WayPoint
+
+ROUTES = 256
+TRACKERS = 2000
+WAY_POINTS_PER_TRACKER = 25
+
+
+async def tracker(seed, route_ids, latencies):
+    rng = random.Random(seed)
+    route_id = rng.choice(route_ids)
+    for _ in range(WAY_POINTS_PER_TRACKER):
+        way_point = WayPoint(
+            lat=Decimal(rng.randint(-9000, 9000)).scaleb(-2),
+            lon=Decimal(rng.randint(-18000, 18000)).scaleb(-2),
+        )
+        start = time.perf_counter()
+        # Like a request, it waits for its turn on the event loop
+        await asyncio.sleep(0)
+        await add_way_point(route_id, way_point, Response())
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(enabled, sync_ack):
+    reset_routes_db()
+    rng = random.Random(0)
+    route_ids = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(ROUTES)]
+    for route_id in route_ids:
+        crud.create_route(route_id)
+
+    ingest_queue.enabled, ingest_queue.sync_ack = enabled, sync_ack
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(tracker(seed, route_ids, latencies) for seed in range(TRACKERS))
+    )
+    await ingest_queue.stop()
+    seconds = time.perf_counter() - start
+    return len(latencies) / seconds, np.percentile(latencies, [50, 99])
+
+
+def main():
+    for name, enabled, sync_ack in [
+        ("direct", False, False),
+        ("queued", True, False),
+        ("queued, sync ack", True, True),
+    ]:
+        throughput, (p50, p99) = asyncio.run(run(enabled, sync_ack))
+        print(
+            f"{name:<17} {throughput:9.0f} way points/s"
+            f"  p50 {p50 * 1000:7.3f} ms  p99 {p99 * 1000:7.3f} ms"
+        )
+    reset_routes_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Longest paths of a closed route with unmeasured paths (replayed, or
+ingested with INGEST_STATISTICS=0): pruned by great circle bounds against
+measuring every path, and the share of paths the pruning measures.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_longest_paths_pruning
+"""
+import datetime
+import time
+import uuid
+from array import array
+from unittest import mock
+
+from benchmarks.traces import generate_traces
+from core import crud
+from core.database import get_routes_db, reset_routes_db
+from core.util import calculate_pair_lengths_um
+
+POINTS = (1000, 10000, 100000)
+
+
+def load_route(lats, lons):
+    route_id = uuid.uuid4()
+    crud.create_route(route_id)
+    route = get_routes_db().get(route_id)
+    route.lats = array("d", lats)
+    route.lons = array("d", lons)
+    route.timestamps = array("q", bytes(8 * len(lats)))
+    route.created = datetime.date.today() - datetime.timedelta(days=1)
+    return route
+
+
+def main():
+    for points in POINTS:
+        ((lats, lons),) = generate_traces(1, points)
+
+        reset_routes_db()
+        route = load_route(lats, lons)
+        measured = []
+        with mock.patch.object(
+            crud,
+            "calculate_pair_lengths_um",
+            side_effect=lambda *args, **kwargs: measured.append(len(args[0]))
+            or calculate_pair_lengths_um(*args, **kwargs),
+        ):
+            start = time.perf_counter()
+            pruned = crud.get_route_longest_paths(route.route_id)
+            pruned_seconds = time.perf_counter() - start
+
+        reset_routes_db()
+        route = load_route(lats, lons)
+        with mock.patch.object(crud.config, "LONGEST_PATHS_PRUNING", False):
+            start = time.perf_counter()
+            full = crud.get_route_longest_paths(route.route_id)
+            full_seconds = time.perf_counter() - start
+
+        assert pruned == full
+        print(
+            f"{points:>7} way points: pruned {pruned_seconds * 1000:8.2f} ms"
+            f" ({sum(measured)} paths measured),"
+            f" full {full_seconds * 1000:8.2f} ms,"
+            f" {full_seconds / pruned_seconds:5.1f}x"
+        )
+    reset_routes_db()
+
+
+if __name__ == "__main__":
+    main()
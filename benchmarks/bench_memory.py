@@ -0,0 +1,85 @@
+"""
+Compare memory used per way point by the columnar Route storage
+and by a plain list of WayPoint objects.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_memory
+"""
+
+import random
+import sys
+import tracemalloc
+from decimal import Decimal
+
+from core.models import Route, WayPoint
+
+WAY_POINTS = 100_000
+
+
+def random_coordinates(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        (
+            Decimal(f"{rng.uniform(-90, 90):.7f}"),
+            Decimal(f"{rng.uniform(-180, 180):.7f}"),
+        )
+        for _ in range(count)
+    ]
+
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return (after - before) / WAY_POINTS
+
+
+def deep_size_objects(way_points):
+    return sys.getsizeof(way_points) + sum(
+        sys.getsizeof(way_point)
+        + sys.getsizeof(way_point.__dict__)
+        + sys.getsizeof(way_point.lat)
+        + sys.getsizeof(way_point.lon)
+        + sys.getsizeof(way_point.created)
+        for way_point in way_points
+    )
+
+
+def deep_size_route(route):
+    return sum(
+        sys.getsizeof(values) for values in (route.lats, route.lons, route.timestamps)
+    )
+
+
+def main():
+    # Coordinates arrive as strings, like in the request body
+    coordinates = random_coordinates(WAY_POINTS)
+
+    def build_objects():
+        return [
+            WayPoint(lat=Decimal(lat), lon=Decimal(lon)) for lat, lon in coordinates
+        ]
+
+    def build_route():
+        route = Route("e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e")
+        for lat, lon in coordinates:
+            route.append_way_point(float(lat), float(lon))
+        return route
+
+    print("            tracemalloc   getsizeof  (bytes/way point)")
+    objects = measure(build_objects), deep_size_objects(build_objects()) / WAY_POINTS
+    columnar = measure(build_route), deep_size_route(build_route()) / WAY_POINTS
+    print(f"  objects: {objects[0]:12.1f} {objects[1]:11.1f}")
+    print(f" columnar: {columnar[0]:12.1f} {columnar[1]:11.1f}")
+    print(
+        f"reduction: {objects[0] / columnar[0]:11.1f}x "
+        f"{objects[1] / columnar[1]:10.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Overhead of the metrics on the hot paths: single way point appends through
+crud and through the HTTP endpoint, with metrics enabled and disabled.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_metrics
+"""
+import time
+import uuid
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+
+from benchmarks.traces import generate_trace
+from core import config, crud
+from core.database import reset_routes_db
+from main import app
+
+client = TestClient(app)
+
+WAY_POINTS = 5000
+REPEAT = 5
+
+
+def bench_crud(lats, lons):
+    route_id = uuid.uuid4()
+    crud.create_route(route_id)
+    start = time.perf_counter()
+    for lat, lon in zip(lats, lons):
+        crud.add_way_point_to_route(route_id, lat, lon)
+    return (time.perf_counter() - start) / len(lats)
+
+
+def bench_http(lats, lons):
+    route_id = uuid.uuid4()
+    client.post("/route/", json={"route_id": str(route_id)})
+    url = f"/route/{route_id}/way_point/"
+    start = time.perf_counter()
+    for lat, lon in zip(lats, lons):
+        client.post(url, json={"lat": lat, "lon": lon})
+    return (time.perf_counter() - start) / len(lats)
+
+
+def main():
+    lats, lons = generate_trace(WAY_POINTS)
+    decimal_lats = [Decimal(repr(lat)) for lat in lats.tolist()]
+    decimal_lons = [Decimal(repr(lon)) for lon in lons.tolist()]
+    string_lats = [repr(lat) for lat in lats.tolist()]
+    string_lons = [repr(lon) for lon in lons.tolist()]
+
+    print("µs per way point     off       on  overhead")
+    for name, bench, args in [
+        ("crud", bench_crud, (decimal_lats, decimal_lons)),
+        ("http", bench_http, (string_lats[:1000], string_lons[:1000])),
+    ]:
+        timings = {}
+        for enabled in (False, True):
+            config.METRICS_ENABLED = enabled
+            reset_routes_db()
+            timings[enabled] = min(bench(*args) for _ in range(REPEAT)) * 1e6
+        overhead = timings[True] / timings[False] - 1
+        print(f"{name:>15}: {timings[False]:8.2f} {timings[True]:8.2f} {overhead:9.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Ingest latency while large closed routes are read for the first time.
+
+Runs the app with uvicorn in this process, sends single way points to an
+open route from one thread and first reads of large routes from another,
+once with path lengths measured in the compute pool and once inline on
+the event loop.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_mixed_load
+"""
+import datetime
+import random
+import statistics
+import threading
+import time
+import uuid
+
+import requests
+import uvicorn
+
+from core.database import get_routes_db, reset_routes_db
+from core.models import Route
+from core.offload import compute_pool
+from main import app
+
+PORT = 8765
+URL = f"http://127.0.0.1:{PORT}/route"
+HEAVY_ROUTES = 8
+HEAVY_WAY_POINTS = 300_000
+INGEST_REQUESTS = 2000
+
+
+def add_heavy_routes(rng):
+    yesterday = datetime.date.today() - datetime.timedelta(days=1)
+    route_ids = []
+    for _ in range(HEAVY_ROUTES):
+        route = Route(uuid.UUID(int=rng.getrandbits(128)))
+        route.created = yesterday
+        for _ in range(HEAVY_WAY_POINTS):
+            route.append_way_point(rng.uniform(-90, 90), rng.uniform(-180, 180))
+        get_routes_db()[route.route_id] = route
+        route_ids.append(route.route_id)
+    return route_ids
+
+
+def read_heavy_routes(session, route_ids):
+    for route_id in route_ids:
+        session.get(f"{URL}/{route_id}/length/")
+
+
+def ingest(session, route_id, latencies):
+    for _ in range(INGEST_REQUESTS):
+        start = time.perf_counter()
+        session.post(f"{URL}/{route_id}/way_point/", json={"lat": "1.5", "lon": "2.5"})
+        latencies.append(time.perf_counter() - start)
+
+
+def run(min_way_points):
+    reset_routes_db()
+    compute_pool.min_way_points = min_way_points
+    rng = random.Random(0)
+    heavy_route_ids = add_heavy_routes(rng)
+    route_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    requests.post(f"{URL}/", json={"route_id": route_id})
+
+    latencies = []
+    threads = [
+        threading.Thread(
+            target=read_heavy_routes, args=(requests.Session(), heavy_route_ids)
+        ),
+        threading.Thread(target=ingest, args=(requests.Session(), route_id, latencies)),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    quantiles = statistics.quantiles(latencies, n=1000)
+    return [
+        quantile * 1000
+        for quantile in (quantiles[499], quantiles[989], quantiles[998], max(latencies))
+    ]
+
+
+def main():
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=PORT, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    print("ingest latency ms      p50      p99    p99.9      max")
+    for name, min_way_points in [("inline", 10 ** 9), ("pool", 1000)]:
+        latencies = " ".join(f"{value:8.2f}" for value in run(min_way_points))
+        print(f"{name:>17}: {latencies}")
+
+    server.should_exit = True
+    thread.join()
+    compute_pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Cost of core.profiling on GET /route/{route_id}/length/?live=true of a
+route of 1000 way points: without captures, capturing the timings of
+every request as if slow, and profiling every request with cProfile or
+with stack sampling.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_profiling
+"""
+import time
+import uuid
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from benchmarks.traces import generate_traces
+from core import config, crud, profiling
+from core.database import reset_routes_db
+from main import app
+
+REQUESTS = 200
+
+
+def main():
+    client = TestClient(app)
+    reset_routes_db()
+    route_id = uuid.uuid4()
+    crud.create_route(route_id)
+    ((lats, lons),) = generate_traces(1, 1000)
+    crud.add_way_points_to_routes((route_id, lat, lon) for lat, lon in zip(lats, lons))
+
+    for name, settings in [
+        ("off", {"PROFILE_SLOW_REQUEST_SECONDS": 0}),
+        ("slow requests", {"PROFILE_SLOW_REQUEST_SECONDS": 1e-9}),
+        ("cprofile", {"PROFILE_SAMPLE_RATE": 1.0}),
+        ("sampling", {"PROFILE_SAMPLE_RATE": 1.0, "PROFILE_MODE": "sampling"}),
+    ]:
+        with mock.patch.multiple(config, **settings):
+            start = time.perf_counter()
+            for _ in range(REQUESTS):
+                client.get(f"/route/{route_id}/length/", params={"live": True})
+            seconds = time.perf_counter() - start
+        print(f"{name:<14} {seconds / REQUESTS * 1000:7.3f} ms/request")
+    profiling.captures.clear()
+    reset_routes_db()
+
+
+if __name__ == "__main__":
+    main()
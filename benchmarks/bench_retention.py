@@ -0,0 +1,62 @@
+"""
+Memory held by finalized routes before and after retention spills them,
+and the cost of loading spilled geometry back.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_retention
+"""
+import datetime
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+from benchmarks.traces import generate_traces
+from core import crud, database
+from core.database import MemoryRouteStore
+from core.retention import RouteRetention
+
+ROUTES = 200
+WAY_POINTS_PER_ROUTE = 10_000
+
+
+def main():
+    traces = generate_traces(ROUTES, WAY_POINTS_PER_ROUTE)
+    with tempfile.TemporaryDirectory() as directory:
+        tracemalloc.start()
+        routes_db = database.routes_db = MemoryRouteStore(RouteRetention(directory))
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        route_ids = []
+        for lats, lons in traces:
+            route_id = uuid.uuid4()
+            crud.create_route(route_id)
+            route = routes_db[route_id]
+            routes_db.append_way_points(route, zip(lats.tolist(), lons.tolist()))
+            crud.update_route_statistics(route)
+            route.created = yesterday
+            crud.get_calculated_route_data(route_id)
+            route_ids.append(route_id)
+        before = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        routes_db.apply_retention()
+        spill = time.perf_counter() - start
+        after = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        for route_id in route_ids:
+            routes_db[route_id].lats
+        reload = time.perf_counter() - start
+        tracemalloc.stop()
+
+    way_points = ROUTES * WAY_POINTS_PER_ROUTE
+    print(f"{ROUTES} routes of {WAY_POINTS_PER_ROUTE} way points")
+    print(f"memory before: {before / 2 ** 20:8.1f} MiB")
+    print(f"memory after:  {after / 2 ** 20:8.1f} MiB")
+    print(f"spill:  {spill / way_points * 1e9:6.1f} ns per way point")
+    print(f"reload: {reload / ROUTES * 1e3:6.2f} ms per route")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Segment cache: fleets repeating the same depot legs, where most segments
+are cache hits, against random traces, where every segment is a miss and
+the cache only adds its lookup, with the cache enabled and disabled.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_segment_cache
+"""
+import time
+from array import array
+
+from benchmarks.traces import generate_trace
+from core.cache import segment_cache
+from core.util import calculate_lengths_um
+
+ROUTES = 50
+POINTS = 2000
+LEGS = 5
+REPEAT = 3
+
+
+def depot_routes():
+    # Every route drives one of a few fixed legs
+    legs = [generate_trace(POINTS, seed=seed) for seed in range(LEGS)]
+    return [legs[i % LEGS] for i in range(ROUTES)]
+
+
+def random_routes():
+    return [generate_trace(POINTS, seed=seed) for seed in range(ROUTES)]
+
+
+def bench(routes, max_size):
+    routes = [(array("d", lats), array("d", lons)) for lats, lons in routes]
+    best = float("inf")
+    for _ in range(REPEAT):
+        segment_cache.max_size = max_size
+        segment_cache.clear()
+        start = time.perf_counter()
+        for lats, lons in routes:
+            calculate_lengths_um(lats, lons)
+        best = min(best, time.perf_counter() - start)
+    return best, segment_cache.stats()
+
+
+def main():
+    max_size = segment_cache.max_size or 65536
+    print("routes       cache off   cache on   speedup   hit rate")
+    for name, routes in [("depot", depot_routes()), ("random", random_routes())]:
+        off, _ = bench(routes, 0)
+        on, stats = bench(routes, max_size)
+        hit_rate = stats["hits"] / max(stats["hits"] + stats["misses"], 1)
+        print(
+            f"{name:<10} {off * 1000:>9.1f}ms {on * 1000:>8.1f}ms"
+            f" {off / on:>8.2f}x {hit_rate:>9.1%}"
+        )
+    segment_cache.max_size = max_size
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Spatial index over 1000 routes of 2000 way points: time to build it,
+the latency of bounding box and radius searches against checking every
+route, and its cost on a single way point append.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_spatial
+"""
+import time
+import uuid
+from array import array
+
+import numpy as np
+
+from benchmarks.traces import generate_traces
+from core import crud, spatial
+from core.database import get_routes_db, get_spatial_index, reset_routes_db
+
+ROUTES = 1000
+POINTS = 2000
+QUERIES = 100
+
+
+def load_routes(traces):
+    routes_db = get_routes_db()
+    route_ids = []
+    for lats, lons in traces:
+        route_id = uuid.uuid4()
+        crud.create_route(route_id)
+        route = routes_db.get(route_id)
+        route.lats = array("d", lats)
+        route.lons = array("d", lons)
+        route.timestamps = array("q", bytes(8 * len(lats)))
+        route_ids.append(route_id)
+    return route_ids
+
+
+def scan(passes):
+    return sorted(
+        route.route_id
+        for route in get_routes_db().values()
+        if passes(route.lats, route.lons)
+    )
+
+
+def main():
+    traces = generate_traces(ROUTES, POINTS)
+    reset_routes_db()
+    load_routes(traces)
+
+    start = time.perf_counter()
+    index = get_spatial_index()
+    print(
+        f"build {ROUTES * POINTS} way points: {time.perf_counter() - start:.2f}s,"
+        f" {len(index)} cells"
+    )
+
+    rng = np.random.default_rng(1)
+    centres = []
+    for _ in range(QUERIES):
+        lats, lons = traces[rng.integers(ROUTES)]
+        point = rng.integers(POINTS)
+        centres.append((float(lats[point]), float(lons[point])))
+
+    for name, search, passes in [
+        (
+            "box 0.05°",
+            lambda lat, lon: crud.search_routes_in_box(
+                lat - 0.025, lon - 0.025, lat + 0.025, lon + 0.025
+            ),
+            lambda lat, lon: lambda lats, lons: spatial.passes_through_box(
+                lats, lons, lat - 0.025, lon - 0.025, lat + 0.025, lon + 0.025
+            ),
+        ),
+        (
+            "radius 2km",
+            lambda lat, lon: crud.search_routes_near(lat, lon, 2),
+            lambda lat, lon: lambda lats, lons: spatial.passes_within(
+                lats, lons, lat, lon, 2
+            ),
+        ),
+    ]:
+        start = time.perf_counter()
+        results = [search(lat, lon) for lat, lon in centres]
+        indexed = (time.perf_counter() - start) / QUERIES
+        start = time.perf_counter()
+        expected = [scan(passes(lat, lon)) for lat, lon in centres[:5]]
+        scanned = (time.perf_counter() - start) / 5
+        assert results[:5] == expected
+        print(
+            f"{name:<11} indexed {indexed * 1000:7.2f} ms"
+            f"   scan {scanned * 1000:8.1f} ms"
+        )
+
+    # What add_way_point_to_route adds: the segment to the new way point
+    index = spatial.SpatialIndex(index.cell_degrees)
+    lats, lons = traces[0]
+    lats, lons = array("d", lats), array("d", lons)
+    route_id = uuid.uuid4()
+    start = time.perf_counter()
+    for point in range(1, POINTS):
+        index.add(route_id, lats[point - 1 : point + 1], lons[point - 1 : point + 1])
+    seconds = (time.perf_counter() - start) / (POINTS - 1)
+    print(f"single way point append: {seconds * 1e6:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Compare ingest and read throughput of the in-memory and the SQLite store.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_store
+"""
+import os
+import random
+import tempfile
+import time
+import uuid
+
+from core.database import MemoryRouteStore, SQLiteRouteStore
+from core.models import Route
+
+ROUTES = 200
+WAY_POINTS_PER_ROUTE = 1000
+BATCH_SIZE = 100
+READS = 20_000
+
+
+def bench(routes_db):
+    rng = random.Random(0)
+    route_ids = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(ROUTES)]
+    for route_id in route_ids:
+        routes_db[route_id] = Route(route_id)
+
+    start = time.perf_counter()
+    for _ in range(WAY_POINTS_PER_ROUTE // BATCH_SIZE):
+        for route_id in route_ids:
+            routes_db.append_way_points(
+                routes_db.get(route_id),
+                [
+                    (rng.uniform(-90, 90), rng.uniform(-180, 180))
+                    for _ in range(BATCH_SIZE)
+                ],
+            )
+    ingest = ROUTES * WAY_POINTS_PER_ROUTE / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(READS):
+        routes_db.get(rng.choice(route_ids))
+    read = READS / (time.perf_counter() - start)
+    return ingest, read
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        stores = [
+            ("memory", MemoryRouteStore()),
+            ("sqlite", SQLiteRouteStore(os.path.join(directory, "routes.sqlite3"))),
+        ]
+        print("        ingest way points/s    reads/s")
+        for name, routes_db in stores:
+            ingest, read = bench(routes_db)
+            print(f"{name:>6}: {ingest:20.0f} {read:10.0f}")
+
+
+if __name__ == "__main__":
+    main()
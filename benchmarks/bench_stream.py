@@ -0,0 +1,73 @@
+"""
+A vehicle unit sending one fix per message: a POST per way point against
+the way point stream with JSON and binary frames, through the ASGI test
+client, so request parsing and routing are counted but not the network.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_stream
+"""
+import json
+import struct
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+
+from core import crud
+from core.database import reset_routes_db
+from main import app
+
+FIXES = 5000
+ACK_WINDOW = 16
+
+
+def fixes():
+    return [(50 + index * 1e-5, 20 + index * 1e-5) for index in range(FIXES)]
+
+
+def post(client, route_id):
+    for lat, lon in fixes():
+        client.post(f"/route/{route_id}/way_point/", json={"lat": lat, "lon": lon})
+
+
+def stream(client, route_id, encode):
+    with client.websocket_connect(
+        f"/route/{route_id}/way_points/stream/?ack_window={ACK_WINDOW}"
+    ) as websocket:
+        for index, fix in enumerate(fixes(), 1):
+            data = encode(fix)
+            if isinstance(data, bytes):
+                websocket.send_bytes(data)
+            else:
+                websocket.send_text(data)
+            if index % ACK_WINDOW == 0:
+                websocket.receive_json()
+        websocket.send_text("[]")
+        assert websocket.receive_json()["appended"] == FIXES
+
+
+def main():
+    client = TestClient(app)
+    for name, send in [
+        ("POST per fix", post),
+        ("stream, JSON", lambda c, r: stream(c, r, lambda fix: json.dumps([fix]))),
+        (
+            "stream, binary",
+            lambda c, r: stream(c, r, lambda fix: struct.pack("<dd", *fix)),
+        ),
+    ]:
+        reset_routes_db()
+        route_id = uuid.uuid4()
+        crud.create_route(route_id)
+        start = time.perf_counter()
+        send(client, route_id)
+        seconds = time.perf_counter() - start
+        print(
+            f"{name:<15} {FIXES / seconds:8.0f} fixes/s {seconds / FIXES * 1e6:8.1f} µs/fix"
+        )
+    reset_routes_db()
+
+
+if __name__ == "__main__":
+    main()
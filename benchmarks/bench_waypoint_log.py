@@ -0,0 +1,64 @@
+"""
+Measure logging overhead on ingest and the time to replay the way point log,
+compared with replaying the same way points from the SQLite store.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_waypoint_log
+"""
+import os
+import random
+import tempfile
+import time
+import uuid
+
+from core.database import LoggedMemoryRouteStore, MemoryRouteStore, SQLiteRouteStore
+from core.models import Route
+from core.waypoint_log import WayPointLog
+
+ROUTES = 1000
+WAY_POINTS_PER_ROUTE = 2000
+BATCH_SIZE = 100
+
+
+def ingest(routes_db):
+    rng = random.Random(0)
+    route_ids = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(ROUTES)]
+    batch = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(BATCH_SIZE)]
+    for route_id in route_ids:
+        routes_db[route_id] = Route(route_id)
+
+    start = time.perf_counter()
+    for _ in range(WAY_POINTS_PER_ROUTE // BATCH_SIZE):
+        for route_id in route_ids:
+            routes_db.append_way_points(routes_db.get(route_id), batch)
+    return ROUTES * WAY_POINTS_PER_ROUTE / (time.perf_counter() - start)
+
+
+def main():
+    way_points = ROUTES * WAY_POINTS_PER_ROUTE
+    with tempfile.TemporaryDirectory() as directory:
+        log_dir = os.path.join(directory, "log")
+        sqlite_path = os.path.join(directory, "routes.sqlite3")
+        routes_db = LoggedMemoryRouteStore(WayPointLog(log_dir))
+        print(f"ingest memory:     {ingest(MemoryRouteStore()):12.0f} way points/s")
+        print(f"ingest memory+log: {ingest(routes_db):12.0f} way points/s")
+        routes_db.log.close()
+
+        start = time.perf_counter()
+        LoggedMemoryRouteStore(WayPointLog(log_dir))
+        replay = time.perf_counter() - start
+        print(f"replay log:    {way_points} way points in {replay:.2f}s")
+
+        sqlite_db = SQLiteRouteStore(sqlite_path)
+        ingest(sqlite_db)
+        start = time.perf_counter()
+        sqlite_db = SQLiteRouteStore(sqlite_path)
+        for route in sqlite_db.values():
+            pass
+        replay = time.perf_counter() - start
+        print(f"replay sqlite: {way_points} way points in {replay:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
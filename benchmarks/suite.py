@@ -0,0 +1,312 @@
+"""
+Benchmark suite of the hot paths, on synthetic GPS traces.
+
+Times crud ingestion and calculation, and the HTTP endpoints through the
+TestClient, over routes of PROFILES[profile] sizes. Results are written as
+JSON, and compared with a baseline of the same profile: a case slower per
+item than its baseline by more than the tolerance fails the run, and so
+does a profile without a baseline.
+
+Run from the repository root:
+
+    python -m benchmarks.suite                      # quick profile
+    python -m benchmarks.suite --profile full       # 10 to 1M points, 1 to 100k routes
+    python -m benchmarks.suite --update-baseline    # store the results as the baseline
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import uuid
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+
+from benchmarks.traces import generate_trace, generate_traces
+from core import crud
+from core.database import get_routes_db, reset_routes_db
+from core.models import Route
+from main import app
+
+DIRECTORY = os.path.dirname(__file__)
+RESULTS_PATH = os.path.join(DIRECTORY, "results.json")
+BASELINE_PATH = os.path.join(DIRECTORY, "baseline.json")
+
+# Way points per route, and numbers of routes
+PROFILES = {
+    "quick": {"points": [10, 1000, 100_000], "routes": [1, 1000]},
+    "full": {"points": [10, 1000, 100_000, 1_000_000], "routes": [1, 1000, 100_000]},
+}
+# Way points of every route in the many routes cases
+MANY_ROUTES_POINTS = 10
+# Slowdowns of cases taking less than this are noise
+MIN_REGRESSION_SECONDS = 0.001
+# Single way point calls are capped, they take 0.2 to 1.5 ms each
+MAX_ADD_WAY_POINT_CALLS = 2000
+
+client = TestClient(app)
+
+
+def new_route(closed: bool, lats=None, lons=None) -> Route:
+    route_id = uuid.uuid4()
+    crud.create_route(route_id)
+    route = get_routes_db()[route_id]
+    if closed:
+        route.created -= datetime.timedelta(days=1)
+    if lats is not None:
+        get_routes_db().append_way_points(route, zip(lats.tolist(), lons.tolist()))
+    return route
+
+
+def decimals(values):
+    return [Decimal(repr(value)) for value in values.tolist()]
+
+
+# Every case takes its size, prepares what it needs, and returns
+# (the function to time, the number of items it handles)
+
+
+def case_add_way_point_to_route(points):
+    lats, lons = generate_trace(min(points, MAX_ADD_WAY_POINT_CALLS))
+    way_points = list(zip(decimals(lats), decimals(lons)))
+
+    def run():
+        route = new_route(closed=False)
+        for lat, lon in way_points:
+            crud.add_way_point_to_route(route.route_id, lat, lon)
+
+    return run, len(way_points)
+
+
+def case_add_way_points_to_routes(points):
+    lats, lons = generate_trace(points)
+    lats, lons = decimals(lats), decimals(lons)
+
+    def run():
+        route = new_route(closed=False)
+        crud.add_way_points_to_routes(
+            (route.route_id, lat, lon) for lat, lon in zip(lats, lons)
+        )
+
+    return run, points
+
+
+def case_calculate_paths_for_route(points):
+    lats, lons = generate_trace(points)
+
+    def run():
+        route = new_route(closed=True, lats=lats, lons=lons)
+        crud.calculate_paths_for_route(route.route_id)
+
+    return run, points
+
+
+def case_calculate_route_length_and_longest_paths(points):
+    lats, lons = generate_trace(points)
+    route = new_route(closed=True, lats=lats, lons=lons)
+    crud.calculate_paths_for_route(route.route_id)
+
+    def run():
+        route.longest_paths = None
+        crud.calculate_route_length_and_longest_paths(route.route_id)
+
+    return run, points
+
+
+def case_http_add_way_point(points):
+    lats, lons = generate_trace(min(points, MAX_ADD_WAY_POINT_CALLS))
+
+    def run():
+        route = new_route(closed=False)
+        for lat, lon in zip(lats.tolist(), lons.tolist()):
+            client.post(
+                f"/route/{route.route_id}/way_point/",
+                json={"lat": repr(lat), "lon": repr(lon)},
+            )
+
+    return run, len(lats)
+
+
+def case_http_add_way_points(points):
+    lats, lons = generate_trace(points)
+
+    def run():
+        route = new_route(closed=False)
+        client.post(
+            "/route/way_points/",
+            json={
+                "way_points": [
+                    {
+                        "route_id": str(route.route_id),
+                        "lat": repr(lat),
+                        "lon": repr(lon),
+                    }
+                    for lat, lon in zip(lats.tolist(), lons.tolist())
+                ]
+            },
+        )
+
+    return run, points
+
+
+def case_http_first_length(points):
+    lats, lons = generate_trace(points)
+
+    def run():
+        route = new_route(closed=True, lats=lats, lons=lons)
+        client.get(f"/route/{route.route_id}/length/")
+
+    return run, points
+
+
+def case_http_cached_length(points):
+    lats, lons = generate_trace(points)
+    route = new_route(closed=True, lats=lats, lons=lons)
+    url = f"/route/{route.route_id}/length/"
+    client.get(url)
+
+    def run():
+        for _ in range(100):
+            client.get(url)
+
+    return run, 100
+
+
+def case_many_routes_calculate(routes):
+    traces = generate_traces(routes, MANY_ROUTES_POINTS)
+
+    def run():
+        route_ids = [
+            new_route(closed=True, lats=lats, lons=lons).route_id
+            for lats, lons in traces
+        ]
+        for route_id in route_ids:
+            crud.get_calculated_route_data(route_id)
+
+    return run, routes
+
+
+def case_http_many_routes_query(routes):
+    traces = generate_traces(routes, MANY_ROUTES_POINTS)
+
+    def run():
+        route_ids = [
+            str(new_route(closed=True, lats=lats, lons=lons).route_id)
+            for lats, lons in traces
+        ]
+        client.post("/route/query/", json={"route_ids": route_ids})
+
+    return run, routes
+
+
+POINTS_CASES = [
+    case_add_way_point_to_route,
+    case_add_way_points_to_routes,
+    case_calculate_paths_for_route,
+    case_calculate_route_length_and_longest_paths,
+    case_http_add_way_point,
+    case_http_add_way_points,
+    case_http_first_length,
+    case_http_cached_length,
+]
+ROUTES_CASES = [case_many_routes_calculate, case_http_many_routes_query]
+
+
+def time_case(case, size, repeat):
+    reset_routes_db()
+    run, items = case(size)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    # The fastest run is the one least disturbed by the rest of the machine
+    seconds = min(timings)
+    return {"items": items, "seconds": seconds, "seconds_per_item": seconds / items}
+
+
+def run_suite(profile: str, repeat: int):
+    results = {}
+    sizes = PROFILES[profile]
+    cases = [
+        (case, "points", size) for case in POINTS_CASES for size in sizes["points"]
+    ] + [(case, "routes", size) for case in ROUTES_CASES for size in sizes["routes"]]
+    for case, unit, size in cases:
+        name = f"{case.__name__[len('case_'):]}[{size} {unit}]"
+        results[name] = time_case(case, size, repeat)
+        print(
+            f"{name:60} {results[name]['seconds']:10.4f}s"
+            f" {results[name]['seconds_per_item'] * 1e6:10.2f} µs/item",
+            flush=True,
+        )
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Names of the cases slower per item than the baseline by more than tolerance
+    """
+    return [
+        name
+        for name, result in results.items()
+        if name in baseline
+        and result["seconds_per_item"]
+        > baseline[name]["seconds_per_item"] * (1 + tolerance)
+        and result["seconds"] - baseline[name]["seconds"] > MIN_REGRESSION_SECONDS
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--profile", choices=PROFILES, default="quick")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.0,
+        help="allowed slowdown per item against the baseline, 1.0 is 2x",
+    )
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    report = {
+        "profile": args.profile,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "results": run_suite(args.profile, args.repeat),
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baselines = json.load(file)
+    if args.update_baseline:
+        baselines[args.profile] = report
+        with open(args.baseline, "w") as file:
+            json.dump(baselines, file, indent=2)
+        return 0
+
+    if args.profile not in baselines:
+        print(
+            f"No {args.profile} baseline in {args.baseline},"
+            " store one with --update-baseline"
+        )
+        return 1
+    regressions = compare(
+        report["results"], baselines[args.profile]["results"], args.tolerance
+    )
+    for name in regressions:
+        print(f"Regression: {name}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
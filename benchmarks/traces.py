@@ -0,0 +1,48 @@
+"""
+Seeded generator of synthetic GPS traces.
+
+A trace is a vehicle moving from a random start: its heading drifts a
+little between fixes, its speed follows a gamma distribution with
+occasional stops, a fix comes every FIX_INTERVAL_SECONDS, and every fix
+carries a few metres of noise. Coordinates are rounded to 7 decimals,
+the precision of consumer GPS receivers.
+"""
+import math
+from typing import List, Tuple
+
+import numpy as np
+
+FIX_INTERVAL_SECONDS = 5
+STOP_PROBABILITY = 0.05
+NOISE_METRES = 3
+METRES_PER_DEGREE = 111_320
+
+
+def generate_trace(points: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (lats, lons) arrays of a trace of `points` fixes
+    """
+    rng = np.random.default_rng(seed)
+    lat = rng.uniform(-60, 60)
+    lon = rng.uniform(-180, 180)
+
+    headings = rng.uniform(0, 2 * math.pi) + np.cumsum(rng.normal(0, 0.2, points))
+    speeds = rng.gamma(4, 2.5, points) * (rng.random(points) > STOP_PROBABILITY)
+    steps = speeds * FIX_INTERVAL_SECONDS
+    steps[0] = 0
+
+    lats = lat + np.cumsum(steps * np.cos(headings)) / METRES_PER_DEGREE
+    lats += rng.normal(0, NOISE_METRES, points) / METRES_PER_DEGREE
+    lats = np.clip(lats, -89.9, 89.9)
+    lons = lon + np.cumsum(
+        steps * np.sin(headings) / (METRES_PER_DEGREE * np.cos(np.radians(lats)))
+    )
+    lons += rng.normal(0, NOISE_METRES, points) / METRES_PER_DEGREE
+    lons = (lons + 180) % 360 - 180
+    return np.round(lats, 7), np.round(lons, 7)
+
+
+def generate_traces(
+    routes: int, points: int, seed: int = 0
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    return [generate_trace(points, seed=seed * 1_000_003 + i) for i in range(routes)]
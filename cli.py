@@ -0,0 +1,72 @@
+"""
+Length and longest paths of the routes of a way point file, see core.batch.
+
+    python cli.py way_points.csv --output routes.ndjson
+"""
+import argparse
+import os
+import sys
+
+from core import batch
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Calculate the routes of a CSV or NDJSON way point file."
+    )
+    parser.add_argument(
+        "input", help="file of route_id, lat and lon way points, - for stdin"
+    )
+    parser.add_argument(
+        "-o", "--output", default="-", help="JSON lines file, stdout by default"
+    )
+    parser.add_argument(
+        "--format",
+        choices=batch.FORMATS,
+        help="input format, by default from the file extension",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="processes calculating routes, 0 calculates them in this one",
+    )
+    args = parser.parse_args(argv)
+
+    file_format = args.format
+    if file_format is None:
+        extension = os.path.splitext(args.input)[1].lower().lstrip(".")
+        file_format = "ndjson" if extension in ("ndjson", "jsonl") else "csv"
+
+    input_file = (
+        sys.stdin
+        if args.input == "-"
+        else open(args.input, newline="", encoding="utf-8")
+    )
+    output_file = (
+        sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    )
+    try:
+        summary = batch.calculate_file(
+            input_file, output_file, file_format, args.workers
+        )
+    except ValueError as exc:
+        print(*exc.args, file=sys.stderr)
+        return 1
+    finally:
+        for file in (input_file, output_file):
+            if file not in (sys.stdin, sys.stdout):
+                file.close()
+
+    for error in summary.errors:
+        print(error, file=sys.stderr)
+    print(
+        f"{summary.routes} routes, {summary.way_points} way points,"
+        f" {summary.rejected} rejected, {summary.malformed} malformed lines",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
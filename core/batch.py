@@ -0,0 +1,211 @@
+"""
+Length and longest paths of the routes of a way point file, offline.
+
+The file holds route_id, lat and lon of every way point, as CSV with a
+header or as NDJSON objects, with the way points of a route next to each
+other in order. Routes are read one at a time, grouped into tasks of
+about TASK_WAY_POINTS way points and calculated on a process pool, with
+at most PENDING_TASKS_PER_WORKER tasks per worker read ahead. Results are
+written as they come, one JSON line per route in the order of the file:
+
+    {"route_id": ..., "km": ..., "longest_paths": [...]}
+
+or {"route_id": ..., "message": [...]} for a route that cannot be
+calculated. Malformed lines, and way points of a route found again apart
+from its first ones, are skipped and reported in the BatchSummary. Lengths and longest paths are those the API returns for the
+route once closed, when its paths were measured on the first read.
+"""
+import csv
+import json
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, Any, Iterable, Iterator, List, Tuple
+from uuid import UUID
+
+from fastapi.encoders import jsonable_encoder
+
+from core import crud
+from core.models import Route, um_to_km
+from core.util import calculate_lengths_um
+
+FORMATS = ("csv", "ndjson")
+TASK_WAY_POINTS = 100000
+PENDING_TASKS_PER_WORKER = 2
+MAX_REPORTED_ERRORS = 100
+
+
+class BatchSummary:
+    def __init__(self):
+        self.routes = 0
+        self.way_points = 0
+        self.rejected = 0
+        self.malformed = 0
+        # Messages of the first MAX_REPORTED_ERRORS skipped lines
+        self.errors = []
+
+    def report(self, message: str):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+
+def read_way_points(
+    file: IO[str], file_format: str, summary: BatchSummary
+) -> Iterator[Tuple[int, Any, Any, Any]]:
+    """
+    (line number, route_id, lat, lon) of every way point of the file.
+    Malformed lines are reported and skipped.
+    """
+    if file_format == "csv":
+        reader = csv.reader(file)
+        header = next(reader, [])
+        try:
+            columns = [header.index(name) for name in ("route_id", "lat", "lon")]
+        except ValueError:
+            raise ValueError("CSV files need route_id, lat and lon columns!")
+        for row in reader:
+            try:
+                route_id, lat, lon = (row[column] for column in columns)
+            except IndexError:
+                summary.malformed += 1
+                summary.report(f"Line {reader.line_num}: missing columns!")
+                continue
+            yield reader.line_num, route_id, lat, lon
+    else:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+                route_id, lat, lon = row["route_id"], row["lat"], row["lon"]
+            except (ValueError, TypeError, KeyError):
+                summary.malformed += 1
+                summary.report(
+                    f"Line {line_number}: not a route_id, lat and lon object!"
+                )
+                continue
+            yield line_number, route_id, lat, lon
+
+
+def group_routes(
+    way_points: Iterable[Tuple[int, Any, Any, Any]], summary: BatchSummary
+) -> Iterator[Tuple[UUID, array, array]]:
+    """
+    (route_id, lats, lons) of consecutive way points of the same route.
+    Way points out of range are rejected, like by the API, and so are those
+    of a route found again after other routes. Invalid lines are reported
+    and skipped.
+    """
+    route_id = lats = lons = raw_route_id = None
+    seen = set()
+    for line_number, row_route_id, lat, lon in way_points:
+        try:
+            lat, lon = float(lat), float(lon)
+            # Route ids are parsed once per run of way points
+            row_uuid = (
+                UUID(str(row_route_id)) if row_route_id != raw_route_id else route_id
+            )
+        except (ValueError, TypeError):
+            summary.malformed += 1
+            summary.report(f"Line {line_number}: invalid route_id, lat or lon!")
+            continue
+
+        raw_route_id = row_route_id
+        if row_uuid is not route_id and row_uuid != route_id:
+            if lats is not None:
+                yield route_id, lats, lons
+            route_id = row_uuid
+            if route_id in seen:
+                # Its result line is already written
+                summary.report(
+                    f"Line {line_number}: route {route_id} is split,"
+                    " its way points must be next to each other!"
+                )
+                lats = lons = None
+            else:
+                seen.add(route_id)
+                lats, lons = array("d"), array("d")
+                summary.routes += 1
+
+        summary.way_points += 1
+        if lats is not None and -90 <= lat <= 90 and -180 <= lon <= 180:
+            lats.append(lat)
+            lons.append(lon)
+        else:
+            summary.rejected += 1
+    if lats is not None:
+        yield route_id, lats, lons
+
+
+def calculate_route(route_id: UUID, lats: array, lons: array) -> str:
+    """
+    JSON line with the length and longest paths of a route
+    """
+    if len(lats) < 2:
+        content = {
+            "route_id": route_id,
+            "message": ["Not enough way points in this route!"],
+        }
+    else:
+        route = Route(route_id=route_id)
+        route.lats, route.lons = lats, lons
+        route.timestamps = array("q", bytes(8 * len(lats)))
+        crud.apply_route_statistics(route, 0, calculate_lengths_um(lats, lons))
+        content = {
+            "route_id": route_id,
+            "km": um_to_km(route.paths_length_um),
+            "longest_paths": crud.build_longest_paths(route),
+        }
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    )
+
+
+def calculate_routes(routes: List[Tuple[UUID, array, array]]) -> List[str]:
+    return [calculate_route(*route) for route in routes]
+
+
+def _tasks(
+    routes: Iterable[Tuple[UUID, array, array]]
+) -> Iterator[List[Tuple[UUID, array, array]]]:
+    task, way_points = [], 0
+    for route in routes:
+        task.append(route)
+        way_points += len(route[1])
+        if way_points >= TASK_WAY_POINTS:
+            yield task
+            task, way_points = [], 0
+    if task:
+        yield task
+
+
+def calculate_file(
+    input_file: IO[str], output_file: IO[str], file_format: str, workers: int
+) -> BatchSummary:
+    """
+    Write a JSON line for every route of input_file to output_file,
+    calculated on `workers` processes, or in this one if 0
+    """
+    summary = BatchSummary()
+    tasks = _tasks(
+        group_routes(read_way_points(input_file, file_format, summary), summary)
+    )
+    if not workers:
+        for task in tasks:
+            output_file.writelines(line + "\n" for line in calculate_routes(task))
+        return summary
+
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for task in tasks:
+            if len(pending) >= workers * PENDING_TASKS_PER_WORKER:
+                lines = pending.popleft().result()
+                output_file.writelines(line + "\n" for line in lines)
+            pending.append(executor.submit(calculate_routes, task))
+        while pending:
+            lines = pending.popleft().result()
+            output_file.writelines(line + "\n" for line in lines)
+    return summary
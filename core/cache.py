@@ -0,0 +1,71 @@
+from collections import OrderedDict
+import threading
+from typing import Hashable, Iterable, List, Optional, Sequence, Tuple
+
+from core import config
+
+
+class LRUCache:
+    """
+    Mapping of at most max_size entries, evicting the least recently used
+    one first. Lookups count hits and misses. A max_size of 0 disables it.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_many(self, keys: Sequence[Hashable]) -> List[Optional[object]]:
+        """
+        Cached value of every key, None for the missing ones
+        """
+        entries = self._entries
+        with self._lock:
+            values = list(map(entries.get, keys))
+            misses = values.count(None)
+            if misses < len(values):
+                for key, value in zip(keys, values):
+                    if value is not None:
+                        entries.move_to_end(key)
+            self.hits += len(values) - misses
+            self.misses += misses
+        return values
+
+    def put_many(self, items: Iterable[Tuple[Hashable, object]]):
+        if not self.max_size:
+            return
+        entries = self._entries
+        with self._lock:
+            entries.update(items)
+            while len(entries) > self.max_size:
+                entries.popitem(last=False)
+
+    def get(self, key: Hashable) -> Optional[object]:
+        return self.get_many([key])[0]
+
+    def put(self, key: Hashable, value: object):
+        self.put_many([(key, value)])
+
+    def stats(self):
+        return {
+            "size": len(self),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Segment lengths in micrometres by (lat1, lon1, lat2, lon2), see core.util
+segment_cache = LRUCache(config.SEGMENT_CACHE_SIZE)
@@ -0,0 +1,89 @@
+import os
+
+
+def _bool(name: str, default: bool) -> bool:
+    return os.environ.get(name, str(int(default))).lower() in ("1", "true", "yes")
+
+
+# Route store backend, "memory" or "sqlite"
+ROUTE_STORE = os.environ.get("ROUTE_STORE", "memory")
+ROUTE_STORE_PATH = os.environ.get("ROUTE_STORE_PATH", "routes.sqlite3")
+
+# Number of locks shared by the routes, see database.RouteLocks
+ROUTE_LOCK_STRIPES = int(os.environ.get("ROUTE_LOCK_STRIPES", 64))
+
+# Append-only way point log making the memory store durable, off when empty
+WAYPOINT_LOG_DIR = os.environ.get("WAYPOINT_LOG_DIR", "")
+WAYPOINT_LOG_SEGMENT_BYTES = int(
+    os.environ.get("WAYPOINT_LOG_SEGMENT_BYTES", 64 * 1024 * 1024)
+)
+WAYPOINT_LOG_FLUSH_RECORDS = int(os.environ.get("WAYPOINT_LOG_FLUSH_RECORDS", 1024))
+WAYPOINT_LOG_FLUSH_INTERVAL_SECONDS = float(
+    os.environ.get("WAYPOINT_LOG_FLUSH_INTERVAL_SECONDS", 0.05)
+)
+
+# Retention of routes in the memory store, applied by the finalizer and off
+# when RETENTION_SPILL_DIR is empty: geometry of finalized routes is spilled
+# there, routes older than RETENTION_TTL_DAYS are deleted and the least
+# recently used ones unloaded over RETENTION_MEMORY_BUDGET_BYTES (0 is off)
+RETENTION_SPILL_DIR = os.environ.get("RETENTION_SPILL_DIR", "")
+RETENTION_TTL_DAYS = int(os.environ.get("RETENTION_TTL_DAYS", 0))
+RETENTION_MEMORY_BUDGET_BYTES = int(os.environ.get("RETENTION_MEMORY_BUDGET_BYTES", 0))
+
+# Background finalization of routes closed at the day rollover
+FINALIZER_ENABLED = _bool("FINALIZER_ENABLED", False)
+FINALIZER_WORKERS = int(os.environ.get("FINALIZER_WORKERS", os.cpu_count() or 1))
+FINALIZER_INTERVAL_SECONDS = float(os.environ.get("FINALIZER_INTERVAL_SECONDS", 300))
+
+# Measure paths as way points arrive. Off, they are measured on the first
+# read, and longest paths alone can prune paths too short to matter.
+INGEST_STATISTICS = _bool("INGEST_STATISTICS", True)
+LONGEST_PATHS_PRUNING = _bool("LONGEST_PATHS_PRUNING", True)
+
+# Queue single way point appends and append them in batches, see core.ingest.
+# A batch is appended at INGEST_QUEUE_FLUSH_SIZE way points or once the
+# oldest has waited INGEST_QUEUE_FLUSH_SECONDS. Past INGEST_QUEUE_MAX_SIZE
+# queued way points requests are refused with 429. With
+# INGEST_QUEUE_SYNC_ACK, requests wait for their way point to be appended.
+INGEST_QUEUE_ENABLED = _bool("INGEST_QUEUE_ENABLED", False)
+INGEST_QUEUE_MAX_SIZE = int(os.environ.get("INGEST_QUEUE_MAX_SIZE", 100000))
+INGEST_QUEUE_FLUSH_SIZE = int(os.environ.get("INGEST_QUEUE_FLUSH_SIZE", 1000))
+INGEST_QUEUE_FLUSH_SECONDS = float(os.environ.get("INGEST_QUEUE_FLUSH_SECONDS", 0.005))
+INGEST_QUEUE_SYNC_ACK = _bool("INGEST_QUEUE_SYNC_ACK", False)
+
+# Way points of a POST /route/way_points/ batch or of a stream frame, at most
+MAX_BATCH_WAY_POINTS = int(os.environ.get("MAX_BATCH_WAY_POINTS", 10000))
+
+# Paths of a GET /route/{route_id}/segments/ page, at most
+SEGMENTS_PAGE_SIZE = int(os.environ.get("SEGMENTS_PAGE_SIZE", 1000))
+
+# Frames of a way point stream answered by one acknowledgement, see core.stream
+STREAM_ACK_WINDOW = int(os.environ.get("STREAM_ACK_WINDOW", 16))
+
+# Side of the grid cells of the spatial index of routes, in degrees
+SPATIAL_INDEX_CELL_DEGREES = float(os.environ.get("SPATIAL_INDEX_CELL_DEGREES", 0.05))
+
+# Segment lengths memoized by their exact coordinates, about 300 bytes each.
+# Off by default: it only pays off when routes repeat the same way points.
+SEGMENT_CACHE_SIZE = int(os.environ.get("SEGMENT_CACHE_SIZE", 0))
+
+# Process pool computing path lengths for requests, with a bounded queue.
+# Fewer pending way points than COMPUTE_MIN_WAY_POINTS are measured inline.
+COMPUTE_WORKERS = int(os.environ.get("COMPUTE_WORKERS", os.cpu_count() or 1))
+COMPUTE_MAX_PENDING = int(os.environ.get("COMPUTE_MAX_PENDING", 64))
+COMPUTE_MIN_WAY_POINTS = int(os.environ.get("COMPUTE_MIN_WAY_POINTS", 1000))
+
+# Request and calculation timings served at /metrics
+METRICS_ENABLED = _bool("METRICS_ENABLED", True)
+
+# Profiles of single requests and timings of slow ones, see core.profiling.
+# Downloaded from /admin/profiles/, which is only served with the header
+# switched on, so it is off by default.
+PROFILE_HEADER_ENABLED = _bool("PROFILE_HEADER_ENABLED", False)
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "cprofile")
+PROFILE_SAMPLING_SECONDS = float(os.environ.get("PROFILE_SAMPLING_SECONDS", 0.001))
+PROFILE_SLOW_REQUEST_SECONDS = float(
+    os.environ.get("PROFILE_SLOW_REQUEST_SECONDS", 1.0)
+)
+PROFILE_BUFFER_SIZE = int(os.environ.get("PROFILE_BUFFER_SIZE", 32))
@@ -1,18 +1,34 @@
 import datetime
-from decimal import Decimal
+from array import array
+from itertools import islice
+from decimal import ROUND_CEILING, Decimal
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
 from uuid import UUID
 
-from core.database import get_routes_db
+import numpy as np
+
+from core import config, metrics, spatial
+from core.database import (
+    get_routes_db,
+    get_spatial_index,
+    route_lock,
+    sync_spatial_index,
+)
 from core.excpetions import RouteException
-from core.models import Route, WayPoint, Path
-from core.util import calculate_length_km
+from core.models import Route, um_to_km
+from core.geodesic import VECTORIZE_MIN_SEGMENTS, spherical_bounds_km
+from core.util import calculate_lengths_um, calculate_pair_lengths_um
+
+# Routes looked up and computed together by query_routes
+QUERY_CHUNK_SIZE = 1000
 
 
 def create_route(route_id: UUID):
     routes_db = get_routes_db()
-    if route_id in routes_db:
-        raise ValueError("Route already exists!")
-    routes_db[route_id] = Route(route_id=route_id)
+    with route_lock(route_id):
+        if route_id in routes_db:
+            raise ValueError("Route already exists!")
+        routes_db[route_id] = Route(route_id=route_id)
 
 
 def add_way_point_to_route(route_id: UUID, lat: Decimal, lon: Decimal):
@@ -25,12 +41,163 @@ def add_way_point_to_route(route_id: UUID, lat: Decimal, lon: Decimal):
     elif route.created != datetime.date.today():
         raise RouteException("This route is already closed!")
 
-    route.way_points.append(
-        WayPoint(
-            lat=lat,
-            lon=lon,
+    with route_lock(route.route_id):
+        start = route.way_point_count
+        get_routes_db().append_way_points(route, [(float(lat), float(lon))])
+        index_way_points(route, start)
+        if config.INGEST_STATISTICS:
+            update_route_statistics(route)
+
+
+def add_way_points_to_routes(
+    way_points: Iterable[Tuple[UUID, Decimal, Decimal]],
+) -> List[Optional[Exception]]:
+    """
+    Append a batch of (route_id, lat, lon) way points in a single pass.
+
+    Every route is looked up and checked once per batch, and the paths
+    of all of them are measured at once. Returns one entry
+    per way point: None when it was appended, or the exception explaining
+    why it was rejected.
+    """
+    routes_db = get_routes_db()
+    today = datetime.date.today()
+    routes = {}
+    new_way_points = {}
+    results = []
+
+    for route_id, lat, lon in way_points:
+        try:
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                raise ValueError("Invalid way point coordinates!")
+
+            if route_id not in routes:
+                route = routes_db.get(route_id)
+                if not route:
+                    routes[route_id] = ValueError("Route does not already exist!")
+                elif route.created != today:
+                    routes[route_id] = RouteException("This route is already closed!")
+                else:
+                    routes[route_id] = route
+
+            route = routes[route_id]
+            if isinstance(route, Exception):
+                raise route
+
+            new_way_points.setdefault(route_id, []).append((float(lat), float(lon)))
+        except (ValueError, RouteException) as exc:
+            results.append(exc)
+        else:
+            results.append(None)
+
+    for route_id, route_way_points in new_way_points.items():
+        route = routes[route_id]
+        with route_lock(route.route_id):
+            start = route.way_point_count
+            routes_db.append_way_points(route, route_way_points)
+            index_way_points(route, start)
+    if config.INGEST_STATISTICS:
+        # Few way points per route, measured together
+        update_routes_statistics(routes[route_id] for route_id in new_way_points)
+
+    return results
+
+
+def index_way_points(route: Route, start: int):
+    """
+    Add the way points of a route from `start` on, and the path
+    leading to them, to the spatial index
+    """
+    start = max(start - 1, 0)
+    get_spatial_index().add(route.route_id, route.lats[start:], route.lons[start:])
+
+
+def update_route_statistics(route: Route):
+    """
+    Extend path lengths, their total and the longest paths of a route
+    over the way points added since the last update
+    """
+    with route_lock(route.route_id):
+        start, stop = len(route.path_lengths_um), route.way_point_count
+        if stop - start < 2:
+            return
+
+        with metrics.geodesic_seconds.time():
+            lengths_um = calculate_lengths_um(
+                route.lats[start:stop], route.lons[start:stop]
+            )
+        apply_route_statistics(route, start, lengths_um)
+
+
+def update_routes_statistics(routes: Iterable[Route]):
+    """
+    Like update_route_statistics for many routes, with the pending
+    way points of all of them measured in a single vectorized call
+    """
+    pending, lats, lons = pending_routes_way_points(routes)
+    if pending:
+        with metrics.geodesic_seconds.time():
+            lengths_um = calculate_lengths_um(lats, lons)
+        apply_routes_statistics(pending, lengths_um)
+
+
+def pending_routes_way_points(routes: Iterable[Route]):
+    """
+    Way points of routes without path lengths yet, concatenated into
+    (lats, lons) arrays, and (route, start, stop) of every such route
+    """
+    pending = []
+    lats, lons = array("d"), array("d")
+    for route in routes:
+        with route_lock(route.route_id):
+            start, stop = len(route.path_lengths_um), route.way_point_count
+            if stop - start >= 2:
+                pending.append((route, start, stop))
+                lats.extend(route.lats[start:stop])
+                lons.extend(route.lons[start:stop])
+    return pending, lats, lons
+
+
+def apply_routes_statistics(pending, lengths_um: array):
+    """
+    Split lengths computed over pending_routes_way_points()
+    back into the statistics of every route
+    """
+    offset = 0
+    for route, start, stop in pending:
+        apply_route_statistics(
+            route, start, lengths_um[offset : offset + stop - start - 1]
         )
-    )
+        # Skip the path joining the last way point to the next route
+        offset += stop - start
+
+
+def apply_route_statistics(route: Route, start: int, new_lengths_um: array):
+    """
+    Merge the lengths of the paths starting at way point `start`,
+    computed elsewhere, into the statistics of a route
+    """
+    with route_lock(route.route_id):
+        if start != len(route.path_lengths_um) or not new_lengths_um:
+            return
+
+        max_length_um = max(new_lengths_um)
+        longest_path_length_um = route.longest_path_length_um
+        longest_path_indexes = route.longest_path_indexes
+        if longest_path_length_um is None or max_length_um > longest_path_length_um:
+            longest_path_length_um = max_length_um
+            longest_path_indexes = []
+        if max_length_um == longest_path_length_um:
+            longest_path_indexes = longest_path_indexes + [
+                start + index
+                for index, length_um in enumerate(new_lengths_um)
+                if length_um == max_length_um
+            ]
+
+        route.path_lengths_um.extend(new_lengths_um)
+        route.paths_length_um += sum(new_lengths_um)
+        route.longest_path_length_um = longest_path_length_um
+        route.longest_path_indexes = longest_path_indexes
 
 
 def calculate_paths_for_route(route_id: UUID):
@@ -40,24 +207,16 @@ def calculate_paths_for_route(route_id: UUID):
         raise ValueError("Route does not exist!")
     elif route.created == datetime.date.today():
         raise RouteException("This route is still open!")
-    elif len(route.way_points) < 2:
+    elif len(route.lats) < 2:
         raise ValueError("Not enough way points in this route!")
 
     # Do not recalculate paths
-    if route.paths:
+    if route.paths_calculated:
         return
 
-    route.paths = []
-    for i, start in enumerate(route.way_points[:-1]):
-        stop = route.way_points[i + 1]
-        length_km = calculate_length_km(start, stop)
-        route.paths.append(
-            Path(
-                length_km=length_km,
-                start=start,
-                stop=stop,
-            )
-        )
+    # Usually a no-op, the statistics are kept up to date on ingest
+    update_route_statistics(route)
+    route.paths_calculated = True
 
 
 def calculate_route_length_and_longest_paths(route_id: UUID):
@@ -67,26 +226,85 @@ def calculate_route_length_and_longest_paths(route_id: UUID):
         raise ValueError("Route does not exist!")
     elif route.created == datetime.date.today():
         raise RouteException("This route is still open!")
-    elif route.paths is None:
+    elif not route.paths_calculated:
         raise RouteException("You need to calculate paths first!")
 
-    paths_length_km = [path.length_km for path in route.paths]
-    route.length_km = sum(paths_length_km)
-    max_path_length_km = max(paths_length_km)
-    route.longest_paths = [
-        {
-            "km": path.length_km,
-            "start": {
-                "lat": path.start.lat,
-                "lon": path.start.lon,
-            },
-            "stop": {
-                "lat": path.stop.lat,
-                "lon": path.stop.lon,
-            },
-        }
-        for path in route.paths
-        if path.length_km == max_path_length_km
+    with metrics.longest_paths_seconds.time():
+        route.length_km = um_to_km(route.paths_length_um)
+        route.longest_paths = build_longest_paths(route)
+
+
+def build_path(route: Route, index: int, length_um: int = None):
+    path = route.path(index, length_um)
+    return {
+        "km": path.length_km,
+        "start": {
+            "lat": path.start.lat,
+            "lon": path.start.lon,
+        },
+        "stop": {
+            "lat": path.stop.lat,
+            "lon": path.stop.lon,
+        },
+    }
+
+
+def build_longest_paths(route: Route):
+    return [build_path(route, index) for index in route.longest_path_indexes]
+
+
+def build_segment_order(route: Route) -> array:
+    """
+    Path indexes sorted by length, longest first, ties by index
+    """
+    lengths_um = np.frombuffer(route.path_lengths_um, dtype=np.int64)
+    order = array("q")
+    order.frombytes(np.argsort(-lengths_um, kind="stable").astype(np.int64).tobytes())
+    return order
+
+
+def get_route_segments(
+    route_id: UUID,
+    top: Optional[int] = None,
+    min_km: Optional[Decimal] = None,
+    offset: int = 0,
+    limit: int = config.SEGMENTS_PAGE_SIZE,
+):
+    """
+    Paths of a closed route from the longest down: the `top` longest,
+    those of at least `min_km`, or the `top` longest of those, at most
+    `limit` of them from the `offset`-th on.
+    Costs O(log n + k) for k paths with the route's segment_order.
+    """
+    if top is None and min_km is None:
+        raise ValueError("Pass top or min_km!")
+
+    route = get_calculated_route_data(route_id=route_id)
+    order = route.segment_order
+    if order is None:
+        # Built on the first query, and again after a spill dropped it
+        order = route.segment_order = build_segment_order(route)
+
+    count = len(order)
+    if min_km is not None:
+        # Lengths along order only decrease, find the first one under min_km.
+        # Path lengths are whole micrometres, so a fraction of one rounds up.
+        min_length_um = int(min_km.scaleb(9).to_integral_value(ROUND_CEILING))
+        lengths_um = route.path_lengths_um
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if lengths_um[order[middle]] >= min_length_um:
+                low = middle + 1
+            else:
+                high = middle
+        count = low
+    if top is not None:
+        count = min(count, top)
+    count = min(count, offset + limit)
+
+    return [
+        {"index": index, **build_path(route, index)} for index in order[offset:count]
     ]
 
 
@@ -96,10 +314,219 @@ def get_calculated_route_data(route_id: UUID):
     if not route:
         raise ValueError("Route does not exist!")
 
-    if route.paths is None:
-        calculate_paths_for_route(route_id=route_id)
-
+    # longest_paths is published last, once it is set the route is done.
+    # Otherwise the first of concurrent readers calculates it, and the
+    # others wait for the route lock and find it calculated.
     if route.longest_paths is None:
-        calculate_route_length_and_longest_paths(route_id=route_id)
+        with route_lock(route.route_id):
+            if not route.paths_calculated:
+                calculate_paths_for_route(route_id=route_id)
+
+            if route.longest_paths is None:
+                calculate_route_length_and_longest_paths(route_id=route_id)
+
+    return route
+
+
+def get_live_route_data(route_id: UUID):
+    """
+    Like get_calculated_route_data, but an open route is returned with its
+    statistics extended over the way points added since the last query
+    """
+    route = get_routes_db().get(route_id)
+
+    if not route:
+        raise ValueError("Route does not exist!")
+    elif route.created != datetime.date.today():
+        return get_calculated_route_data(route_id=route_id)
 
+    update_route_statistics(route)
     return route
+
+
+def get_route_length_km(route_id: UUID, live: bool = False) -> Decimal:
+    if not live:
+        return get_calculated_route_data(route_id=route_id).length_km
+    return um_to_km(get_live_route_data(route_id=route_id).paths_length_um)
+
+
+def get_route_longest_paths(route_id: UUID, live: bool = False):
+    if not live:
+        route = get_routes_db().get(route_id)
+        if longest_paths_prunable(route):
+            return find_longest_paths(route)
+        return get_calculated_route_data(route_id=route_id).longest_paths
+    return build_longest_paths(get_live_route_data(route_id=route_id))
+
+
+def longest_paths_prunable(route: Optional[Route]) -> bool:
+    """
+    Whether find_longest_paths would skip measuring paths
+    of a closed route that are not measured yet
+    """
+    return (
+        config.LONGEST_PATHS_PRUNING
+        and route is not None
+        and route.longest_paths is None
+        and route.created != datetime.date.today()
+        and route.way_point_count - len(route.path_lengths_um) - 1
+        >= VECTORIZE_MIN_SEGMENTS
+    )
+
+
+def find_longest_paths(route: Route):
+    """
+    Longest paths of a closed route, the same as its calculated
+    longest_paths, without measuring every path. Paths not measured yet
+    get bounds from great circle distances, and only those whose upper
+    bound reaches the highest lower bound are measured.
+    """
+    with route_lock(route.route_id):
+        start, stop = len(route.path_lengths_um), route.way_point_count
+        lats = np.frombuffer(route.lats[start:stop], dtype=np.float64)
+        lons = np.frombuffer(route.lons[start:stop], dtype=np.float64)
+        longest_path_length_um = route.longest_path_length_um
+        longest_path_indexes = route.longest_path_indexes
+
+    lower_km, upper_km = spherical_bounds_km(lats, lons)
+    # Rounding to micrometres moves a length by up to half of one
+    threshold_km = lower_km.max() - 1e-9
+    if longest_path_length_um is not None:
+        threshold_km = max(threshold_km, longest_path_length_um / 1e9 - 1e-9)
+    candidates = np.flatnonzero(upper_km >= threshold_km)
+    # Solved the way calculate_lengths_um would for all of them
+    lengths_um = calculate_pair_lengths_um(
+        lats[candidates],
+        lons[candidates],
+        lats[candidates + 1],
+        lons[candidates + 1],
+        vectorized=len(lats) - 1 >= VECTORIZE_MIN_SEGMENTS,
+    )
+
+    # (index, length) of the longest paths, the length of measured ones is None
+    longest = []
+    max_length_um = max(lengths_um, default=None)
+    if longest_path_length_um is not None and (
+        max_length_um is None or longest_path_length_um >= max_length_um
+    ):
+        longest = [(index, None) for index in longest_path_indexes]
+    if max_length_um is not None and (
+        longest_path_length_um is None or max_length_um >= longest_path_length_um
+    ):
+        longest += [
+            (start + index, length_um)
+            for index, length_um in zip(candidates.tolist(), lengths_um)
+            if length_um == max_length_um
+        ]
+    return [build_path(route, index, length_um) for index, length_um in longest]
+
+
+def get_route_coordinates(
+    route_id: UUID, chunk_size: int
+) -> Tuple[int, Iterator[Tuple[np.ndarray, np.ndarray]]]:
+    """
+    Way point count of a route, and its (lats, lons) arrays in chunks of
+    chunk_size. Way points added after this call are not included.
+    """
+    route = get_routes_db().get(route_id)
+    if not route:
+        raise ValueError("Route does not exist!")
+    count = route.way_point_count
+
+    def chunks():
+        for start in range(0, count, chunk_size):
+            stop = min(start + chunk_size, count)
+            # Copies, so that appends can resize the route's arrays
+            with route_lock(route.route_id):
+                lats, lons = route.lats[start:stop], route.lons[start:stop]
+            lats = np.frombuffer(lats, dtype=np.float64)
+            yield lats, np.frombuffer(lons, dtype=np.float64)
+
+    return count, chunks()
+
+
+def search_routes_in_box(
+    min_lat: float, min_lon: float, max_lat: float, max_lon: float
+) -> List[UUID]:
+    """
+    Ids of the routes passing through a bounding box. A box with
+    min_lon > max_lon crosses the antimeridian.
+    """
+    if min_lat > max_lat:
+        raise ValueError("min_lat is over max_lat!")
+    boxes = spatial.split_box(min_lat, min_lon, max_lat, max_lon)
+    return _search_routes(
+        boxes,
+        lambda lats, lons: any(
+            spatial.passes_through_box(lats, lons, *box) for box in boxes
+        ),
+    )
+
+
+def search_routes_near(lat: float, lon: float, radius_km: float) -> List[UUID]:
+    """
+    Ids of the routes passing within radius_km of a point
+    """
+    return _search_routes(
+        spatial.radius_box(lat, lon, radius_km),
+        lambda lats, lons: spatial.passes_within(lats, lons, lat, lon, radius_km),
+    )
+
+
+def _search_routes(boxes, passes) -> List[UUID]:
+    index = sync_spatial_index()
+    candidates = set().union(*(index.candidates(*box) for box in boxes))
+    routes_db = get_routes_db()
+    route_ids, removed = [], []
+    for route_id in sorted(candidates):
+        with route_lock(route_id):
+            coordinates = routes_db.coordinates(route_id)
+            if coordinates is None:
+                removed.append(route_id)
+                continue
+            lats, lons = coordinates
+            lats, lons = lats[: len(lons)], lons[: len(lats)]
+        if passes(lats, lons):
+            route_ids.append(route_id)
+    # Expired since they were indexed
+    index.discard(removed)
+    return route_ids
+
+
+def uncalculated_routes(route_ids: Iterable[UUID]) -> List[Route]:
+    """
+    Existing closed routes among route_ids whose paths are not calculated yet
+    """
+    routes_db = get_routes_db()
+    today = datetime.date.today()
+    return [
+        route
+        for route in (routes_db.get(route_id) for route_id in route_ids)
+        if route and route.created != today and not route.paths_calculated
+    ]
+
+
+def query_routes(
+    route_ids: Iterable[UUID],
+) -> Iterator[Tuple[UUID, Union[Route, Exception]]]:
+    """
+    Calculated data of many closed routes, yielded in request order as
+    (route_id, route) or (route_id, the exception explaining the failure).
+
+    Routes are handled QUERY_CHUNK_SIZE at a time, and the path lengths
+    missing from the routes of a chunk are computed together.
+    """
+    route_ids = iter(route_ids)
+    while True:
+        chunk = list(islice(route_ids, QUERY_CHUNK_SIZE))
+        if not chunk:
+            return
+
+        update_routes_statistics(uncalculated_routes(chunk))
+
+        for route_id in chunk:
+            try:
+                result = get_calculated_route_data(route_id=route_id)
+            except (ValueError, RouteException) as exc:
+                result = exc
+            yield route_id, result
@@ -1,13 +1,520 @@
+import datetime
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, Optional, Tuple
+from uuid import UUID
+
+from core import config
+from core.models import Route, to_timestamp
+from core.retention import RouteRetention
+from core.spatial import SpatialIndex
+from core.waypoint_log import WayPointLog
+
+
+class RouteLocks:
+    """
+    Per-route locks striped over a fixed number of reentrant locks:
+    routes hashing to the same stripe share a lock. They guard appending
+    way points to a route and updating its statistics.
+    """
+
+    def __init__(self, stripes: int):
+        self._locks = [threading.RLock() for _ in range(stripes)]
+
+    def __call__(self, route_id) -> threading.RLock:
+        if not isinstance(route_id, UUID):
+            route_id = UUID(str(route_id))
+        return self._locks[route_id.int % len(self._locks)]
+
+
+route_lock = RouteLocks(config.ROUTE_LOCK_STRIPES)
+
+
+class RouteStore:
+    """
+    Interface of route stores. A store maps route ids to Route objects,
+    like a dict, and persists way points through append_way_points.
+    """
+
+    def get(self, route_id: UUID, default=None) -> Optional[Route]:
+        raise NotImplementedError
+
+    def __contains__(self, route_id: UUID) -> bool:
+        return self.get(route_id) is not None
+
+    def __getitem__(self, route_id: UUID) -> Route:
+        route = self.get(route_id)
+        if route is None:
+            raise KeyError(route_id)
+        return route
+
+    def __setitem__(self, route_id: UUID, route: Route):
+        raise NotImplementedError
+
+    def coordinates(self, route_id: UUID):
+        """
+        (lats, lons) arrays of a route, None if it does not exist.
+        Stores may read them without caching the route.
+        """
+        route = self.get(route_id)
+        return route.coordinates() if route is not None else None
+
+    def values(self) -> Iterable[Route]:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def way_point_count(self) -> int:
+        raise NotImplementedError
+
+    def last_way_point_id(self) -> int:
+        """
+        Id of the last way point any process wrote to a store shared
+        between processes, 0 for stores of a single process
+        """
+        return 0
+
+    def way_points_between(
+        self, first_id: int, last_id: int
+    ) -> Dict[UUID, Tuple[array, array]]:
+        """
+        (lats, lons) of the way points of each route with ids over first_id
+        up to last_id, after the way point of the route before them
+        """
+        return {}
+
+    def memory_bytes(self) -> int:
+        """
+        Estimated memory held by the routes of this process
+        """
+        raise NotImplementedError
+
+    def unfinalized_routes(self) -> Iterable[Route]:
+        """
+        Closed routes of at least two way points whose
+        longest paths are not calculated yet
+        """
+        today = datetime.date.today()
+        return [
+            route
+            for route in list(self.values())
+            if route.created != today
+            and route.longest_paths is None
+            and len(route.lats) >= 2
+        ]
+
+    def set_finalized(self, route: Route):
+        """
+        Record that a route is calculated, for stores that
+        cannot tell from the Route objects of this process
+        """
+
+    def append_way_points(
+        self,
+        route: Route,
+        way_points: Iterable[Tuple[float, float]],
+        created: datetime.datetime = None,
+    ):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def compact(self):
+        """
+        Reclaim storage held for finalized routes, if the store can
+        """
+
+    def apply_retention(self):
+        """
+        Spill, unload or expire finalized routes, if the store can
+        """
+
+
+class MemoryRouteStore(dict, RouteStore):
+    """
+    Routes live in a dict of the current process only. With a
+    RouteRetention, routes it unloaded are read back on lookup.
+    """
+
+    def __init__(self, retention: RouteRetention = None):
+        super().__init__()
+        self.retention = retention
+
+    def get(self, route_id, default=None):
+        route = dict.get(self, route_id)
+        if route is None:
+            if self.retention is None:
+                return default
+            route = self.retention.load(route_id)
+            if route is None:
+                return default
+            route = dict.setdefault(self, route_id, route)
+        route.last_access = time.monotonic()
+        return route
+
+    def __contains__(self, route_id):
+        return self.get(route_id) is not None
+
+    def __getitem__(self, route_id):
+        return RouteStore.__getitem__(self, route_id)
+
+    def coordinates(self, route_id):
+        route = dict.get(self, route_id)
+        if route is None:
+            # Unloaded routes are read from their file and stay unloaded
+            if self.retention is None:
+                return None
+            return self.retention.coordinates(route_id)
+        return route.coordinates()
+
+    def apply_retention(self):
+        if self.retention is not None:
+            self.retention.apply(self)
+
+    def clear(self):
+        if self.retention is not None:
+            self.retention.clear()
+        super().clear()
+
+    def append_way_points(self, route, way_points, created=None):
+        created = created or datetime.datetime.now()
+        for lat, lon in way_points:
+            route.append_way_point(lat, lon, created)
+
+    def way_point_count(self):
+        return sum(route.way_point_count for route in list(self.values()))
+
+    def memory_bytes(self):
+        return sum(route.memory_bytes() for route in list(self.values()))
+
+
+class LoggedMemoryRouteStore(MemoryRouteStore):
+    """
+    In-memory routes made durable by a WayPointLog,
+    which is replayed when the store is created. With a RouteRetention,
+    routes spilled to their file are left out of the log's snapshots and
+    of the replay, and read back from their file on lookup like unloaded
+    routes. Expired routes are left out as well.
+    """
+
+    def __init__(self, log: WayPointLog, retention: RouteRetention = None):
+        super().__init__(retention)
+        self.log = log
+        routes = {}
+        log.replay(routes, retention.retains if retention is not None else None)
+        self.update(routes)
+
+    def __setitem__(self, route_id, route):
+        self.log.log_route(route)
+        super().__setitem__(route_id, route)
+
+    def append_way_points(self, route, way_points, created=None):
+        created = created or datetime.datetime.now()
+        way_points = list(way_points)
+        self.log.log_way_points(route, way_points, created)
+        super().append_way_points(route, way_points, created)
+
+    def compact(self):
+        # Routes of this process only, without reading unloaded ones back
+        self.log.compact(
+            {
+                route_id: route
+                for route_id, route in list(dict.items(self))
+                if route.geometry_loader is None
+            }
+        )
+
+    def clear(self):
+        self.log.clear()
+        super().clear()
+
+
+class SQLiteRouteStore(RouteStore):
+    """
+    Routes live in a SQLite database in WAL mode, so several worker
+    processes can share them. Every process keeps its own Route objects
+    as a cache and only reads the way points added since its last sync.
+    Way points are inserted in one executemany() per batch, and sqlite3
+    keeps the statements used by the lookups below prepared per connection.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS routes (
+            route_id TEXT PRIMARY KEY,
+            created TEXT NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS way_points (
+            id INTEGER PRIMARY KEY,
+            route_id TEXT NOT NULL,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            created INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS way_points_route_id
+            ON way_points (route_id, id);
+        CREATE TABLE IF NOT EXISTS finalized_routes (
+            route_id TEXT PRIMARY KEY
+        ) WITHOUT ROWID;
+    """
+    SELECT_ROUTE = "SELECT created FROM routes WHERE route_id = ?"
+    SELECT_ROUTE_IDS = "SELECT route_id FROM routes"
+    COUNT_ROUTES = "SELECT COUNT(*) FROM routes"
+    # Way points are only deleted all at once, so the last id is their count
+    COUNT_WAY_POINTS = "SELECT COALESCE(MAX(id), 0) FROM way_points"
+    SELECT_WAY_POINTS = (
+        "SELECT id, lat, lon, created FROM way_points"
+        " WHERE route_id = ? AND id > ? ORDER BY id"
+    )
+    SELECT_WAY_POINTS_BETWEEN = (
+        "SELECT route_id, lat, lon FROM way_points"
+        " WHERE id > ? AND id <= ? ORDER BY route_id, id"
+    )
+    SELECT_PREVIOUS_WAY_POINT = (
+        "SELECT lat, lon FROM way_points"
+        " WHERE route_id = ? AND id <= ? ORDER BY id DESC LIMIT 1"
+    )
+    # Closed, with a second way point, and not finalized by any process
+    SELECT_UNFINALIZED_ROUTE_IDS = (
+        "SELECT route_id FROM routes WHERE created != ?"
+        " AND route_id NOT IN (SELECT route_id FROM finalized_routes)"
+        " AND EXISTS (SELECT 1 FROM way_points"
+        " WHERE way_points.route_id = routes.route_id LIMIT 1 OFFSET 1)"
+    )
+    INSERT_FINALIZED_ROUTE = (
+        "INSERT OR IGNORE INTO finalized_routes (route_id) VALUES (?)"
+    )
+    INSERT_ROUTE = "INSERT INTO routes (route_id, created) VALUES (?, ?)"
+    INSERT_WAY_POINT = (
+        "INSERT INTO way_points (route_id, lat, lon, created) VALUES (?, ?, ?, ?)"
+    )
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._last_ids = {}
+        self._complete = set()
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, isolation_level=None, cached_statements=32
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, route_id, default=None):
+        key = str(route_id)
+        with self._lock:
+            route = self._routes.get(key)
+            if route is None:
+                row = self._connection().execute(self.SELECT_ROUTE, (key,)).fetchone()
+                if row is None:
+                    return default
+                route = Route(route_id=UUID(key))
+                route.created = datetime.date.fromisoformat(row[0])
+                self._routes[key] = route
+                self._last_ids[key] = 0
+            self._sync(key, route)
+        return route
+
+    def _sync(self, key: str, route: Route):
+        # Another process may still add way points until the route closes,
+        # once it has been read after that it cannot change anymore
+        if key in self._complete:
+            return
+        closed = route.created != datetime.date.today()
+        rows = self._connection().execute(
+            self.SELECT_WAY_POINTS, (key, self._last_ids[key])
+        )
+        for row_id, lat, lon, created in rows:
+            route.lats.append(lat)
+            route.lons.append(lon)
+            route.timestamps.append(created)
+            self._last_ids[key] = row_id
+        if closed:
+            self._complete.add(key)
+
+    def __setitem__(self, route_id, route):
+        try:
+            self._connection().execute(
+                self.INSERT_ROUTE, (str(route_id), route.created.isoformat())
+            )
+        except sqlite3.IntegrityError:
+            raise ValueError("Route already exists!")
+
+    def values(self):
+        route_ids = [
+            row[0] for row in self._connection().execute(self.SELECT_ROUTE_IDS)
+        ]
+        return [self.get(route_id) for route_id in route_ids]
+
+    def __len__(self):
+        return self._connection().execute(self.COUNT_ROUTES).fetchone()[0]
+
+    def unfinalized_routes(self):
+        # Only those routes are read, not every route of the store
+        route_ids = [
+            row[0]
+            for row in self._connection().execute(
+                self.SELECT_UNFINALIZED_ROUTE_IDS,
+                (datetime.date.today().isoformat(),),
+            )
+        ]
+        routes = (self.get(route_id) for route_id in route_ids)
+        return [route for route in routes if route is not None]
+
+    def set_finalized(self, route):
+        self._connection().execute(self.INSERT_FINALIZED_ROUTE, (str(route.route_id),))
+
+    def way_point_count(self):
+        return self._connection().execute(self.COUNT_WAY_POINTS).fetchone()[0]
+
+    def last_way_point_id(self):
+        return self.way_point_count()
+
+    def way_points_between(self, first_id, last_id):
+        connection = self._connection()
+        way_points = {}
+        for key, lat, lon in connection.execute(
+            self.SELECT_WAY_POINTS_BETWEEN, (first_id, last_id)
+        ):
+            coordinates = way_points.get(key)
+            if coordinates is None:
+                coordinates = way_points[key] = (array("d"), array("d"))
+                previous = connection.execute(
+                    self.SELECT_PREVIOUS_WAY_POINT, (key, first_id)
+                ).fetchone()
+                if previous is not None:
+                    coordinates[0].append(previous[0])
+                    coordinates[1].append(previous[1])
+            coordinates[0].append(lat)
+            coordinates[1].append(lon)
+        return {UUID(key): coordinates for key, coordinates in way_points.items()}
+
+    def memory_bytes(self):
+        with self._lock:
+            return sum(route.memory_bytes() for route in self._routes.values())
+
+    def append_way_points(self, route, way_points, created=None):
+        key = str(route.route_id)
+        timestamp = to_timestamp(created or datetime.datetime.now())
+        connection = self._connection()
+        connection.execute("BEGIN")
+        try:
+            connection.executemany(
+                self.INSERT_WAY_POINT,
+                ((key, lat, lon, timestamp) for lat, lon in way_points),
+            )
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        with self._lock:
+            self._sync(key, route)
+
+    def clear(self):
+        with self._lock:
+            self._connection().executescript(
+                "DELETE FROM way_points; DELETE FROM routes;"
+                " DELETE FROM finalized_routes;"
+            )
+            self._routes.clear()
+            self._last_ids.clear()
+            self._complete.clear()
+
+
+def create_route_retention() -> Optional[RouteRetention]:
+    if not config.RETENTION_SPILL_DIR:
+        return None
+    return RouteRetention(
+        config.RETENTION_SPILL_DIR,
+        ttl_days=config.RETENTION_TTL_DAYS,
+        memory_budget_bytes=config.RETENTION_MEMORY_BUDGET_BYTES,
+    )
+
+
+def create_routes_db() -> RouteStore:
+    if config.ROUTE_STORE == "sqlite":
+        return SQLiteRouteStore(config.ROUTE_STORE_PATH)
+    elif config.WAYPOINT_LOG_DIR:
+        return LoggedMemoryRouteStore(
+            WayPointLog(
+                config.WAYPOINT_LOG_DIR,
+                segment_bytes=config.WAYPOINT_LOG_SEGMENT_BYTES,
+                flush_records=config.WAYPOINT_LOG_FLUSH_RECORDS,
+                flush_interval_seconds=config.WAYPOINT_LOG_FLUSH_INTERVAL_SECONDS,
+            ),
+            create_route_retention(),
+        )
+    return MemoryRouteStore(create_route_retention())
+
+
 routes_db = None
+spatial_index = None
+# Id of the last way point of a shared store in the spatial index
+spatial_index_way_point_id = 0
+spatial_index_lock = threading.Lock()
 
 
 def get_routes_db():
     global routes_db
-    if not routes_db:
-        routes_db = {}
+    if routes_db is None:
+        routes_db = create_routes_db()
     return routes_db
 
 
+def get_spatial_index() -> SpatialIndex:
+    """
+    Spatial index of the routes of the store, built on first use
+    and then kept up to date as way points are appended
+    """
+    global spatial_index, spatial_index_way_point_id
+    if spatial_index is None:
+        # Appends wait for the build, and index their way points after it
+        with spatial_index_lock:
+            if spatial_index is None:
+                index = SpatialIndex(config.SPATIAL_INDEX_CELL_DEGREES)
+                spatial_index_way_point_id = get_routes_db().last_way_point_id()
+                for route in list(get_routes_db().values()):
+                    index.add(route.route_id, *route.coordinates())
+                spatial_index = index
+    return spatial_index
+
+
+def sync_spatial_index() -> SpatialIndex:
+    """
+    Spatial index of the routes of the store, with the way points
+    other processes added to a shared store since the last sync
+    """
+    global spatial_index_way_point_id
+    index = get_spatial_index()
+    with spatial_index_lock:
+        routes_db = get_routes_db()
+        last_id = routes_db.last_way_point_id()
+        if last_id > spatial_index_way_point_id:
+            way_points = routes_db.way_points_between(
+                spatial_index_way_point_id, last_id
+            )
+            for route_id, (lats, lons) in way_points.items():
+                index.add(route_id, lats, lons)
+            spatial_index_way_point_id = last_id
+    return index
+
+
 def reset_routes_db():
-    global routes_db
-    routes_db = {}
+    global routes_db, spatial_index, spatial_index_way_point_id
+    if routes_db is None:
+        routes_db = create_routes_db()
+    routes_db.clear()
+    spatial_index = None
+    spatial_index_way_point_id = 0
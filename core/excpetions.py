@@ -3,3 +3,15 @@ class RouteException(Exception):
     Raise when someone wants to modify routes that are closed,
     or create paths on an open route
     """
+
+
+class IngestQueueFullException(Exception):
+    """
+    Raise when more way points are queued than the ingest queue holds
+    """
+
+
+class ServerBusyException(Exception):
+    """
+    Raise when a request needs more computation than the server can queue
+    """
@@ -0,0 +1,168 @@
+import datetime
+import fcntl
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from core import config
+from core.crud import apply_route_statistics, get_calculated_route_data
+from core.database import get_routes_db
+from core.excpetions import RouteException
+from core.util import calculate_lengths_um
+
+logger = logging.getLogger(__name__)
+
+
+def seconds_until_tomorrow() -> float:
+    now = datetime.datetime.now()
+    tomorrow = datetime.datetime.combine(
+        now.date() + datetime.timedelta(days=1), datetime.time()
+    )
+    return (tomorrow - now).total_seconds()
+
+
+def finalizer_lock_path() -> Optional[str]:
+    # Worker processes sharing a SQLite store finalize its routes once
+    if config.ROUTE_STORE == "sqlite":
+        return config.ROUTE_STORE_PATH + ".finalizer.lock"
+    return None
+
+
+class RouteFinalizer:
+    """
+    Calculates paths, length and longest paths of routes closed by the day
+    rollover in a background thread, so the first read after midnight does
+    not pay for it. Path lengths still missing from a route's statistics
+    are computed on a process pool.
+
+    With a lock_path, only the finalizer holding the lock on that file
+    runs; the others take over when it is released.
+    """
+
+    def __init__(
+        self,
+        workers: int = config.FINALIZER_WORKERS,
+        interval_seconds: float = config.FINALIZER_INTERVAL_SECONDS,
+        lock_path: Optional[str] = None,
+    ):
+        self.workers = workers
+        self.interval_seconds = interval_seconds
+        self.lock_path = lock_path
+        self.runs = 0
+        self.finalized = 0
+        self.failed = 0
+        self.backlog = 0
+        self.last_run = None
+        self._executor = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock_file = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self):
+        return {
+            "running": self.running,
+            "runs": self.runs,
+            "finalized": self.finalized,
+            "failed": self.failed,
+            "backlog": self.backlog,
+            "last_run": self.last_run,
+        }
+
+    def pending_routes(self):
+        return get_routes_db().unfinalized_routes()
+
+    def run_once(self):
+        routes = self.pending_routes()
+        self.backlog = len(routes)
+        self._calculate_missing_paths(routes)
+
+        for route in routes:
+            try:
+                get_calculated_route_data(route_id=route.route_id)
+            except (ValueError, RouteException):
+                self.failed += 1
+            else:
+                get_routes_db().set_finalized(route)
+                self.finalized += 1
+            self.backlog -= 1
+
+        get_routes_db().compact()
+        get_routes_db().apply_retention()
+        self.runs += 1
+        self.last_run = datetime.datetime.now()
+
+    def _calculate_missing_paths(self, routes):
+        starts = [len(route.path_lengths_um) for route in routes]
+        missing = [
+            (route, start)
+            for route, start in zip(routes, starts)
+            if len(route.lats) - start >= 2
+        ]
+        if not missing:
+            return
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        results = self._executor.map(
+            calculate_lengths_um,
+            [route.lats[start:] for route, start in missing],
+            [route.lons[start:] for route, start in missing],
+        )
+        for (route, start), lengths_um in zip(missing, results):
+            apply_route_statistics(route, start, lengths_um)
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="route-finalizer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _acquire_lock(self) -> bool:
+        if self.lock_path is None or self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._acquire_lock():
+                    self.run_once()
+            except Exception as exc:
+                # A failed run is retried on the next one
+                logger.exception("Finalizing routes failed")
+                self.failed += 1
+                if isinstance(exc, BrokenProcessPool):
+                    self._executor = None
+            # Wake up just after midnight, when routes of the day close
+            self._stop.wait(min(self.interval_seconds, seconds_until_tomorrow() + 1))
+
+
+route_finalizer = RouteFinalizer(lock_path=finalizer_lock_path())
@@ -0,0 +1,161 @@
+"""
+Compact encodings of route geometry.
+
+Both formats store every way point as the difference from the previous
+one, in integer units of 10 ** -precision degrees, lat first. The
+differences are zigzag encoded (sign in the lowest bit) and written as
+variable-length integers, least significant group of bits first:
+
+- POLYLINE: Google's encoded polyline, 5-bit groups as printable ASCII.
+  https://developers.google.com/maps/documentation/utilities/polylinealgorithm
+- PACKED: a PACKED_HEADER with the precision and the way point count,
+  then the differences as LEB128 varints (7-bit groups).
+
+Coordinates are encoded CHUNK_WAY_POINTS at a time, with numpy, straight
+from the route's coordinate arrays.
+"""
+import struct
+from typing import Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+POLYLINE = "application/vnd.google.polyline"
+PACKED = "application/octet-stream"
+MEDIA_TYPES = (POLYLINE, PACKED)
+DEFAULT_PRECISION = {POLYLINE: 5, PACKED: 7}
+MAX_PRECISION = 9
+
+PACKED_MAGIC = b"RGEO"
+# magic, precision, way point count
+PACKED_HEADER = struct.Struct("<4sBQ")
+
+CHUNK_WAY_POINTS = 65536
+
+
+def negotiate(accept: Optional[str]) -> Optional[str]:
+    """
+    The media type to answer an Accept header with, None if none fits
+    """
+    if not accept:
+        return POLYLINE
+
+    ranges = []
+    for position, media_range in enumerate(accept.split(",")):
+        media_type, *parameters = (part.strip() for part in media_range.split(";"))
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            ranges.append((-quality, position, media_type.lower()))
+
+    for _, _, media_type in sorted(ranges):
+        if media_type in MEDIA_TYPES:
+            return media_type
+        if media_type in ("*/*", "application/*"):
+            return POLYLINE
+    return None
+
+
+def _zigzag_deltas(
+    lats: np.ndarray, lons: np.ndarray, precision: int, previous: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Zigzag encoded differences of interleaved scaled coordinates,
+    and the last scaled coordinates to continue from
+    """
+    scaled = np.empty((len(lats), 2), dtype=np.int64)
+    # Halves are rounded up, like Math.round() of the reference encoder
+    scaled[:, 0] = np.floor(np.asarray(lats) * 10 ** precision + 0.5)
+    scaled[:, 1] = np.floor(np.asarray(lons) * 10 ** precision + 0.5)
+    deltas = np.diff(scaled, axis=0, prepend=previous[np.newaxis]).ravel()
+    zigzag = (deltas << 1) ^ (deltas >> 63)
+    return zigzag.view(np.uint64), scaled[-1]
+
+
+def _varints(values: np.ndarray, bits: int, continuation: int, offset: int) -> bytes:
+    """
+    Every value in groups of `bits` bits, least significant first, all but
+    the last group of a value with the `continuation` bit, plus `offset`
+    """
+    if not len(values):
+        return b""
+    width = max(1, -(-int(values.max()).bit_length() // bits))
+    shifts = np.arange(width, dtype=np.uint64) * np.uint64(bits)
+    shifted = values[:, np.newaxis] >> shifts
+    groups = (shifted & np.uint64((1 << bits) - 1)).astype(np.uint8)
+    lengths = np.maximum((shifted != 0).sum(axis=1), 1)
+    positions = np.arange(width)
+    groups[positions < lengths[:, np.newaxis] - 1] |= continuation
+    groups += offset
+    return groups[positions < lengths[:, np.newaxis]].tobytes()
+
+
+def encode(
+    media_type: str,
+    chunks: Iterable[Tuple[np.ndarray, np.ndarray]],
+    count: int,
+    precision: int,
+) -> Iterator[bytes]:
+    """
+    Encode `count` way points given as chunks of (lats, lons) arrays
+    """
+    if media_type == PACKED:
+        yield PACKED_HEADER.pack(PACKED_MAGIC, precision, count)
+        bits, continuation, offset = 7, 0x80, 0
+    else:
+        bits, continuation, offset = 5, 0x20, 63
+
+    previous = np.zeros(2, dtype=np.int64)
+    for lats, lons in chunks:
+        if len(lats):
+            zigzag, previous = _zigzag_deltas(lats, lons, precision, previous)
+            yield _varints(zigzag, bits, continuation, offset)
+
+
+def _decode_varints(data: bytes, bits: int, continuation: int, offset: int):
+    values = []
+    value = shift = 0
+    for byte in data:
+        group = byte - offset
+        value |= (group & (continuation - 1)) << shift
+        shift += bits
+        if not group & continuation:
+            values.append((value >> 1) ^ -(value & 1))
+            value = shift = 0
+    return values
+
+
+def _coordinates(deltas, precision: int):
+    coordinates = []
+    lat = lon = 0
+    for index in range(0, len(deltas) - 1, 2):
+        lat += deltas[index]
+        lon += deltas[index + 1]
+        coordinates.append((lat / 10 ** precision, lon / 10 ** precision))
+    return coordinates
+
+
+def decode_polyline(data: bytes, precision: int = DEFAULT_PRECISION[POLYLINE]):
+    """
+    [(lat, lon), ...] of an encoded polyline
+    """
+    return _coordinates(_decode_varints(data, 5, 0x20, 63), precision)
+
+
+def decode_packed(data: bytes):
+    """
+    [(lat, lon), ...] of the PACKED format
+    """
+    magic, precision, count = PACKED_HEADER.unpack_from(data)
+    if magic != PACKED_MAGIC:
+        raise ValueError("Not a packed route geometry!")
+    deltas = _decode_varints(data[PACKED_HEADER.size :], 7, 0x80, 0)
+    coordinates = _coordinates(deltas, precision)
+    if len(coordinates) != count:
+        raise ValueError("Truncated route geometry!")
+    return coordinates
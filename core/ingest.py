@@ -0,0 +1,176 @@
+"""
+Micro-batching of single way point appends.
+
+With INGEST_QUEUE_ENABLED, POST /route/{route_id}/way_point/ puts the way
+point into ingest_queue instead of appending it. A single writer task on
+the event loop takes up to flush_size queued way points once there are
+that many, or once the oldest has waited flush_seconds, and appends them
+with crud.add_way_points_to_routes in a thread: every route of the batch
+is looked up, checked, locked and measured once.
+
+Past max_size queued way points, put() raises IngestQueueFullException.
+Way points are acknowledged when queued, and rejected ones only counted,
+unless sync_ack makes put() return a future of the way point's error.
+"""
+import asyncio
+import logging
+from collections import deque
+from decimal import Decimal
+from typing import Optional
+from uuid import UUID
+
+from fastapi.concurrency import run_in_threadpool
+
+from core import config, crud, metrics
+from core.excpetions import IngestQueueFullException
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueue:
+    def __init__(
+        self,
+        enabled: bool = config.INGEST_QUEUE_ENABLED,
+        max_size: int = config.INGEST_QUEUE_MAX_SIZE,
+        flush_size: int = config.INGEST_QUEUE_FLUSH_SIZE,
+        flush_seconds: float = config.INGEST_QUEUE_FLUSH_SECONDS,
+        sync_ack: bool = config.INGEST_QUEUE_SYNC_ACK,
+    ):
+        self.enabled = enabled
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.sync_ack = sync_ack
+        self.batches = 0
+        self.written = 0
+        self.rejected = 0
+        self.refused = 0
+        # (route_id, lat, lon, future or None, time queued)
+        self._queue = deque()
+        self._loop = None
+        self._writer = None
+        self._stopping = False
+        self._not_empty = None
+        self._full = None
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(
+        self, route_id: UUID, lat: Decimal, lon: Decimal
+    ) -> Optional[asyncio.Future]:
+        """
+        Queue a way point, and with sync_ack return the future
+        of the exception rejecting it, or None once it is appended
+        """
+        if len(self._queue) >= self.max_size:
+            self.refused += 1
+            raise IngestQueueFullException("Too many way points are queued!")
+
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._writer.done():
+            self._start(loop)
+        future = loop.create_future() if self.sync_ack else None
+        self._queue.append((route_id, lat, lon, future, loop.time()))
+        self._not_empty.set()
+        if len(self._queue) >= self.flush_size:
+            self._full.set()
+        return future
+
+    def _start(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._stopping = False
+        self._not_empty = asyncio.Event()
+        self._full = asyncio.Event()
+        if self._queue:
+            self._not_empty.set()
+        self._writer = loop.create_task(self._write_batches())
+
+    async def _write_batches(self):
+        while True:
+            await self._not_empty.wait()
+            if not self._queue:
+                return
+            timeout = self._queue[0][4] + self.flush_seconds - self._loop.time()
+            if (
+                timeout > 0
+                and len(self._queue) < self.flush_size
+                and not self._stopping
+            ):
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            await self.flush()
+
+    async def flush(self):
+        """
+        Append up to flush_size queued way points
+        """
+        batch = [
+            self._queue.popleft() for _ in range(min(self.flush_size, len(self._queue)))
+        ]
+        if len(self._queue) < self.flush_size:
+            self._full.clear()
+        if not self._queue and not self._stopping:
+            self._not_empty.clear()
+        if not batch:
+            return
+
+        try:
+            errors = await run_in_threadpool(
+                crud.add_way_points_to_routes,
+                [(route_id, lat, lon) for route_id, lat, lon, _, _ in batch],
+            )
+        except Exception as exc:
+            logger.exception("Appending %d queued way points failed", len(batch))
+            errors = [exc] * len(batch)
+
+        self.batches += 1
+        for (_, _, _, future, _), error in zip(batch, errors):
+            if error is None:
+                self.written += 1
+            else:
+                self.rejected += 1
+            if future is not None and not future.done():
+                future.set_result(error)
+
+    async def stop(self):
+        """
+        Append every queued way point and stop the writer
+        """
+        if self._writer is None or self._loop is not asyncio.get_running_loop():
+            return
+        # The writer flushes without waiting, and returns once it is empty
+        self._stopping = True
+        self._not_empty.set()
+        self._full.set()
+        await self._writer
+        self._writer = self._loop = None
+
+
+ingest_queue = IngestQueue()
+
+metrics.Gauge(
+    "ingest_queue_way_points",
+    "Way points waiting in the ingest queue.",
+    lambda: len(ingest_queue),
+)
+metrics.Gauge(
+    "ingest_queue_batches_total",
+    "Batches of queued way points appended by the ingest queue.",
+    lambda: ingest_queue.batches,
+    kind="counter",
+)
+metrics.Gauge(
+    "ingest_queue_rejected_total",
+    "Queued way points rejected when appended, e.g. to closed routes.",
+    lambda: ingest_queue.rejected,
+    kind="counter",
+)
+metrics.Gauge(
+    "ingest_queue_refused_total",
+    "Way points refused with 429 because the ingest queue was full.",
+    lambda: ingest_queue.refused,
+    kind="counter",
+)
@@ -0,0 +1,273 @@
+"""
+Metrics in the Prometheus text exposition format.
+
+Histograms count observations into cumulative buckets, gauges (and
+counters kept elsewhere) read their value from a function when the
+metrics are rendered. Everything is kept in
+the current process, like the memory route store.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from core import config
+from core.cache import segment_cache
+from core.database import get_routes_db
+
+# Seconds, from a single way point append to the first read of a huge route
+DEFAULT_BUCKETS = (
+    0.00001,
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+)
+
+registry = []
+# Seconds observed by every histogram while serving the current request,
+# set for requests captured by core.profiling
+request_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "request_stages", default=None
+)
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in labels
+    )
+    return "{%s}" % ",".join(f'{name}="{value}"' for name, value in escaped)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label values -> [bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self.clear()
+        registry.append(self)
+
+    def observe(self, value: float, *labelvalues: str):
+        stages = request_stages.get()
+        if stages is not None:
+            stages[self.name] = stages.get(self.name, 0.0) + value
+        if not config.METRICS_ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = (
+                    [0] * (len(self.buckets) + 1),
+                    [0.0],
+                )
+            series[0][index] += 1
+            series[1][0] += value
+
+    def time(self, *labelvalues: str) -> "_Timer":
+        """
+        Context manager observing the time spent in its block
+        """
+        return _Timer(self, labelvalues)
+
+    def collect(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = [
+                (labelvalues, list(counts), total[0])
+                for labelvalues, (counts, total) in self._series.items()
+            ]
+        for labelvalues, counts, total in sorted(series):
+            labels = list(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bucket_labels = _format_labels(labels + [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+            # A histogram without labels is rendered even before observations
+            if not self.labelnames:
+                self._series[()] = ([0] * (len(self.buckets) + 1), [0.0])
+
+
+class _Timer:
+    __slots__ = ("histogram", "labelvalues", "start")
+
+    def __init__(self, histogram: Histogram, labelvalues: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+
+
+class Gauge:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        function: Callable[[], float],
+        kind: str = "gauge",
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self.kind = kind
+        registry.append(self)
+
+    def collect(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            f"{self.name} {_format_value(self.function())}",
+        ]
+
+    def clear(self):
+        pass
+
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+def clear():
+    for metric in registry:
+        metric.clear()
+
+
+request_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Time spent serving HTTP requests, by route template.",
+    ("method", "route", "status"),
+)
+geodesic_seconds = Histogram(
+    "route_geodesic_seconds",
+    "Time spent measuring the paths between way points.",
+)
+longest_paths_seconds = Histogram(
+    "route_longest_paths_seconds",
+    "Time spent aggregating the length and longest paths of closed routes.",
+)
+serialization_seconds = Histogram(
+    "route_serialization_seconds",
+    "Time spent serializing closed route responses.",
+)
+
+Gauge("routes", "Routes in the store.", lambda: len(get_routes_db()))
+Gauge(
+    "route_way_points",
+    "Way points of all routes in the store.",
+    lambda: get_routes_db().way_point_count(),
+)
+Gauge(
+    "route_store_memory_bytes",
+    "Estimated memory held by the routes of this process.",
+    lambda: get_routes_db().memory_bytes(),
+)
+Gauge(
+    "segment_cache_hits_total",
+    "Segment lengths found in the segment cache of this process.",
+    lambda: segment_cache.hits,
+    kind="counter",
+)
+Gauge(
+    "segment_cache_misses_total",
+    "Segment lengths measured because they were not in the segment cache.",
+    lambda: segment_cache.misses,
+    kind="counter",
+)
+Gauge(
+    "segment_cache_entries",
+    "Segment lengths held by the segment cache of this process.",
+    lambda: len(segment_cache),
+)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request into request_seconds,
+    labelled by the path template of the route that handled it
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._templates = None
+
+    def _template(self, scope) -> str:
+        if self._templates is None:
+            self._templates = {
+                route.endpoint: route.path
+                for route in scope["app"].routes
+                if hasattr(route, "endpoint")
+            }
+        # The router stores the endpoint of the matched route in the scope
+        return self._templates.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not config.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_seconds.observe(
+                time.perf_counter() - start,
+                scope["method"],
+                self._template(scope),
+                str(status),
+            )
@@ -1,26 +1,177 @@
 import datetime
+from array import array
+from collections.abc import Sequence
 from decimal import Decimal
 from uuid import UUID
 
+EPOCH = datetime.datetime(1970, 1, 1)
+MICROSECOND = datetime.timedelta(microseconds=1)
+# Measured size of an empty Route with its id, arrays and attributes
+ROUTE_OVERHEAD_BYTES = 768
+# Attributes dropped from memory when a route is spilled to disk
+GEOMETRY = ("lats", "lons", "timestamps", "path_lengths_um")
+
+
+def to_timestamp(value: datetime.datetime) -> int:
+    return (value - EPOCH) // MICROSECOND
+
+
+def from_timestamp(value: int) -> datetime.datetime:
+    return EPOCH + value * MICROSECOND
+
+
+def to_decimal(value: float) -> Decimal:
+    # repr() gives the shortest string that round-trips the float,
+    # so "11.11" comes back as Decimal("11.11")
+    return Decimal(repr(value))
+
+
+def km_to_um(value: Decimal) -> int:
+    return int(value.scaleb(9))
+
+
+def um_to_km(value: int) -> Decimal:
+    return Decimal(value).scaleb(-9)
+
 
 class Route:
+    """
+    Way points are kept in parallel typed arrays: lat and lon as float64,
+    creation time as int64 microseconds since the epoch. Path lengths are
+    int64 micrometres, which is exactly what round_() keeps of a kilometre
+    value. WayPoint and Path objects are only built on access.
+
+    Path lengths, their running total and the indexes of the longest paths
+    are kept up to date as way points arrive (see crud.update_route_statistics).
+    paths stays None until the route is closed and its paths are calculated.
+    segment_order lists path indexes from the longest path down, once
+    the segments of the closed route are queried.
+    responses keeps the serialized API responses of a closed route.
+
+    The GEOMETRY of a finalized route may be spilled to disk (see
+    core.retention). It is loaded back by geometry_loader on first access.
+    """
+
     def __init__(self, route_id: UUID):
         self.route_id = route_id
         self.created = datetime.date.today()
         self.length_km = 0
-        self.way_points = []
-        self.paths = None
+        self.lats = array("d")
+        self.lons = array("d")
+        self.timestamps = array("q")
+        self.path_lengths_um = array("q")
+        self.paths_length_um = 0
+        self.longest_path_length_um = None
+        self.longest_path_indexes = []
+        self.paths_calculated = False
         self.longest_paths = None
+        self.segment_order = None
+        self.responses = {}
+        self.geometry_loader = None
+        self.spilled_way_point_count = 0
+        # time.monotonic() of the last store lookup, for LRU retention
+        self.last_access = 0.0
+
+    def __getattr__(self, name):
+        # Only called for attributes missing from the instance,
+        # which is the geometry of a spilled route
+        loader = self.__dict__.get("geometry_loader")
+        if name not in GEOMETRY or loader is None:
+            raise AttributeError(name)
+        self.__dict__.update(loader())
+        return self.__dict__[name]
+
+    @property
+    def spilled(self) -> bool:
+        return "timestamps" not in self.__dict__
+
+    @property
+    def way_point_count(self) -> int:
+        if self.spilled:
+            return self.spilled_way_point_count
+        # timestamps are appended last, so a concurrent reader
+        # never counts a way point whose coordinates are missing
+        return len(self.timestamps)
+
+    def spill(self, geometry_loader):
+        """
+        Drop the geometry from memory, geometry_loader() returns
+        it as a dict of GEOMETRY attributes when it is needed again
+        """
+        self.geometry_loader = geometry_loader
+        self.spilled_way_point_count = self.way_point_count
+        self.segment_order = None
+        for name in GEOMETRY:
+            self.__dict__.pop(name, None)
+
+    def coordinates(self):
+        """
+        (lats, lons) arrays, read from disk without loading the
+        geometry back into memory if the route is spilled
+        """
+        if self.spilled and self.geometry_loader is not None:
+            geometry = self.geometry_loader()
+            return geometry["lats"], geometry["lons"]
+        return self.lats, self.lons
+
+    def memory_bytes(self) -> int:
+        """
+        Estimated memory held by the route, with its cached responses
+        """
+        geometry = [self.__dict__.get(name) for name in GEOMETRY]
+        geometry.append(self.segment_order)
+        return (
+            ROUTE_OVERHEAD_BYTES
+            + sum(
+                len(values) * values.itemsize
+                for values in geometry
+                if values is not None
+            )
+            + sum(len(body) for _, body in self.responses.values())
+        )
+
+    @property
+    def way_points(self):
+        return WayPoints(self)
+
+    @property
+    def paths(self):
+        if not self.paths_calculated:
+            return None
+        return Paths(self)
+
+    def append_way_point(self, lat, lon, created: datetime.datetime = None):
+        if created is None:
+            created = datetime.datetime.now()
+        self.lats.append(lat)
+        self.lons.append(lon)
+        self.timestamps.append(to_timestamp(created))
+
+    def way_point(self, index: int):
+        return WayPoint(
+            lat=to_decimal(self.lats[index]),
+            lon=to_decimal(self.lons[index]),
+            created=from_timestamp(self.timestamps[index]),
+        )
+
+    def path(self, index: int, length_um: int = None):
+        if length_um is None:
+            length_um = self.path_lengths_um[index]
+        return Path(
+            length_km=um_to_km(length_um),
+            start=self.way_point(index),
+            stop=self.way_point(index + 1),
+        )
 
 
 class WayPoint:
-    def __init__(self, lat: Decimal, lon: Decimal):
+    def __init__(self, lat: Decimal, lon: Decimal, created: datetime.datetime = None):
         assert -90 <= lat <= 90
         assert -180 <= lon <= 180
 
         self.lat = lat
         self.lon = lon
-        self.created = datetime.datetime.now()
+        self.created = created or datetime.datetime.now()
 
     @property
     def coordinates(self):
@@ -32,3 +183,58 @@ class Path:
         self.start = start
         self.stop = stop
         self.length_km = length_km
+
+
+class WayPoints(Sequence):
+    """
+    List-like view over the way point arrays of a route. Items are built
+    on access and appends are written straight into the arrays.
+    """
+
+    def __init__(self, route: Route):
+        self._route = route
+
+    def __len__(self):
+        return len(self._route.lats)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._route.way_point(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("way point index out of range")
+        return self._route.way_point(index)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(
+            mine.coordinates == theirs.coordinates for mine, theirs in zip(self, other)
+        )
+
+    def append(self, way_point: WayPoint):
+        self._route.append_way_point(
+            float(way_point.lat), float(way_point.lon), way_point.created
+        )
+
+
+class Paths(Sequence):
+    """
+    Read-only list-like view over the segment lengths of a route
+    """
+
+    def __init__(self, route: Route):
+        self._route = route
+
+    def __len__(self):
+        return len(self._route.path_lengths_um)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("path index out of range")
+        return self._route.path(index)
@@ -0,0 +1,122 @@
+"""
+Path length computation for request handlers, off the event loop.
+
+Handlers are async and run on the event loop, so ingestion and reads of
+routes with up to date statistics never wait for a thread. Before a read
+calculates a route, compute_pool measures its pending way points: inline
+when there are few of them, otherwise in a dedicated process pool, where
+it does not hold the GIL of the server process. At most max_pending jobs
+may wait for the pool, further ones fail with ServerBusyException.
+
+Concurrent first reads of a route share its computation: the pending way
+points of a route are measured by one request while the others wait for it.
+"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List
+from uuid import UUID
+
+from fastapi.concurrency import run_in_threadpool
+
+from core import config, crud, metrics
+from core.database import get_routes_db
+from core.excpetions import ServerBusyException
+from core.models import Route
+from core.util import calculate_lengths_um
+
+
+class ComputePool:
+    def __init__(
+        self,
+        workers: int = config.COMPUTE_WORKERS,
+        max_pending: int = config.COMPUTE_MAX_PENDING,
+        min_way_points: int = config.COMPUTE_MIN_WAY_POINTS,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.min_way_points = min_way_points
+        self.pending = 0
+        self._executor = None
+        # Routes being measured, and their longest paths being found
+        self._updating: Dict[UUID, asyncio.Event] = {}
+        self._finding: Dict[UUID, asyncio.Future] = {}
+
+    async def calculate_lengths_um(self, lats, lons):
+        if len(lats) < self.min_way_points:
+            with metrics.geodesic_seconds.time():
+                return calculate_lengths_um(lats, lons)
+        if self.pending >= self.max_pending:
+            raise ServerBusyException("Too many routes are being calculated!")
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers)
+        self.pending += 1
+        try:
+            with metrics.geodesic_seconds.time():
+                return await asyncio.get_running_loop().run_in_executor(
+                    self._executor, calculate_lengths_um, lats, lons
+                )
+        finally:
+            self.pending -= 1
+
+    async def update_routes_statistics(self, routes: Iterable[Route]):
+        """
+        crud.update_routes_statistics, measured in the pool.
+        Statistics changed meanwhile by another request are left alone,
+        and routes already being measured by another request are waited for.
+        """
+        routes = list(routes)
+        while routes:
+            waiting = [route for route in routes if route.route_id in self._updating]
+            events = {self._updating[route.route_id] for route in waiting}
+            await self._update_routes_statistics(
+                [route for route in routes if route.route_id not in self._updating]
+            )
+            for event in events:
+                await event.wait()
+            # Measured meanwhile, unless that request failed
+            routes = waiting
+
+    async def _update_routes_statistics(self, routes: List[Route]):
+        pending, lats, lons = crud.pending_routes_way_points(routes)
+        if not pending:
+            return
+        event = asyncio.Event()
+        for route, _, _ in pending:
+            self._updating[route.route_id] = event
+        try:
+            crud.apply_routes_statistics(
+                pending, await self.calculate_lengths_um(lats, lons)
+            )
+        finally:
+            for route, _, _ in pending:
+                self._updating.pop(route.route_id, None)
+            event.set()
+
+    async def find_longest_paths(self, route: Route):
+        """
+        crud.find_longest_paths in the threadpool, shared by the
+        requests for the same route while it runs
+        """
+        future = self._finding.get(route.route_id)
+        if future is None:
+            future = asyncio.ensure_future(
+                run_in_threadpool(crud.find_longest_paths, route)
+            )
+            self._finding[route.route_id] = future
+            future.add_done_callback(lambda _: self._finding.pop(route.route_id, None))
+        # A cancelled request leaves the others waiting
+        return await asyncio.shield(future)
+
+    async def prepare_route(self, route_id: UUID):
+        route = get_routes_db().get(route_id)
+        if route:
+            await self.update_routes_statistics([route])
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+compute_pool = ComputePool()
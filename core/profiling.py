@@ -0,0 +1,163 @@
+"""
+Profiles of single requests, and timings of slow ones.
+
+ProfilingMiddleware profiles a request when PROFILE_HEADER_ENABLED and it
+has an X-Profile header, or at random for a PROFILE_SAMPLE_RATE share of
+requests, one request at a time. PROFILE_MODE picks how:
+
+- "cprofile": cProfile of the event loop thread, downloaded as pstats.
+- "sampling": the stack of the event loop thread every
+  PROFILE_SAMPLING_SECONDS, downloaded as collapsed stacks for flame graphs.
+
+Both see whatever else runs on the event loop meanwhile. Profiled
+requests, and requests slower than PROFILE_SLOW_REQUEST_SECONDS, are kept
+in the last PROFILE_BUFFER_SIZE entries of `captures`, with the way points
+of their route and the time spent in every histogram of core.metrics.
+"""
+import cProfile
+import itertools
+import marshal
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, Optional
+from uuid import UUID
+
+from core import config, metrics
+from core.database import get_routes_db
+
+PROFILE_HEADER = b"x-profile"
+
+captures = deque(maxlen=config.PROFILE_BUFFER_SIZE)
+_capture_ids = itertools.count(1)
+_profiling = threading.Lock()
+
+
+class StackSampler:
+    """
+    Collapsed stacks of a thread, sampled by a background thread
+    """
+
+    def __init__(self, thread_id: int, interval_seconds: float):
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+def _pstats(profiler: cProfile.Profile) -> bytes:
+    """
+    The file pstats.Stats.dump_stats() would write
+    """
+    return marshal.dumps(pstats.Stats(profiler).stats)
+
+
+def _route_way_points(scope) -> Optional[int]:
+    try:
+        route_id = UUID(scope.get("path_params", {})["route_id"])
+    except (KeyError, ValueError):
+        return None
+    route = get_routes_db().get(route_id)
+    return route.way_point_count if route is not None else None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware capturing profiled and slow requests into `captures`
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _wants_profile(self, scope) -> bool:
+        if config.PROFILE_HEADER_ENABLED and any(
+            name == PROFILE_HEADER for name, _ in scope["headers"]
+        ):
+            return True
+        return random.random() < config.PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profiler = sampler = None
+        if self._wants_profile(scope) and _profiling.acquire(blocking=False):
+            if config.PROFILE_MODE == "sampling":
+                sampler = StackSampler(
+                    threading.get_ident(), config.PROFILE_SAMPLING_SECONDS
+                )
+                sampler.start()
+            else:
+                profiler = cProfile.Profile()
+                profiler.enable()
+        elif not config.PROFILE_SLOW_REQUEST_SECONDS:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stages: Dict[str, float] = {}
+        token = metrics.request_stages.set(stages)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            seconds = time.perf_counter() - start
+            metrics.request_stages.reset(token)
+            profiled = profiler is not None or sampler is not None
+            if profiler is not None:
+                profiler.disable()
+            if sampler is not None:
+                sampler.stop()
+            if profiled:
+                _profiling.release()
+
+            slow_seconds = config.PROFILE_SLOW_REQUEST_SECONDS
+            if profiled or (slow_seconds and seconds >= slow_seconds):
+                captures.append(
+                    {
+                        "id": next(_capture_ids),
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "status": status,
+                        "seconds": seconds,
+                        "way_points": _route_way_points(scope),
+                        "stages": stages,
+                        "pstats": _pstats(profiler) if profiler else None,
+                        "collapsed": sampler.collapsed() if sampler else None,
+                    }
+                )
@@ -0,0 +1,213 @@
+"""
+Retention of finalized routes in the in-memory stores.
+
+Geometry of finalized routes is spilled to one file per route and loaded
+back when something reads it; the summary (length, longest paths, cached
+responses) stays in memory. Over the memory budget, the least recently
+used finalized routes are unloaded altogether and read back from their
+file on the next lookup. Routes older than the TTL are deleted, files
+included, whether they are in memory or unloaded.
+"""
+import datetime
+import os
+import struct
+from array import array
+from functools import partial
+from typing import Optional
+from uuid import UUID
+
+from core.models import GEOMETRY, Route
+
+# route id, date ordinal of creation, way points, paths
+SPILL_HEADER = struct.Struct("<16sqqq")
+
+
+def _write_spill_file(path: str, route: Route):
+    with open(path + ".tmp", "wb") as file:
+        file.write(
+            SPILL_HEADER.pack(
+                _route_id(route.route_id).bytes,
+                route.created.toordinal(),
+                route.way_point_count,
+                len(route.path_lengths_um),
+            )
+        )
+        for values in (route.lats, route.lons, route.timestamps, route.path_lengths_um):
+            values.tofile(file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def _read_spill_file(path: str, names=GEOMETRY):
+    with open(path, "rb") as file:
+        route_id, created, way_points, paths = SPILL_HEADER.unpack(
+            file.read(SPILL_HEADER.size)
+        )
+        geometry = {}
+        for name, typecode, count in (
+            ("lats", "d", way_points),
+            ("lons", "d", way_points),
+            ("timestamps", "q", way_points),
+            ("path_lengths_um", "q", paths),
+        ):
+            if name not in names:
+                file.seek(count * 8, os.SEEK_CUR)
+                continue
+            geometry[name] = array(typecode)
+            geometry[name].fromfile(file, count)
+    return UUID(bytes=route_id), datetime.date.fromordinal(created), geometry
+
+
+def _read_spill_header(path: str):
+    with open(path, "rb") as file:
+        route_id, created, _, _ = SPILL_HEADER.unpack(file.read(SPILL_HEADER.size))
+    return UUID(bytes=route_id), datetime.date.fromordinal(created)
+
+
+def _load_geometry(path: str):
+    return _read_spill_file(path)[2]
+
+
+def _route_id(route_id) -> UUID:
+    return route_id if isinstance(route_id, UUID) else UUID(str(route_id))
+
+
+class RouteRetention:
+    def __init__(self, directory: str, ttl_days: int = 0, memory_budget_bytes: int = 0):
+        self.directory = directory
+        self.ttl_days = ttl_days
+        self.memory_budget_bytes = memory_budget_bytes
+        self.spilled = 0
+        self.unloaded = 0
+        self.expired = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, route_id) -> str:
+        return os.path.join(self.directory, f"{_route_id(route_id)}.route")
+
+    def is_expired(self, created: datetime.date, today: datetime.date = None) -> bool:
+        today = today or datetime.date.today()
+        return bool(self.ttl_days) and (today - created).days > self.ttl_days
+
+    def retains(self, route_id, created: datetime.date) -> bool:
+        """
+        Whether a route is left to retention rather than rebuilt by the
+        store: its geometry is in its file, or it is older than the TTL
+        """
+        return self.is_expired(created) or os.path.exists(self.path(route_id))
+
+    def spill(self, route: Route):
+        if route.spilled:
+            return
+        path = self.path(route.route_id)
+        if not os.path.exists(path):
+            _write_spill_file(path, route)
+        route.spill(partial(_load_geometry, path))
+        self.spilled += 1
+
+    def load(self, route_id) -> Optional[Route]:
+        """
+        A route unloaded from memory, with its summary rebuilt
+        from the path lengths, or None when it has no file.
+        The file of a route older than the TTL is deleted instead.
+        """
+        path = self.path(route_id)
+        try:
+            route_id, created, geometry = _read_spill_file(path)
+        except FileNotFoundError:
+            return None
+        if self.is_expired(created):
+            self._expire(route_id)
+            return None
+
+        route = Route(route_id=route_id)
+        route.created = created
+        route.__dict__.update(geometry)
+        route.geometry_loader = partial(_load_geometry, path)
+        lengths_um = route.path_lengths_um
+        route.paths_length_um = sum(lengths_um)
+        if lengths_um:
+            route.longest_path_length_um = max(lengths_um)
+            route.longest_path_indexes = [
+                index
+                for index, length_um in enumerate(lengths_um)
+                if length_um == route.longest_path_length_um
+            ]
+        route.paths_calculated = True
+        return route
+
+    def coordinates(self, route_id):
+        """
+        (lats, lons) of an unloaded route read from its file, without
+        loading the route, or None when it has no file or is expired
+        """
+        path = self.path(route_id)
+        try:
+            _, created, geometry = _read_spill_file(path, ("lats", "lons"))
+        except FileNotFoundError:
+            return None
+        if self.is_expired(created):
+            self._expire(route_id)
+            return None
+        return geometry["lats"], geometry["lons"]
+
+    def apply(self, routes: dict):
+        """
+        Expire, spill and unload the routes of an in-memory store,
+        and expire the files of routes unloaded before
+        """
+        today = datetime.date.today()
+        for route_id, route in list(routes.items()):
+            if self.is_expired(route.created, today):
+                dict.pop(routes, route_id, None)
+                self._expire(route_id)
+            elif route.longest_paths is not None:
+                self.spill(route)
+        if self.ttl_days:
+            self._expire_unloaded(routes, today)
+
+        if not self.memory_budget_bytes:
+            return
+        memory_bytes = routes.memory_bytes()
+        finalized = sorted(
+            (
+                (route.last_access, route_id, route)
+                for route_id, route in list(routes.items())
+                if route.longest_paths is not None
+            ),
+            key=lambda item: item[0],
+        )
+        for _, route_id, route in finalized:
+            if memory_bytes <= self.memory_budget_bytes:
+                break
+            self.spill(route)
+            dict.pop(routes, route_id, None)
+            memory_bytes -= route.memory_bytes()
+            self.unloaded += 1
+
+    def _expire_unloaded(self, routes: dict, today: datetime.date):
+        # Files of routes still in memory were expired with the route
+        for name in os.listdir(self.directory):
+            if not name.endswith(".route") or UUID(name[:-6]) in dict.keys(routes):
+                continue
+            try:
+                route_id, created = _read_spill_header(
+                    os.path.join(self.directory, name)
+                )
+            except (FileNotFoundError, struct.error):
+                continue
+            if self.is_expired(created, today):
+                self._expire(route_id)
+
+    def _expire(self, route_id):
+        try:
+            os.remove(self.path(route_id))
+        except FileNotFoundError:
+            pass
+        self.expired += 1
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".route"):
+                os.remove(os.path.join(self.directory, name))
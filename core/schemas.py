@@ -1,7 +1,9 @@
 from decimal import Decimal
 from pydantic import BaseModel, Field
 from pydantic.types import UUID
-from typing import List
+from typing import List, Optional
+
+from core import config
 
 
 class Route(BaseModel):
@@ -28,6 +30,61 @@ class WayPoint(BaseModel):
         }
 
 
+class RouteWayPoint(BaseModel):
+    route_id: UUID
+    lat: Decimal
+    lon: Decimal
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "route_id": "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e",
+                "lat": "59.23425",
+                "lon": "18.23526",
+            }
+        }
+
+
+class WayPointBatch(BaseModel):
+    way_points: List[RouteWayPoint] = Field(..., max_items=config.MAX_BATCH_WAY_POINTS)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "way_points": [
+                    {
+                        "route_id": "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e",
+                        "lat": "59.23425",
+                        "lon": "18.23526",
+                    },
+                    {
+                        "route_id": "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e",
+                        "lat": "59.23512",
+                        "lon": "18.23601",
+                    },
+                ],
+            }
+        }
+
+
+class RouteQuery(BaseModel):
+    route_ids: List[UUID]
+    length: bool = True
+    longest_paths: bool = False
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "route_ids": [
+                    "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e",
+                    "b2bd3e1b-ef4b-4fe8-b2e5-5a5d6a5a3e39",
+                ],
+                "length": True,
+                "longest_paths": False,
+            }
+        }
+
+
 class Length(BaseModel):
     km: Decimal
 
@@ -92,3 +149,39 @@ class LongestPaths(BaseModel):
                 ],
             }
         }
+
+
+class Segment(LongestPath):
+    index: int
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "index": 0,
+                "km": "0",
+                "start": {
+                    "lat": "59.23425",
+                    "lon": "18.23526",
+                },
+                "stop": {
+                    "lat": "59.23425",
+                    "lon": "18.23526",
+                },
+            }
+        }
+
+
+class Segments(BaseModel):
+    segments: List[Segment]
+    next_offset: Optional[int] = None
+
+
+class RouteIds(BaseModel):
+    route_ids: List[UUID]
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "route_ids": ["e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"],
+            }
+        }
@@ -0,0 +1,261 @@
+"""
+Grid index of the areas routes pass through.
+
+The world is split into square cells of cell_degrees. Every cell maps to
+the ids of the routes with a segment whose bounding box touches the cell.
+A segment covering more than MAX_SEGMENT_CELLS cells, a jump between two
+distant fixes, only marks its route as a candidate of every query.
+
+The index gives candidates, which the caller checks against the route's
+way points. Ids of routes that no longer exist are dropped with discard().
+"""
+import math
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+from uuid import UUID
+
+import numpy as np
+
+MAX_SEGMENT_CELLS = 16
+# Fewer way points are indexed in plain Python
+VECTORIZE_MIN_WAY_POINTS = 16
+# On a sphere of the mean Earth radius
+KM_PER_DEGREE = 6371.0088 * math.pi / 180
+
+
+class SpatialIndex:
+    def __init__(self, cell_degrees: float):
+        self.cell_degrees = cell_degrees
+        self._rows = math.ceil(180 / cell_degrees) + 1
+        self._columns = math.ceil(360 / cell_degrees) + 1
+        self._cells: Dict[int, Set[UUID]] = {}
+        self._long_routes: Set[UUID] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cells)
+
+    def _row(self, lat):
+        return np.clip(
+            np.floor((np.asarray(lat) + 90) / self.cell_degrees).astype(np.int64),
+            0,
+            self._rows - 1,
+        )
+
+    def _column(self, lon):
+        return np.clip(
+            np.floor((np.asarray(lon) + 180) / self.cell_degrees).astype(np.int64),
+            0,
+            self._columns - 1,
+        )
+
+    def _segment_cells(self, row_1, column_1, row_2, column_2) -> Optional[List[int]]:
+        """
+        Cells of the bounding box of a segment, None if there are too many
+        """
+        rows = range(min(row_1, row_2), max(row_1, row_2) + 1)
+        columns = range(min(column_1, column_2), max(column_1, column_2) + 1)
+        if len(rows) * len(columns) > MAX_SEGMENT_CELLS:
+            return None
+        return [row * self._columns + column for row in rows for column in columns]
+
+    def add(self, route_id: UUID, lats, lons):
+        """
+        Index the segments between consecutive (lats, lons) way points
+        of a route, or the way point if there is a single one
+        """
+        if len(lats) < VECTORIZE_MIN_WAY_POINTS:
+            size = self.cell_degrees
+            rows = [
+                min(max(math.floor((lat + 90) / size), 0), self._rows - 1)
+                for lat in lats
+            ]
+            columns = [
+                min(max(math.floor((lon + 180) / size), 0), self._columns - 1)
+                for lon in lons
+            ]
+            # A single way point is a segment of length zero
+            if len(rows) == 1:
+                rows, columns = rows * 2, columns * 2
+            segments = range(len(rows) - 1)
+            cells = set()
+        else:
+            rows, columns = self._row(lats), self._column(lons)
+            # Most segments are within a cell or two, their cells are
+            # the corners of their bounding box
+            rows_1, rows_2 = rows[:-1], rows[1:]
+            columns_1, columns_2 = columns[:-1], columns[1:]
+            short = (np.abs(rows_2 - rows_1) <= 1) & (
+                np.abs(columns_2 - columns_1) <= 1
+            )
+            cells = set(
+                np.unique(
+                    np.concatenate(
+                        [
+                            row_values[short] * self._columns + column_values[short]
+                            for row_values in (rows_1, rows_2)
+                            for column_values in (columns_1, columns_2)
+                        ]
+                    )
+                ).tolist()
+            )
+            segments = np.flatnonzero(~short).tolist()
+            rows, columns = rows.tolist(), columns.tolist()
+
+        long_route = False
+        for index in segments:
+            segment_cells = self._segment_cells(
+                rows[index], columns[index], rows[index + 1], columns[index + 1]
+            )
+            if segment_cells is None:
+                long_route = True
+            else:
+                cells.update(segment_cells)
+
+        with self._lock:
+            for cell in cells:
+                self._cells.setdefault(cell, set()).add(route_id)
+            if long_route:
+                self._long_routes.add(route_id)
+
+    def candidates(
+        self, min_lat: float, min_lon: float, max_lat: float, max_lon: float
+    ) -> Set[UUID]:
+        """
+        Ids of the routes that may pass through the bounding box
+        """
+        low_row, high_row = int(self._row(min_lat)), int(self._row(max_lat))
+        low_column = int(self._column(min_lon))
+        high_column = int(self._column(max_lon))
+        route_ids = set()
+        with self._lock:
+            route_ids.update(self._long_routes)
+            area = (high_row - low_row + 1) * (high_column - low_column + 1)
+            if area <= len(self._cells):
+                for row in range(low_row, high_row + 1):
+                    for column in range(low_column, high_column + 1):
+                        route_ids.update(
+                            self._cells.get(row * self._columns + column, ())
+                        )
+            else:
+                for cell, cell_route_ids in self._cells.items():
+                    row, column = divmod(cell, self._columns)
+                    if (
+                        low_row <= row <= high_row
+                        and low_column <= column <= high_column
+                    ):
+                        route_ids.update(cell_route_ids)
+        return route_ids
+
+    def discard(self, route_ids: Iterable[UUID]):
+        route_ids = set(route_ids)
+        if not route_ids:
+            return
+        with self._lock:
+            self._long_routes -= route_ids
+            for cell in list(self._cells):
+                remaining = self._cells[cell] - route_ids
+                if remaining:
+                    self._cells[cell] = remaining
+                else:
+                    del self._cells[cell]
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._long_routes.clear()
+
+
+def passes_through_box(
+    lats, lons, min_lat: float, min_lon: float, max_lat: float, max_lon: float
+) -> bool:
+    """
+    Whether a way point or a segment between consecutive way points is in
+    the box, with segments as straight lines in degrees
+    """
+    lats, lons = np.asarray(lats), np.asarray(lons)
+    if not len(lats):
+        return False
+    inside = (
+        (min_lat <= lats) & (lats <= max_lat) & (min_lon <= lons) & (lons <= max_lon)
+    )
+    if inside.any():
+        return True
+
+    x1, y1, x2, y2 = lons[:-1], lats[:-1], lons[1:], lats[1:]
+    overlap = (
+        (np.minimum(x1, x2) <= max_lon)
+        & (np.maximum(x1, x2) >= min_lon)
+        & (np.minimum(y1, y2) <= max_lat)
+        & (np.maximum(y1, y2) >= min_lat)
+    )
+    x1, y1, x2, y2 = x1[overlap], y1[overlap], x2[overlap], y2[overlap]
+    # A segment misses the box when all its corners are on one side of it
+    sides = np.array(
+        [
+            (x2 - x1) * (lat - y1) - (y2 - y1) * (lon - x1)
+            for lat, lon in [
+                (min_lat, min_lon),
+                (min_lat, max_lon),
+                (max_lat, min_lon),
+                (max_lat, max_lon),
+            ]
+        ]
+    )
+    return bool((~((sides > 0).all(axis=0) | (sides < 0).all(axis=0))).any())
+
+
+def passes_within(lats, lons, lat: float, lon: float, radius_km: float) -> bool:
+    """
+    Whether a way point or a segment between consecutive way points is
+    within radius_km of (lat, lon), on an equirectangular projection
+    centred there, which is close enough for radii of a few dozen km
+    """
+    lats, lons = np.asarray(lats), np.asarray(lons)
+    if not len(lats):
+        return False
+    x = ((lons - lon + 180) % 360 - 180) * math.cos(math.radians(lat)) * KM_PER_DEGREE
+    y = (lats - lat) * KM_PER_DEGREE
+    if len(x) == 1:
+        return bool(np.hypot(x, y)[0] <= radius_km)
+
+    x1, y1 = x[:-1], y[:-1]
+    dx, dy = x[1:] - x1, y[1:] - y1
+    squared = dx * dx + dy * dy
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # Position of the point nearest the centre along each segment
+        t = np.where(squared > 0, -(x1 * dx + y1 * dy) / squared, 0)
+    t = np.clip(t, 0, 1)
+    return bool((np.hypot(x1 + t * dx, y1 + t * dy) <= radius_km).any())
+
+
+def radius_box(lat: float, lon: float, radius_km: float):
+    """
+    (min_lat, min_lon, max_lat, max_lon) boxes around the circle of
+    passes_within, two of them when it crosses the antimeridian
+    """
+    lat_degrees = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = max(lat - lat_degrees, -90), min(lat + lat_degrees, 90)
+    cos_lat = math.cos(math.radians(lat))
+    if cos_lat * 180 * KM_PER_DEGREE <= radius_km:
+        return [(min_lat, -180, max_lat, 180)]
+    return split_box(
+        min_lat,
+        lon - radius_km / (KM_PER_DEGREE * cos_lat),
+        max_lat,
+        lon + radius_km / (KM_PER_DEGREE * cos_lat),
+    )
+
+
+def split_box(min_lat: float, min_lon: float, max_lat: float, max_lon: float):
+    """
+    Boxes within [-180, 180] longitude covering a box that may cross the
+    antimeridian, given by min_lon > max_lon or longitudes out of range
+    """
+    if max_lon - min_lon >= 360:
+        return [(min_lat, -180, max_lat, 180)]
+    min_lon = (min_lon + 180) % 360 - 180
+    max_lon = (max_lon + 180) % 360 - 180
+    if min_lon <= max_lon:
+        return [(min_lat, min_lon, max_lat, max_lon)]
+    return [(min_lat, min_lon, max_lat, 180), (min_lat, -180, max_lat, max_lon)]
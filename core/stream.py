@@ -0,0 +1,50 @@
+"""
+Frames of the way point stream of a route, see api.v1.stream_way_points.
+
+A client pushes way points as frames of either kind:
+
+- text: a JSON array of [lat, lon] pairs, e.g. [[50.1, 20.1], [50.2, 20.2]]
+- binary: WAY_POINT structs, little-endian float64 lat then lon
+
+Every ack_window frames, and on an empty frame, the server answers with
+{"received": way points received, "appended": way points appended}, both
+counted since the stream was opened.
+"""
+import json
+import struct
+from typing import List, Tuple, Union
+
+from core import config
+
+WAY_POINT = struct.Struct("<dd")
+MAX_FRAME_WAY_POINTS = config.MAX_BATCH_WAY_POINTS
+
+
+def decode_frame(data: Union[str, bytes]) -> List[Tuple[float, float]]:
+    """
+    (lat, lon) of the way points of a frame, ValueError if it is malformed
+    """
+    if isinstance(data, bytes):
+        if len(data) % WAY_POINT.size:
+            raise ValueError("Binary frames hold whole way points!")
+        if len(data) > MAX_FRAME_WAY_POINTS * WAY_POINT.size:
+            raise ValueError("Too many way points in a frame!")
+        return list(WAY_POINT.iter_unpack(data))
+
+    try:
+        way_points = json.loads(data)
+    except json.JSONDecodeError:
+        raise ValueError("Text frames are JSON arrays of [lat, lon] pairs!")
+    if not isinstance(way_points, list) or not all(
+        isinstance(way_point, list)
+        and len(way_point) == 2
+        and all(
+            isinstance(value, (int, float)) and not isinstance(value, bool)
+            for value in way_point
+        )
+        for way_point in way_points
+    ):
+        raise ValueError("Text frames are JSON arrays of [lat, lon] pairs!")
+    if len(way_points) > MAX_FRAME_WAY_POINTS:
+        raise ValueError("Too many way points in a frame!")
+    return way_points
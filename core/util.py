@@ -1,13 +1,100 @@
+from array import array
 from decimal import Decimal, ROUND_HALF_UP
 
+import numpy as np
 from geopy.distance import geodesic
 
-from core.models import WayPoint
+from core.cache import segment_cache
+from core.geodesic import VECTORIZE_MIN_SEGMENTS, geodesic_pair_lengths_km
+from core.models import WayPoint, km_to_um, um_to_km
+
+UM_PER_KM = 1e9
+# Dekker's splitter: halves of 26 bits times the 21 significant bits
+# of UM_PER_KM are exact products
+SPLITTER = 2.0 ** 27 + 1
+# Closer than this to a tie, the rounding of `fraction` could decide it
+TIE_MARGIN = 1e-9
+# Fewer lengths are rounded faster one Decimal at a time
+VECTORIZE_MIN_LENGTHS = 8
 
 
 def calculate_length_km(start: WayPoint, stop: WayPoint) -> Decimal:
-    distance = geodesic(start.coordinates, stop.coordinates)
-    return round_(Decimal(distance.km))
+    key = (float(start.lat), float(start.lon), float(stop.lat), float(stop.lon))
+    length_um = segment_cache.get(key)
+    if length_um is None:
+        distance = geodesic(start.coordinates, stop.coordinates)
+        length_um = _km_to_um(distance.km)
+        segment_cache.put(key, length_um)
+    return um_to_km(length_um)
+
+
+def calculate_lengths_um(lats: array, lons: array) -> array:
+    """
+    Length of every segment between consecutive way points,
+    in micrometres (see core.models.Route). Segments found in
+    segment_cache are not measured again.
+    """
+    if len(lats) < 2:
+        return array("q")
+    return calculate_pair_lengths_um(lats[:-1], lons[:-1], lats[1:], lons[1:])
+
+
+def calculate_pair_lengths_um(lats1, lons1, lats2, lons2, vectorized=None) -> array:
+    """
+    Like calculate_lengths_um, between (lats1[i], lons1[i]) and
+    (lats2[i], lons2[i]). `vectorized` picks how geodesics are solved,
+    see geodesic_pair_lengths_km.
+    """
+    if vectorized is None:
+        vectorized = len(lats1) >= VECTORIZE_MIN_SEGMENTS
+    if not segment_cache.max_size:
+        lengths_km = geodesic_pair_lengths_km(lats1, lons1, lats2, lons2, vectorized)
+        return array("q", round_km_to_um(lengths_km).tobytes())
+
+    keys = list(zip(lats1, lons1, lats2, lons2))
+    lengths_um = segment_cache.get_many(keys)
+    # Segments repeated within the batch are measured once
+    missing = list(
+        dict.fromkeys(
+            key for key, length_um in zip(keys, lengths_um) if length_um is None
+        )
+    )
+    if missing:
+        lengths_km = geodesic_pair_lengths_km(*zip(*missing), vectorized)
+        measured = dict(zip(missing, round_km_to_um(lengths_km).tolist()))
+        segment_cache.put_many(measured.items())
+        lengths_um = [
+            measured[key] if length_um is None else length_um
+            for key, length_um in zip(keys, lengths_um)
+        ]
+    return array("q", lengths_um)
+
+
+def round_km_to_um(lengths_km: np.ndarray) -> np.ndarray:
+    """
+    int64 micrometres of non-negative float kilometres, rounded exactly
+    like km_to_um(round_(Decimal(km))) but without a Decimal per value
+    """
+    lengths_km = np.asarray(lengths_km, dtype=np.float64)
+    if lengths_km.size < VECTORIZE_MIN_LENGTHS:
+        return np.array([_km_to_um(km) for km in lengths_km.tolist()], dtype=np.int64)
+
+    # um + error is exactly km * 1e9
+    um = lengths_km * UM_PER_KM
+    scaled = SPLITTER * lengths_km
+    high = scaled - (scaled - lengths_km)
+    low = lengths_km - high
+    error = (high * UM_PER_KM - um) + low * UM_PER_KM
+    whole = np.floor(um)
+    fraction = (um - whole) + error
+    rounded = whole.astype(np.int64) + (fraction >= 0.5)
+    for index in np.flatnonzero(np.abs(fraction - 0.5) < TIE_MARGIN).tolist():
+        rounded[index] = _km_to_um(float(lengths_km[index]))
+    return rounded
+
+
+def _km_to_um(km: float) -> int:
+    return km_to_um(round_(Decimal(km)))
 
 
 def round_(value, decimal_places=9, rounding=ROUND_HALF_UP):
@@ -0,0 +1,372 @@
+"""
+Append-only, memory-mapped log of route store writes.
+
+Every created route and appended way point becomes a fixed-size record in
+the current segment file. Segments are memory-mapped, so a record is in the
+page cache, and survives a crash of the process, as soon as it is written.
+It is flushed to disk with group commit: once per FLUSH_RECORDS records, and
+by a timer FLUSH_INTERVAL_SECONDS after the first record left unflushed, so
+that a write is on disk at most that long after it was acknowledged.
+On startup the routes are rebuilt by replaying
+snapshots and then segments.
+
+Compaction moves closed routes out of old segments into a snapshot file,
+which stores each route's arrays as they are in memory, and deletes
+segments that only hold closed routes. Each compaction merges the routes
+of the previous snapshots into the new one and deletes them, leaving out
+routes the store no longer holds. Segment records of routes found in a
+snapshot are skipped on replay, so a crash in the middle of a compaction
+does not duplicate way points. A route left out while segments still hold
+records of it is kept in the snapshot as a header without way points,
+so that it is not replayed from them.
+"""
+import datetime
+import mmap
+import os
+import struct
+import threading
+import time
+from uuid import UUID
+
+import numpy as np
+
+from core.models import Route, to_timestamp
+
+CREATE = 1
+WAY_POINT = 2
+
+# type, padding, route id, lat, lon, timestamp (or date ordinal on CREATE)
+RECORD = struct.Struct("<B7x16sddq")
+# The same layout, to write and read records in bulk
+RECORD_DTYPE = np.dtype(
+    [
+        ("type", "u1"),
+        ("padding", "V7"),
+        ("route_id", "V16"),
+        ("lat", "<f8"),
+        ("lon", "<f8"),
+        ("value", "<i8"),
+    ]
+)
+# route id, date ordinal of creation, way points (DROPPED for a dropped route)
+SNAPSHOT_HEADER = struct.Struct("<16sqq")
+DROPPED = -1
+
+
+def _route_id_bytes(route_id) -> bytes:
+    return route_id.bytes if isinstance(route_id, UUID) else UUID(route_id).bytes
+
+
+class WayPointLog:
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 64 * 1024 * 1024,
+        flush_records: int = 1024,
+        flush_interval_seconds: float = 0.05,
+    ):
+        self.directory = directory
+        self.segment_records = segment_bytes // RECORD.size
+        self.flush_records = flush_records
+        self.flush_interval_seconds = flush_interval_seconds
+        self._lock = threading.Lock()
+        self._segment = None
+        self._segment_number = 0
+        self._snapshot_number = 0
+        # route ids with records in each segment, routes kept in snapshots
+        # and those of them kept as dropped
+        self._segment_routes = {}
+        self._snapshot_routes = set()
+        self._dropped_routes = set()
+        self._flush_timer = None
+        os.makedirs(directory, exist_ok=True)
+
+    # Writing
+
+    def log_route(self, route: Route):
+        records = np.zeros(1, dtype=RECORD_DTYPE)
+        records["type"] = CREATE
+        records["value"] = route.created.toordinal()
+        self._write(_route_id_bytes(route.route_id), records)
+
+    def log_way_points(self, route: Route, way_points, created: datetime.datetime):
+        coordinates = np.array(way_points, dtype="<f8").reshape(-1, 2)
+        records = np.zeros(len(coordinates), dtype=RECORD_DTYPE)
+        records["type"] = WAY_POINT
+        records["lat"] = coordinates[:, 0]
+        records["lon"] = coordinates[:, 1]
+        records["value"] = to_timestamp(created)
+        self._write(_route_id_bytes(route.route_id), records)
+
+    def _write(self, route_id: bytes, records: np.ndarray):
+        records["route_id"] = np.frombuffer(route_id, dtype="V16")[0]
+        with self._lock:
+            while len(records):
+                segment = self._segment
+                if segment is None or segment.records == self.segment_records:
+                    segment = self._open_segment()
+                chunk = records[: self.segment_records - segment.records]
+                records = records[len(chunk) :]
+                offset = segment.records * RECORD.size
+                data = chunk.tobytes()
+                # The first type byte goes last, so a torn batch
+                # reads as the end of the log
+                segment.map[offset + 1 : offset + len(data)] = data[1:]
+                segment.map[offset] = data[0]
+                segment.records += len(chunk)
+                self._segment_routes[segment.path].add(route_id)
+                segment.maybe_flush(
+                    len(chunk), self.flush_records, self.flush_interval_seconds
+                )
+            if self._segment.unflushed and self._flush_timer is None:
+                self._flush_timer = threading.Timer(
+                    self.flush_interval_seconds, self._flush_later
+                )
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def _flush_later(self):
+        with self._lock:
+            self._flush_timer = None
+            if self._segment is not None and self._segment.unflushed:
+                self._segment.flush()
+
+    def _open_segment(self):
+        self._close_segment()
+        self._segment_number += 1
+        path = os.path.join(self.directory, f"segment-{self._segment_number:08d}.log")
+        self._segment = _Segment(path, self.segment_records * RECORD.size)
+        self._segment_routes[path] = set()
+        return self._segment
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def flush(self):
+        with self._lock:
+            if self._segment is not None:
+                self._segment.flush()
+
+    def close(self):
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            self._close_segment()
+
+    # Recovery
+
+    def replay(self, routes: dict, skip=None):
+        """
+        Rebuild routes from snapshots and segments into the `routes` dict,
+        but those for which skip(route_id, created) is true
+        """
+        skip = skip or (lambda route_id, created: False)
+        with self._lock:
+            for number, path in self._files("snapshot-", ".snap"):
+                self._snapshot_number = max(self._snapshot_number, number)
+                self._snapshot_routes.update(self._replay_snapshot(path, routes, skip))
+            for number, path in self._files("segment-", ".log"):
+                self._segment_number = max(self._segment_number, number)
+                self._segment_routes[path] = self._replay_segment(path, routes, skip)
+
+    def _files(self, prefix, suffix):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith(suffix):
+                number = int(name[len(prefix) : -len(suffix)])
+                files.append((number, os.path.join(self.directory, name)))
+        return sorted(files)
+
+    def _replay_snapshot(self, path, routes, skip):
+        route_ids = set()
+        with open(path, "rb") as file:
+            while True:
+                header = file.read(SNAPSHOT_HEADER.size)
+                if not header:
+                    break
+                route_id, created, count = SNAPSHOT_HEADER.unpack(header)
+                route_ids.add(route_id)
+                if count == DROPPED:
+                    routes.pop(UUID(bytes=route_id), None)
+                    self._dropped_routes.add(route_id)
+                    continue
+                self._dropped_routes.discard(route_id)
+                route = _new_route(route_id, created)
+                if skip(route.route_id, route.created):
+                    # lats, lons and timestamps
+                    file.seek(3 * 8 * count, os.SEEK_CUR)
+                    routes.pop(route.route_id, None)
+                    continue
+                for values in (route.lats, route.lons, route.timestamps):
+                    values.frombytes(file.read(count * values.itemsize))
+                routes[route.route_id] = route
+        return route_ids
+
+    def _replay_segment(self, path, routes, skip):
+        with open(path, "rb") as file:
+            data = file.read()
+        records = np.frombuffer(data, dtype=RECORD_DTYPE)
+        empty = np.flatnonzero(records["type"] == 0)
+        if empty.size:
+            records = records[: empty[0]]
+
+        for record in records[records["type"] == CREATE]:
+            route_id = bytes(record["route_id"])
+            if route_id not in self._snapshot_routes:
+                route = _new_route(route_id, int(record["value"]))
+                if not skip(route.route_id, route.created):
+                    routes[route.route_id] = route
+
+        way_points = records[records["type"] == WAY_POINT]
+        route_ids, inverse = np.unique(way_points["route_id"], return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.cumsum(np.bincount(inverse, minlength=len(route_ids)))
+        start = 0
+        for route_id, stop in zip(route_ids, bounds):
+            route_id = bytes(route_id)
+            selected = way_points[order[start:stop]]
+            start = stop
+            if route_id in self._snapshot_routes:
+                continue
+            route = routes.get(UUID(bytes=route_id))
+            if route is None:
+                continue
+            route.lats.frombytes(selected["lat"].tobytes())
+            route.lons.frombytes(selected["lon"].tobytes())
+            route.timestamps.frombytes(selected["value"].tobytes())
+
+        return {bytes(route_id) for route_id in np.unique(records["route_id"])}
+
+    # Compaction
+
+    def compact(self, routes: dict):
+        """
+        Move closed routes into a snapshot, merged with the previous
+        snapshots, and delete the segments that only hold closed routes
+        """
+        today = datetime.date.today()
+
+        def closed(route_id):
+            route = routes.get(UUID(bytes=route_id))
+            return route is None or route.created != today
+
+        with self._lock:
+            self._close_segment()
+            segments = [
+                path
+                for path, route_ids in self._segment_routes.items()
+                if all(closed(route_id) for route_id in route_ids)
+            ]
+            snapshots = self._files("snapshot-", ".snap")
+            route_ids = self._snapshot_routes.union(
+                *(self._segment_routes[path] for path in segments)
+            )
+            kept = {
+                route_id for route_id in route_ids if UUID(bytes=route_id) in routes
+            }
+            # Routes left out are only kept as dropped while segments hold them
+            remaining = set().union(
+                *(
+                    segment_route_ids
+                    for path, segment_route_ids in self._segment_routes.items()
+                    if path not in segments
+                )
+            )
+            dropped = (route_ids - kept) & remaining
+            if (
+                not segments
+                and kept == self._snapshot_routes - self._dropped_routes
+                and dropped == self._dropped_routes
+                and len(snapshots) < 2
+            ):
+                return
+
+            if kept or dropped:
+                self._write_snapshot(
+                    [routes[UUID(bytes=route_id)] for route_id in sorted(kept)],
+                    sorted(dropped),
+                )
+            self._snapshot_routes = kept | dropped
+            self._dropped_routes = dropped
+
+            for _, path in snapshots:
+                os.remove(path)
+            for path in segments:
+                os.remove(path)
+                del self._segment_routes[path]
+
+    def _write_snapshot(self, routes, dropped=()):
+        self._snapshot_number += 1
+        path = os.path.join(
+            self.directory, f"snapshot-{self._snapshot_number:08d}.snap"
+        )
+        with open(path + ".tmp", "wb") as file:
+            for route in routes:
+                file.write(
+                    SNAPSHOT_HEADER.pack(
+                        _route_id_bytes(route.route_id),
+                        route.created.toordinal(),
+                        len(route.lats),
+                    )
+                )
+                for values in (route.lats, route.lons, route.timestamps):
+                    values.tofile(file)
+            for route_id in dropped:
+                file.write(SNAPSHOT_HEADER.pack(route_id, 0, DROPPED))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+
+    def clear(self):
+        with self._lock:
+            self._close_segment()
+            for name in os.listdir(self.directory):
+                if name.startswith(("segment-", "snapshot-")):
+                    os.remove(os.path.join(self.directory, name))
+            self._segment_routes.clear()
+            self._snapshot_routes.clear()
+            self._dropped_routes.clear()
+
+
+class _Segment:
+    def __init__(self, path, size):
+        self.path = path
+        self.records = 0
+        self._file = open(path, "w+b")
+        self._file.truncate(size)
+        self.map = mmap.mmap(self._file.fileno(), size)
+        self._flushed_offset = 0
+        self.unflushed = 0
+        self._flushed_at = time.monotonic()
+
+    def maybe_flush(self, records, flush_records, flush_interval_seconds):
+        self.unflushed += records
+        if (
+            self.unflushed >= flush_records
+            or time.monotonic() - self._flushed_at >= flush_interval_seconds
+        ):
+            self.flush()
+
+    def flush(self):
+        # msync needs a page aligned offset
+        start = self._flushed_offset - self._flushed_offset % mmap.PAGESIZE
+        stop = self.records * RECORD.size
+        if stop > start:
+            self.map.flush(start, stop - start)
+        self._flushed_offset = stop
+        self.unflushed = 0
+        self._flushed_at = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.map.close()
+        self._file.close()
+
+
+def _new_route(route_id: bytes, created: int) -> Route:
+    route = Route(route_id=UUID(bytes=route_id))
+    route.created = datetime.date.fromordinal(created)
+    return route
@@ -1 +1 @@
-exec gunicorn main:app -b 0.0.0.0:8000 -w 1 -k uvicorn.workers.UvicornWorker
\ No newline at end of file
+exec gunicorn main:app -b 0.0.0.0:8000 -w ${WORKERS:-1} -k uvicorn.workers.UvicornWorker
\ No newline at end of file
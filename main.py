@@ -3,13 +3,49 @@ from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 
 
+from api import admin, metrics
 from api.v1 import router
-from core.excpetions import RouteException
+from core import config
+from core.excpetions import (
+    IngestQueueFullException,
+    RouteException,
+    ServerBusyException,
+)
+from core.finalizer import route_finalizer
+from core.ingest import ingest_queue
+from core.metrics import MetricsMiddleware
+from core.offload import compute_pool
+from core.profiling import ProfilingMiddleware
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 app: FastAPI = FastAPI()
 app.include_router(router)
+app.include_router(admin.router)
+app.include_router(metrics.router)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+
+@app.on_event("startup")
+def start_finalizer():
+    if config.FINALIZER_ENABLED:
+        route_finalizer.start()
+
+
+@app.on_event("shutdown")
+def stop_finalizer():
+    route_finalizer.stop()
+
+
+@app.on_event("shutdown")
+async def stop_ingest_queue():
+    await ingest_queue.stop()
+
+
+@app.on_event("shutdown")
+def stop_compute_pool():
+    compute_pool.shutdown()
 
 
 @app.exception_handler(ValueError)
@@ -28,5 +64,25 @@ async def unicorn_exception_handler(request: Request, exc: RouteException):
     )
 
 
+@app.exception_handler(ServerBusyException)
+async def server_busy_exception_handler(request: Request, exc: ServerBusyException):
+    return JSONResponse(
+        status_code=503,
+        content={"message": exc.args},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(IngestQueueFullException)
+async def ingest_queue_full_exception_handler(
+    request: Request, exc: IngestQueueFullException
+):
+    return JSONResponse(
+        status_code=429,
+        content={"message": exc.args},
+        headers={"Retry-After": "1"},
+    )
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1,13 +1,30 @@
+import asyncio
 import datetime
+import marshal
+import struct
+import time
+from collections import deque
+import json
 from datetime import timedelta
+from decimal import Decimal
 from http import HTTPStatus
 from uuid import UUID
 
+import numpy as np
+import pytest
+from fastapi.encoders import jsonable_encoder
 from fastapi.testclient import TestClient
 from freezegun import freeze_time
+from starlette.websockets import WebSocketDisconnect
 
+import api.v1
+from core import config, crud, geometry, profiling
 from core.database import get_routes_db
-from core.models import Route
+from core.geodesic import geodesic_lengths_km
+from core.ingest import ingest_queue
+from core.models import Route, to_decimal
+from core.offload import compute_pool
+from core.util import round_
 from main import app
 
 client = TestClient(app)
@@ -31,14 +48,24 @@ def make_add_way_point_request(
     )
 
 
-def make_calculate_length_request(uuid: UUID = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"):
-    return client.get(f"/route/{uuid}/length/")
+def make_add_way_points_request(way_points):
+    return client.post("/route/way_points/", json={"way_points": way_points})
+
+
+def make_calculate_length_request(
+    uuid: UUID = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e", **params
+):
+    return client.get(f"/route/{uuid}/length/", params=params)
 
 
 def make_calculate_longest_paths_request(
-    uuid: UUID = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e",
+    uuid: UUID = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e", **params
 ):
-    return client.get(f"/route/{uuid}/longest_paths/")
+    return client.get(f"/route/{uuid}/longest_paths/", params=params)
+
+
+def make_query_request(route_ids, **params):
+    return client.post("/route/query/", json={"route_ids": route_ids, **params})
 
 
 def test_create_route():
@@ -67,6 +94,131 @@ def test_add_way_point__route_does_not_exist():
     assert response.json() == {"message": ["Route does not already exist!"]}
 
 
+def test_add_way_point__ingest_queue(monkeypatch):
+    monkeypatch.setattr(ingest_queue, "enabled", True)
+    monkeypatch.setattr(ingest_queue, "sync_ack", True)
+    make_route_request()
+    response = make_add_way_point_request()
+    assert response.status_code == HTTPStatus.CREATED
+    assert response.json() == {"message": "success"}
+    assert (
+        get_routes_db()
+        .get(UUID("e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"))
+        .way_point_count
+        == 1
+    )
+
+    response = make_add_way_point_request(uuid="b2bd3e1b-ef4b-4fe8-b2e5-5a5d6a5a3e39")
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert response.json() == {"message": ["Route does not already exist!"]}
+
+
+def test_add_way_point__ingest_queue_async(monkeypatch):
+    monkeypatch.setattr(ingest_queue, "enabled", True)
+    monkeypatch.setattr(ingest_queue, "max_size", 1)
+    make_route_request()
+    response = make_add_way_point_request()
+    assert response.status_code == HTTPStatus.ACCEPTED
+    assert response.json() == {"message": "accepted"}
+
+    response = make_add_way_point_request()
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert response.json() == {"message": ["Too many way points are queued!"]}
+    assert response.headers["retry-after"] == "1"
+
+    asyncio.get_event_loop().run_until_complete(ingest_queue.stop())
+    assert (
+        get_routes_db()
+        .get(UUID("e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"))
+        .way_point_count
+        == 1
+    )
+
+
+def test_stream_way_points():
+    make_route_request()
+    uuid = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    with client.websocket_connect(
+        f"/route/{uuid}/way_points/stream/?ack_window=2"
+    ) as websocket:
+        websocket.send_text("[[50.1, 20.1], [50.2, 20.2]]")
+        websocket.send_bytes(struct.pack("<4d", 50.3, 20.3, 91, 0))
+        assert websocket.receive_json() == {"received": 4, "appended": 3}
+        websocket.send_text("[[50.4, 20.4]]")
+        websocket.send_text("[]")
+        assert websocket.receive_json() == {"received": 5, "appended": 4}
+
+    route = get_routes_db().get(UUID(uuid))
+    assert list(route.lats) == [50.1, 50.2, 50.3, 50.4]
+    assert len(route.path_lengths_um) == 3
+
+
+@pytest.mark.parametrize(
+    "frame, code, message",
+    [
+        ("[[50.1, 20.1]", 1003, "Text frames are JSON arrays of [lat, lon] pairs!"),
+        (None, 1008, "This route is already closed!"),
+    ],
+)
+def test_stream_way_points__closed(frame, code, message):
+    make_route_request()
+    uuid = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    if frame is None:
+        get_routes_db().get(UUID(uuid)).created -= timedelta(days=1)
+    with client.websocket_connect(f"/route/{uuid}/way_points/stream/") as websocket:
+        if frame is not None:
+            websocket.send_text(frame)
+        assert websocket.receive_json() == {"message": [message]}
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            websocket.receive_json()
+    assert exc_info.value.code == code
+
+
+def test_add_way_points():
+    make_route_request()
+    response = make_add_way_points_request(
+        [
+            {
+                "route_id": "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e",
+                "lat": "11.11",
+                "lon": "0.13",
+            },
+            {
+                "route_id": "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e",
+                "lat": "91",
+                "lon": "0.13",
+            },
+            {
+                "route_id": "e84fee1e-fd4f-40f6-85b5-52ff46cccc6e",
+                "lat": "11.11",
+                "lon": "0.13",
+            },
+        ]
+    )
+    assert response.status_code == HTTPStatus.CREATED
+    assert response.json() == {
+        "results": [
+            {"status": 201, "message": "success"},
+            {"status": 422, "message": ["Invalid way point coordinates!"]},
+            {"status": 422, "message": ["Route does not already exist!"]},
+        ]
+    }
+
+
+def test_add_way_points__too_many():
+    make_route_request()
+    way_point = {
+        "route_id": "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e",
+        "lat": "11.11",
+        "lon": "0.13",
+    }
+    response = make_add_way_points_request(
+        [way_point] * (config.MAX_BATCH_WAY_POINTS + 1)
+    )
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert get_routes_db()[UUID(way_point["route_id"])].way_point_count == 0
+
+
 def test_calculate_length():
     with freeze_time("2021-01-01 12:00:00"):
         make_route_request()
@@ -109,3 +261,462 @@ def test_calculate_longest_paths():
             },
         ]
     }
+
+
+def test_calculate_longest_paths__pruned(monkeypatch):
+    monkeypatch.setattr(crud.config, "INGEST_STATISTICS", False)
+    with freeze_time("2021-01-01 12:00:00"):
+        make_route_request()
+        for i in range(20):
+            lat = "50.5" if i == 10 else f"50.{i:03d}"
+            make_add_way_point_request(lat=lat, lon="20")
+    route = get_routes_db().get(UUID("e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"))
+
+    response = make_calculate_longest_paths_request()
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        "longest_paths": [
+            {
+                "km": 54.615876395,
+                "start": {"lat": 50.009, "lon": 20.0},
+                "stop": {"lat": 50.5, "lon": 20.0},
+            }
+        ]
+    }
+    assert len(route.path_lengths_um) == 0
+    assert "longest_paths" in route.responses
+
+    response = make_calculate_length_request()
+    assert response.status_code == HTTPStatus.OK
+    assert len(route.path_lengths_um) == 19
+    assert route.longest_paths == [
+        {
+            "km": Decimal("54.615876395"),
+            "start": {"lat": Decimal("50.009"), "lon": Decimal("20.0")},
+            "stop": {"lat": Decimal("50.5"), "lon": Decimal("20.0")},
+        }
+    ]
+
+
+def test_calculate_length__etag(monkeypatch):
+    with freeze_time("2021-01-01 12:00:00"):
+        make_route_request()
+        for lat, lon in [("50.11", "20.13"), ("11.11", "0.13")]:
+            make_add_way_point_request(lat=lat, lon=lon)
+    response = make_calculate_length_request()
+    etag = response.headers["etag"]
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {"km": 4697.898349346}
+    assert response.headers["cache-control"] == "public, max-age=86400, immutable"
+
+    # Served from the cached body, the route data is not read again
+    monkeypatch.setattr(crud, "get_route_length_km", None)
+    response = make_calculate_length_request(live=True)
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {"km": 4697.898349346}
+    assert response.headers["etag"] == etag
+
+    response = client.get(
+        "/route/e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e/length/",
+        headers={"If-None-Match": f'"other", W/{etag}'},
+    )
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+
+def test_calculate_longest_paths__etag():
+    with freeze_time("2021-01-01 12:00:00"):
+        make_route_request()
+        for lat, lon in [("50.11", "20.13"), ("11.11", "0.13")]:
+            make_add_way_point_request(lat=lat, lon=lon)
+    response = make_calculate_longest_paths_request()
+    etag = response.headers["etag"]
+    assert etag != make_calculate_length_request().headers["etag"]
+
+    response = client.get(
+        "/route/e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e/longest_paths/",
+        headers={"If-None-Match": etag},
+    )
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+
+def test_calculate_length__open_route_not_cached():
+    make_route_request()
+    for lat, lon in [("50.11", "20.13"), ("11.11", "0.13")]:
+        make_add_way_point_request(lat=lat, lon=lon)
+    response = make_calculate_length_request(live=True)
+    assert response.status_code == HTTPStatus.OK
+    assert "etag" not in response.headers
+
+
+def test_calculate_length__open_route():
+    make_route_request()
+    make_add_way_point_request()
+    response = make_calculate_length_request()
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert response.json() == {"message": ["This route is still open!"]}
+
+
+def test_calculate_length__live():
+    make_route_request()
+    for lat, lon in [
+        ("-25.4025905", "-49.3124416"),
+        (" -23.559798", "-46.634971"),
+        (" 59.3258414", "17.70188"),
+    ]:
+        make_add_way_point_request(lat=lat, lon=lon)
+    response = make_calculate_length_request(live="true")
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {"km": 11229.217533887}
+
+    make_add_way_point_request(lat="54.273901", lon="18.591889")
+    response = make_calculate_length_request(live="true")
+    assert response.json() == {"km": 11794.389755872}
+
+
+def test_calculate_longest_paths__live():
+    make_route_request()
+    for lat, lon in [
+        (" -23.559798", "-46.634971"),
+        (" 59.3258414", "17.70188"),
+    ]:
+        make_add_way_point_request(lat=lat, lon=lon)
+    response = make_calculate_longest_paths_request(live="true")
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        "longest_paths": [
+            {
+                "km": 10889.633473117,
+                "start": {"lat": -23.559798, "lon": -46.634971},
+                "stop": {"lat": 59.3258414, "lon": 17.70188},
+            },
+        ]
+    }
+
+
+def test_get_segments():
+    with freeze_time("2021-01-01 12:00:00"):
+        make_route_request()
+        for lat, lon in [("50.11", "20.13"), ("44.11", "15.13"), ("11.11", "0.13")]:
+            make_add_way_point_request(lat=lat, lon=lon)
+    response = client.get(
+        "/route/e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e/segments/",
+        params={"top": 1, "min_km": "100"},
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        "segments": [
+            {
+                "index": 1,
+                "km": 3931.188786699,
+                "start": {"lat": 44.11, "lon": 15.13},
+                "stop": {"lat": 11.11, "lon": 0.13},
+            }
+        ],
+        "next_offset": None,
+    }
+
+    response = client.get(
+        "/route/e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e/segments/", params={"top": 0}
+    )
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_get_segments__pages(monkeypatch):
+    monkeypatch.setattr(config, "SEGMENTS_PAGE_SIZE", 1)
+    with freeze_time("2021-01-01 12:00:00"):
+        make_route_request()
+        for lat, lon in [("50.11", "20.13"), ("44.11", "15.13"), ("11.11", "0.13")]:
+            make_add_way_point_request(lat=lat, lon=lon)
+
+    pages, offset = [], 0
+    while offset is not None:
+        response = client.get(
+            "/route/e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e/segments/",
+            params={"min_km": "0", "offset": offset},
+        )
+        assert response.status_code == HTTPStatus.OK
+        pages.append([segment["index"] for segment in response.json()["segments"]])
+        offset = response.json()["next_offset"]
+    assert pages == [[1], [0]]
+
+
+def test_search_routes():
+    make_route_request()
+    for lat, lon in [("50.0", "19.9"), ("50.0", "20.1")]:
+        make_add_way_point_request(lat=lat, lon=lon)
+
+    response = client.get(
+        "/route/search/",
+        params={"min_lat": 49.99, "min_lon": 19.99, "max_lat": 50.01, "max_lon": 20.01},
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {"route_ids": ["e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"]}
+
+    response = client.get(
+        "/route/search/", params={"lat": 10, "lon": 10, "radius_km": 5}
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {"route_ids": []}
+
+    response = client.get("/route/search/", params={"lat": 10, "lon": 10})
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_get_geometry():
+    make_route_request()
+    for lat, lon in [("38.5", "-120.2"), ("40.7", "-120.95"), ("43.252", "-126.453")]:
+        make_add_way_point_request(lat=lat, lon=lon)
+    url = "/route/e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e/geometry/"
+
+    response = client.get(url)
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"] == "application/vnd.google.polyline"
+    assert response.content == b"_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+    response = client.get(url, headers={"Accept": "application/octet-stream"})
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"] == "application/octet-stream"
+    assert geometry.decode_packed(response.content) == [
+        (38.5, -120.2),
+        (40.7, -120.95),
+        (43.252, -126.453),
+    ]
+
+    response = client.get(url, headers={"Accept": "application/json"})
+    assert response.status_code == HTTPStatus.NOT_ACCEPTABLE
+
+    response = client.get(
+        "/route/e84fee1e-fd4f-40f6-85b5-52ff46cccc6e/geometry/", params={"precision": 6}
+    )
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert response.json() == {"message": ["Route does not exist!"]}
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_calculate_length__same_json_as_decimal_rounding(seed):
+    # Random short and long paths, some of them repeated
+    rng = np.random.default_rng(seed)
+    lats = np.round(rng.uniform(-60, 60, 200), 7)
+    lons = np.round(rng.uniform(-180, 180, 200), 7)
+    lats[100:110] = lats[0]
+    lons[100:110] = lons[0]
+    lats[150:] = lats[100] + np.cumsum(rng.normal(0, 1e-5, 50))
+    lons[150:] = lons[100]
+    lats, lons = lats.tolist(), lons.tolist()
+    with freeze_time("2021-01-01 12:00:00"):
+        make_route_request()
+        make_add_way_points_request(
+            [
+                {
+                    "route_id": "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e",
+                    "lat": repr(lat),
+                    "lon": repr(lon),
+                }
+                for lat, lon in zip(lats, lons)
+            ]
+        )
+
+    lengths_km = [round_(Decimal(km)) for km in geodesic_lengths_km(lats, lons)]
+    longest_km = max(lengths_km)
+    expected = {
+        "length": {"km": sum(lengths_km)},
+        "longest_paths": {
+            "longest_paths": [
+                {
+                    "km": km,
+                    "start": {"lat": to_decimal(lats[i]), "lon": to_decimal(lons[i])},
+                    "stop": {
+                        "lat": to_decimal(lats[i + 1]),
+                        "lon": to_decimal(lons[i + 1]),
+                    },
+                }
+                for i, km in enumerate(lengths_km)
+                if km == longest_km
+            ]
+        },
+    }
+    for name, content in expected.items():
+        response = client.get(f"/route/e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e/{name}/")
+        assert (
+            response.content
+            == json.dumps(jsonable_encoder(content), separators=(",", ":")).encode()
+        )
+
+
+def test_query_routes():
+    missing = "00000000-0000-0000-0000-000000000000"
+    with freeze_time("2021-01-01 12:00:00"):
+        make_route_request()
+        for lat, lon in [("50.11", "20.13"), ("11.11", "0.13")]:
+            make_add_way_point_request(lat=lat, lon=lon)
+    response = make_query_request(
+        ["e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e", missing], longest_paths=True
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {
+            "route_id": "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e",
+            "status": 200,
+            "km": 4697.898349346,
+            "longest_paths": [
+                {
+                    "km": 4697.898349346,
+                    "start": {"lat": 50.11, "lon": 20.13},
+                    "stop": {"lat": 11.11, "lon": 0.13},
+                }
+            ],
+        },
+        {"route_id": missing, "status": 422, "message": ["Route does not exist!"]},
+    ]
+
+
+def test_query_routes__server_busy(monkeypatch):
+    calculated = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    uncalculated = "b2bd3e1b-ef4b-4fe8-b2e5-5a5d6a5a3e39"
+    with freeze_time("2021-01-01 12:00:00"):
+        for route_id in (calculated, uncalculated):
+            make_route_request(route_id)
+            route = get_routes_db().get(UUID(route_id))
+            for lat, lon in [(50.11, 20.13), (11.11, 0.13)]:
+                route.append_way_point(lat, lon)
+    make_query_request([calculated])
+    monkeypatch.setattr(compute_pool, "max_pending", 0)
+    monkeypatch.setattr(compute_pool, "min_way_points", 0)
+
+    response = make_query_request([calculated, uncalculated])
+    assert response.status_code == HTTPStatus.OK
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"route_id": calculated, "status": 200, "km": 4697.898349346},
+        {
+            "route_id": uncalculated,
+            "status": 503,
+            "message": ["Too many routes are being calculated!"],
+        },
+    ]
+
+
+def test_calculate_length__server_busy(monkeypatch):
+    with freeze_time("2021-01-01 12:00:00"):
+        make_route_request()
+        route = get_routes_db().get(UUID("e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"))
+        for lat, lon in [(11.11, 0.13), (50.11, 20.13)]:
+            route.append_way_point(lat, lon)
+    monkeypatch.setattr(compute_pool, "max_pending", 0)
+    monkeypatch.setattr(compute_pool, "min_way_points", 0)
+    response = make_calculate_length_request()
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert response.json() == {"message": ["Too many routes are being calculated!"]}
+
+
+def test_finalizer_status():
+    response = client.get("/admin/finalizer/")
+    assert response.status_code == HTTPStatus.OK
+    assert set(response.json()) == {
+        "running",
+        "runs",
+        "finalized",
+        "failed",
+        "backlog",
+        "last_run",
+    }
+
+
+@pytest.fixture
+def profiling_captures(monkeypatch):
+    monkeypatch.setattr(profiling, "captures", deque(maxlen=4))
+    return profiling.captures
+
+
+def test_profiles__disabled(profiling_captures):
+    profiling_captures.append({"id": 1, "pstats": b"", "collapsed": None})
+    for path in ("/admin/profiles/", "/admin/profiles/1/pstats"):
+        response = client.get(path)
+        assert response.status_code == HTTPStatus.NOT_FOUND
+        assert response.json() == {"message": ["No such profile!"]}
+
+
+def test_profile__cprofile(monkeypatch, profiling_captures):
+    monkeypatch.setattr(config, "PROFILE_HEADER_ENABLED", True)
+    make_route_request()
+    make_add_way_point_request(lat="50.1")
+    make_add_way_point_request(lat="50.2")
+    response = client.get(
+        "/route/e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e/length/",
+        params={"live": True},
+        headers={"X-Profile": "1"},
+    )
+    assert response.status_code == HTTPStatus.OK
+
+    response = client.get("/admin/profiles/")
+    assert response.status_code == HTTPStatus.OK
+    (capture,) = response.json()["profiles"]
+    assert capture["path"] == "/route/e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e/length/"
+    assert (capture["status"], capture["way_points"]) == (200, 2)
+    assert "route_serialization_seconds" not in capture["stages"]
+    assert capture["formats"] == ["pstats"]
+
+    response = client.get(f"/admin/profiles/{capture['id']}/pstats")
+    assert response.status_code == HTTPStatus.OK
+    stats = marshal.loads(response.content)
+    assert any(function == "get_route_length_km" for _, _, function in stats)
+    response = client.get(f"/admin/profiles/{capture['id']}/collapsed")
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_profile__sampling(monkeypatch, profiling_captures):
+    monkeypatch.setattr(config, "PROFILE_HEADER_ENABLED", True)
+    monkeypatch.setattr(config, "PROFILE_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(config, "PROFILE_MODE", "sampling")
+    monkeypatch.setattr(config, "PROFILE_SAMPLING_SECONDS", 0.001)
+    create_route = crud.create_route
+    monkeypatch.setattr(
+        crud,
+        "create_route",
+        lambda route_id: time.sleep(0.05) or create_route(route_id),
+    )
+    make_route_request()
+
+    (capture,) = profiling_captures
+    assert capture["way_points"] is None
+    response = client.get(f"/admin/profiles/{capture['id']}/collapsed")
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"].startswith("text/plain")
+    assert f"create_route ({api.v1.__file__}:" in response.text
+
+
+def test_profile__slow_request(monkeypatch, profiling_captures):
+    monkeypatch.setattr(config, "PROFILE_HEADER_ENABLED", True)
+    monkeypatch.setattr(config, "PROFILE_SLOW_REQUEST_SECONDS", 1e-9)
+    with freeze_time("2021-01-01 12:00:00"):
+        make_route_request()
+        make_add_way_point_request(lat="50.1")
+        make_add_way_point_request(lat="50.2")
+    profiling_captures.clear()
+    make_calculate_length_request()
+
+    (capture,) = profiling_captures
+    assert (capture["way_points"], capture["pstats"], capture["collapsed"]) == (
+        2,
+        None,
+        None,
+    )
+    assert set(capture["stages"]) == {
+        "route_longest_paths_seconds",
+        "route_serialization_seconds",
+    }
+
+
+def test_metrics():
+    make_route_request()
+    make_calculate_length_request()
+    response = client.get("/metrics")
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert (
+        'http_request_duration_seconds_count{method="GET",'
+        'route="/route/{route_id}/length/",status="422"}'
+    ) in response.text
+    assert "\nroutes 1\n" in response.text
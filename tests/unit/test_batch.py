@@ -0,0 +1,162 @@
+import datetime
+import io
+import json
+from uuid import UUID
+
+import numpy as np
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+import cli
+from core import batch, crud
+from core.database import get_routes_db
+
+UUID_1 = UUID("e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e")
+UUID_2 = UUID("b2bd3e1b-ef4b-4fe8-b2e5-5a5d6a5a3e39")
+UUID_3 = UUID("2c1dc3fc-44e5-4d6b-a1d4-5b3f1c3e2a11")
+
+
+@pytest.fixture
+def way_points():
+    rng = np.random.default_rng(0)
+    lats = (50 + np.cumsum(rng.normal(0, 0.01, 40))).tolist()
+    lons = (20 + np.cumsum(rng.normal(0, 0.01, 40))).tolist()
+    return (
+        [(UUID_1, lat, lon) for lat, lon in zip(lats[:30], lons[:30])]
+        + [(UUID_2, 91.0, 20.0), (UUID_2, 50.0, 20.0)]
+        + [(UUID_3, lat, lon) for lat, lon in zip(lats[30:], lons[30:])]
+    )
+
+
+def write_csv(way_points):
+    return "route_id,lat,lon\n" + "".join(
+        f"{route_id},{lat!r},{lon!r}\n" for route_id, lat, lon in way_points
+    )
+
+
+def write_ndjson(way_points):
+    return "".join(
+        json.dumps({"route_id": str(route_id), "lat": lat, "lon": lon}) + "\n"
+        for route_id, lat, lon in way_points
+    )
+
+
+@pytest.mark.parametrize(
+    "file_format, write", [("csv", write_csv), ("ndjson", write_ndjson)]
+)
+@pytest.mark.parametrize("workers", [0, 2])
+def test_calculate_file(way_points, file_format, write, workers):
+    output_file = io.StringIO()
+    summary = batch.calculate_file(
+        io.StringIO(write(way_points)), output_file, file_format, workers
+    )
+    assert (summary.routes, summary.way_points, summary.rejected) == (3, 42, 1)
+
+    results = [json.loads(line) for line in output_file.getvalue().splitlines()]
+    assert [result["route_id"] for result in results] == [
+        str(UUID_1),
+        str(UUID_2),
+        str(UUID_3),
+    ]
+    assert results[1]["message"] == ["Not enough way points in this route!"]
+
+    for route_id in (UUID_1, UUID_3):
+        crud.create_route(route_id)
+    crud.add_way_points_to_routes(
+        way_point for way_point in way_points if way_point[0] != UUID_2
+    )
+    for route_id, result in zip((UUID_1, UUID_3), (results[0], results[2])):
+        get_routes_db().get(route_id).created -= datetime.timedelta(days=1)
+        assert result == jsonable_encoder(
+            {
+                "route_id": route_id,
+                "km": crud.get_route_length_km(route_id),
+                "longest_paths": crud.get_route_longest_paths(route_id),
+            }
+        )
+
+
+def test_calculate_file__tasks(monkeypatch, way_points):
+    monkeypatch.setattr(batch, "TASK_WAY_POINTS", 5)
+    calculated = []
+    calculate_routes = batch.calculate_routes
+    monkeypatch.setattr(
+        batch,
+        "calculate_routes",
+        lambda routes: calculated.append(len(routes)) or calculate_routes(routes),
+    )
+    output_file = io.StringIO()
+    batch.calculate_file(io.StringIO(write_csv(way_points)), output_file, "csv", 0)
+    assert calculated == [1, 2]
+    assert len(output_file.getvalue().splitlines()) == 3
+
+
+def test_calculate_file__bad_header():
+    with pytest.raises(ValueError) as exc_info:
+        batch.calculate_file(io.StringIO("route,lat,lon\n"), io.StringIO(), "csv", 0)
+    assert exc_info.value.args == ("CSV files need route_id, lat and lon columns!",)
+
+
+@pytest.mark.parametrize(
+    "file_format, write, line, message",
+    [
+        ("csv", write_csv, f"{UUID_1},50\n", "Line 44: missing columns!"),
+        (
+            "csv",
+            write_csv,
+            f"{UUID_3},north,20\n",
+            "Line 44: invalid route_id, lat or lon!",
+        ),
+        (
+            "ndjson",
+            write_ndjson,
+            '{"lat": 50}\n',
+            "Line 43: not a route_id, lat and lon object!",
+        ),
+    ],
+)
+def test_calculate_file__malformed(way_points, file_format, write, line, message):
+    # The line is skipped and the routes are calculated all the same
+    output_file = io.StringIO()
+    summary = batch.calculate_file(
+        io.StringIO(write(way_points) + line), output_file, file_format, 0
+    )
+    assert (summary.routes, summary.way_points, summary.malformed) == (3, 42, 1)
+    assert summary.errors == [message]
+    assert len(output_file.getvalue().splitlines()) == 3
+
+
+def test_calculate_file__split_route(way_points, monkeypatch):
+    monkeypatch.setattr(batch, "MAX_REPORTED_ERRORS", 1)
+    way_points = way_points + [(UUID_1, 50.0, 20.0), (UUID_1, 50.1, 20.0)]
+    way_points += [(UUID_2, 50.0, 20.0)]
+    output_file = io.StringIO()
+    summary = batch.calculate_file(
+        io.StringIO(write_csv(way_points)), output_file, "csv", 0
+    )
+    assert (summary.routes, summary.way_points, summary.rejected) == (3, 45, 4)
+    assert summary.errors == [
+        f"Line 44: route {UUID_1} is split, its way points must be next to each other!"
+    ]
+    results = [json.loads(line) for line in output_file.getvalue().splitlines()]
+    assert [result["route_id"] for result in results] == [
+        str(UUID_1),
+        str(UUID_2),
+        str(UUID_3),
+    ]
+
+
+def test_cli(tmp_path, capsys, way_points):
+    input_path = tmp_path / "way_points.jsonl"
+    input_path.write_text(write_ndjson(way_points))
+    output_path = tmp_path / "routes.ndjson"
+
+    assert cli.main([str(input_path), "-o", str(output_path), "--workers", "0"]) == 0
+    assert len(output_path.read_text().splitlines()) == 3
+    assert capsys.readouterr().err == (
+        "3 routes, 42 way points, 1 rejected, 0 malformed lines\n"
+    )
+
+    input_path.write_text("route_id,lat\n")
+    assert cli.main([str(input_path), "--format", "csv", "--workers", "0"]) == 1
+    assert capsys.readouterr().err == "CSV files need route_id, lat and lon columns!\n"
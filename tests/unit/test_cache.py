@@ -0,0 +1,39 @@
+from core.cache import LRUCache
+
+
+def test_lru_cache():
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put_many([("b", 2), ("c", 3)])
+
+    assert cache.get_many(["a", "b", "c"]) == [None, 2, 3]
+    assert cache.stats() == {"size": 2, "max_size": 2, "hits": 2, "misses": 1}
+
+
+def test_lru_cache__evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.put_many([("a", 1), ("b", 2)])
+    assert cache.get("a") == 1
+
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get_many(["a", "c"]) == [1, 3]
+
+
+def test_lru_cache__disabled():
+    cache = LRUCache(max_size=0)
+    cache.put("a", 1)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_lru_cache__clear():
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.get("a")
+
+    cache.clear()
+
+    assert cache.stats() == {"size": 0, "max_size": 2, "hits": 0, "misses": 0}
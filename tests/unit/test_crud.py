@@ -1,16 +1,31 @@
 import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 
+import numpy as np
 import pytest
 from freezegun import freeze_time
 
+from core import crud
 from core.crud import (
     create_route,
     add_way_point_to_route,
+    add_way_points_to_routes,
     calculate_paths_for_route,
     calculate_route_length_and_longest_paths,
+    update_route_statistics,
+    update_routes_statistics,
+    query_routes,
+    get_calculated_route_data,
+    get_route_segments,
+    get_route_length_km,
+    get_route_longest_paths,
+    search_routes_in_box,
+    search_routes_near,
 )
-from core.database import get_routes_db
+from core.database import get_routes_db, get_spatial_index
 from core.excpetions import RouteException
 from core.models import Path, WayPoint
 
@@ -111,6 +126,172 @@ def test_add_way_point_to_route__old_route():
         add_way_point_to_route(uuid, D("50.11"), D("20.13"))
 
 
+@freeze_time("2021-01-01 12:00:00")
+def test_add_way_points_to_routes():
+    uuid_1 = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    uuid_2 = "e84fee1e-fd4f-40f6-85b5-52ff46cccc6e"
+    create_route(uuid_1)
+    create_route(uuid_2)
+
+    errors = add_way_points_to_routes(
+        [
+            (uuid_1, D("11.11"), D("0.13")),
+            (uuid_2, D("50.11"), D("20.13")),
+            (uuid_1, D("50.11"), D("20.13")),
+        ]
+    )
+
+    assert errors == [None, None, None]
+    route_1 = get_routes_db().get(uuid_1)
+    route_2 = get_routes_db().get(uuid_2)
+    assert [way_point.coordinates for way_point in route_1.way_points] == [
+        (D("11.11"), D("0.13")),
+        (D("50.11"), D("20.13")),
+    ]
+    assert [way_point.coordinates for way_point in route_2.way_points] == [
+        (D("50.11"), D("20.13")),
+    ]
+
+
+def test_add_way_points_to_routes__per_item_errors():
+    uuid_open = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    uuid_closed = "e84fee1e-fd4f-40f6-85b5-52ff46cccc6e"
+    uuid_missing = "e84fee1e-fd4f-40f6-85b5-52ff46dddd6e"
+    with freeze_time("2021-01-01 12:00:00"):
+        create_route(uuid_closed)
+    create_route(uuid_open)
+
+    errors = add_way_points_to_routes(
+        [
+            (uuid_open, D("11.11"), D("0.13")),
+            (uuid_open, D("90.1"), D("0.13")),
+            (uuid_closed, D("11.11"), D("0.13")),
+            (uuid_missing, D("11.11"), D("0.13")),
+            (uuid_open, D("44.11"), D("15.13")),
+        ]
+    )
+
+    assert errors[0] is None
+    assert errors[1].args == ("Invalid way point coordinates!",)
+    assert isinstance(errors[2], RouteException)
+    assert errors[3].args == ("Route does not already exist!",)
+    assert errors[4] is None
+    assert len(get_routes_db().get(uuid_open).way_points) == 2
+    assert len(get_routes_db().get(uuid_closed).way_points) == 0
+
+
+@freeze_time("2021-01-01 12:00:00")
+def test_add_way_point_to_route__updates_statistics():
+    uuid = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    create_route(uuid)
+    route = get_routes_db().get(uuid)
+
+    add_way_point_to_route(uuid, D("44.11"), D("15.13"))
+    assert list(route.path_lengths_um) == []
+    assert route.longest_path_length_um is None
+
+    add_way_point_to_route(uuid, D("44.11"), D("15.13"))
+    assert list(route.path_lengths_um) == [0]
+    assert route.longest_path_indexes == [0]
+
+    for lat, lon in [
+        (D("50.11"), D("20.13")),
+        (D("11.11"), D("0.13")),
+        (D("50.11"), D("20.13")),
+    ]:
+        add_way_point_to_route(uuid, lat, lon)
+
+    assert list(route.path_lengths_um) == [
+        0,
+        767019406402,
+        4697898349346,
+        4697898349346,
+    ]
+    assert route.paths_length_um == 10162816105094
+    assert route.longest_path_length_um == 4697898349346
+    assert route.longest_path_indexes == [2, 3]
+
+
+@freeze_time("2021-01-01 12:00:00")
+def test_update_route_statistics__catches_up():
+    uuid = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    create_route(uuid)
+    route = get_routes_db().get(uuid)
+    for lat, lon in [
+        (D("50.11"), D("20.13")),
+        (D("11.11"), D("0.13")),
+        (D("50.11"), D("20.13")),
+    ]:
+        route.way_points.append(WayPoint(lat=lat, lon=lon))
+
+    update_route_statistics(route)
+
+    assert list(route.path_lengths_um) == [4697898349346, 4697898349346]
+    assert route.paths_length_um == 9395796698692
+    assert route.longest_path_indexes == [0, 1]
+
+
+@freeze_time("2021-01-01 12:00:00")
+def test_update_routes_statistics():
+    uuids = [
+        "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e",
+        "b2bd3e1b-ef4b-4fe8-b2e5-5a5d6a5a3e39",
+    ]
+    routes = []
+    for uuid, way_points in zip(
+        uuids,
+        [
+            [(D("50.11"), D("20.13")), (D("11.11"), D("0.13"))],
+            [
+                (D("50.11"), D("20.13")),
+                (D("11.11"), D("0.13")),
+                (D("11.11"), D("0.13")),
+            ],
+        ],
+    ):
+        create_route(uuid)
+        route = get_routes_db().get(uuid)
+        for lat, lon in way_points:
+            route.way_points.append(WayPoint(lat=lat, lon=lon))
+        routes.append(route)
+
+    update_routes_statistics(routes)
+
+    assert list(routes[0].path_lengths_um) == [4697898349346]
+    assert list(routes[1].path_lengths_um) == [4697898349346, 0]
+    assert routes[1].paths_length_um == 4697898349346
+    assert routes[1].longest_path_indexes == [0]
+
+
+def test_query_routes():
+    uuids = [
+        "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e",
+        "b2bd3e1b-ef4b-4fe8-b2e5-5a5d6a5a3e39",
+    ]
+    with freeze_time("2021-01-01 12:00:00"):
+        for uuid in uuids:
+            create_route(uuid)
+        add_way_points_to_routes(
+            [
+                (uuids[0], D("50.11"), D("20.13")),
+                (uuids[0], D("11.11"), D("0.13")),
+                (uuids[1], D("50.11"), D("20.13")),
+            ]
+        )
+    missing = "00000000-0000-0000-0000-000000000000"
+    open_ = "11111111-1111-1111-1111-111111111111"
+    create_route(open_)
+
+    results = dict(query_routes([uuids[0], missing, uuids[1], open_]))
+
+    assert list(results) == [uuids[0], missing, uuids[1], open_]
+    assert results[uuids[0]].length_km == D("4697.898349346")
+    assert len(results[uuids[0]].longest_paths) == 1
+    assert results[missing].args == ("Route does not exist!",)
+    assert results[uuids[1]].args == ("Not enough way points in this route!",)
+    assert isinstance(results[open_], RouteException)
+
+
 def test_calculate_paths_for_route():
     def check_path(path, start_lat, start_lon, stop_lat, stop_lon, length_km):
         assert path.length_km == length_km
@@ -226,3 +407,245 @@ def test_calculate_route_length_and_longest_paths__path_not_calculated():
     with pytest.raises(RouteException) as err:
         calculate_route_length_and_longest_paths(uuid)
         assert err.value == "You need to calculate paths first!"
+
+
+def test_get_route_length_km__live():
+    uuid = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    create_route(uuid)
+    route = get_routes_db().get(uuid)
+
+    assert get_route_length_km(uuid, live=True) == D("0")
+    assert get_route_longest_paths(uuid, live=True) == []
+
+    add_way_point_to_route(uuid, D("50.11"), D("20.13"))
+    add_way_point_to_route(uuid, D("44.11"), D("15.13"))
+    assert get_route_length_km(uuid, live=True) == D("767.019406402")
+
+    # Only the tail added since the last query gets measured
+    route.way_points.append(WayPoint(lat=D("44.11"), lon=D("15.13")))
+    assert get_route_length_km(uuid, live=True) == D("767.019406402")
+    assert list(route.path_lengths_um) == [767019406402, 0]
+    assert get_route_longest_paths(uuid, live=True) == [
+        {
+            "km": D("767.019406402"),
+            "start": {"lat": D("50.11"), "lon": D("20.13")},
+            "stop": {"lat": D("44.11"), "lon": D("15.13")},
+        }
+    ]
+
+
+def test_get_route_length_km__live_closed_route():
+    uuid = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    with freeze_time("2021-01-01 12:00:00"):
+        create_route(uuid)
+        add_way_point_to_route(uuid, D("50.11"), D("20.13"))
+        add_way_point_to_route(uuid, D("44.11"), D("15.13"))
+
+    assert get_route_length_km(uuid, live=True) == D("767.019406402")
+    assert get_routes_db().get(uuid).longest_paths is not None
+
+
+def test_get_route_length_km__not_live_open_route():
+    uuid = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    create_route(uuid)
+    with pytest.raises(RouteException):
+        get_route_length_km(uuid)
+
+
+def test_add_way_point_to_route__concurrent():
+    uuid = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    create_route(uuid)
+
+    def add_way_points(thread):
+        for index in range(50):
+            add_way_point_to_route(uuid, D(thread), D(index))
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(add_way_points, range(8)))
+
+    route = get_routes_db().get(uuid)
+    assert route.way_point_count == 400
+    assert len(route.path_lengths_um) == 399
+    assert route.paths_length_um == sum(route.path_lengths_um)
+
+
+def test_get_calculated_route_data__concurrent_readers(monkeypatch):
+    uuid = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    with freeze_time("2021-01-01 12:00:00"):
+        create_route(uuid)
+    route = get_routes_db().get(uuid)
+    for lat, lon in [(50.11, 20.13), (11.11, 0.13), (50.11, 20.13)]:
+        route.append_way_point(lat, lon)
+
+    calls = []
+
+    def calculate_lengths_um(lats, lons):
+        calls.append(len(lats))
+        time.sleep(0.05)
+        return crud_calculate_lengths_um(lats, lons)
+
+    crud_calculate_lengths_um = crud.calculate_lengths_um
+    monkeypatch.setattr(crud, "calculate_lengths_um", calculate_lengths_um)
+    barrier = threading.Barrier(8)
+
+    def read(_):
+        barrier.wait()
+        return get_calculated_route_data(uuid).longest_paths
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(read, range(8)))
+
+    assert calls == [3]
+    assert all(result is results[0] for result in results)
+    assert len(results[0]) == 2
+
+
+def test_get_route_segments():
+    uuid = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    with freeze_time("2021-01-01 12:00:00"):
+        create_route(uuid)
+        for lat, lon in [
+            (D("50.11"), D("20.13")),
+            (D("44.11"), D("15.13")),
+            (D("11.11"), D("0.13")),
+            (D("44.11"), D("15.13")),
+            (D("44.11"), D("15.13")),
+        ]:
+            add_way_point_to_route(uuid, lat, lon)
+
+    route = get_calculated_route_data(uuid)
+    assert route.segment_order is None
+
+    def indexes(**params):
+        return [segment["index"] for segment in get_route_segments(uuid, **params)]
+
+    assert indexes(top=3) == [1, 2, 0]
+    assert list(route.segment_order) == [1, 2, 0, 3]
+    assert indexes(top=10) == [1, 2, 0, 3]
+    assert indexes(min_km=D("767.019406402")) == [1, 2, 0]
+    assert indexes(min_km=D("767.019406403")) == [1, 2]
+    assert indexes(min_km=D("767.0194064020000001")) == [1, 2]
+    assert indexes(min_km=D("0")) == [1, 2, 0, 3]
+    assert indexes(min_km=D("10000")) == []
+    assert indexes(top=1, min_km=D("1")) == [1]
+    assert indexes(min_km=D("0"), limit=2) == [1, 2]
+    assert indexes(min_km=D("0"), offset=1, limit=2) == [2, 0]
+    assert indexes(top=3, offset=2, limit=2) == [0]
+    assert indexes(top=3, offset=5) == []
+    assert get_route_segments(uuid, top=1) == [
+        {
+            "index": 1,
+            "km": D("3931.188786699"),
+            "start": {"lat": D("44.11"), "lon": D("15.13")},
+            "stop": {"lat": D("11.11"), "lon": D("0.13")},
+        }
+    ]
+
+    with pytest.raises(ValueError):
+        get_route_segments(uuid)
+
+    # The order is rebuilt after a spill dropped it
+    route.segment_order = None
+    assert indexes(top=2) == [1, 2]
+
+
+def test_search_routes():
+    uuid_1 = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    uuid_2 = "e84fee1e-fd4f-40f6-85b5-52ff46cccc6e"
+    create_route(uuid_1)
+    create_route(uuid_2)
+    add_way_points_to_routes(
+        [
+            (uuid_1, D("50.0"), D("19.9")),
+            (uuid_1, D("50.0"), D("20.1")),
+            (uuid_2, D("52.2"), D("21.0")),
+        ]
+    )
+
+    assert search_routes_in_box(49.99, 19.99, 50.01, 20.01) == [uuid_1]
+    assert search_routes_in_box(49, 19, 53, 22) == [uuid_1, uuid_2]
+    assert search_routes_in_box(40, 179, 41, -179) == []
+    assert search_routes_near(50.0, 20.0, 1) == [uuid_1]
+    assert search_routes_near(52.2, 21.01, 1) == [uuid_2]
+
+    # Way points appended after the index was built are indexed too
+    add_way_point_to_route(uuid_2, D("50.0"), D("20.2"))
+    assert search_routes_near(50.0, 20.0, 20) == [uuid_1, uuid_2]
+
+    with pytest.raises(ValueError):
+        search_routes_in_box(51, 19, 50, 20)
+
+
+def test_search_routes__removed_route():
+    uuid = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    create_route(uuid)
+    add_way_point_to_route(uuid, D("50.0"), D("20.0"))
+    index = get_spatial_index()
+    dict.pop(get_routes_db(), uuid)
+
+    assert search_routes_near(50.0, 20.0, 1) == []
+    assert len(index) == 0
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("measured", [0, 1, 150])
+def test_find_longest_paths(monkeypatch, seed, measured):
+    uuid = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    rng = np.random.default_rng(seed)
+    lats = (50 + np.cumsum(rng.normal(0, 0.001, 300))).round(7).tolist()
+    lons = (20 + np.cumsum(rng.normal(0, 0.001, 300))).round(7).tolist()
+    # Tied longest paths out and back, in the measured way points and after
+    lats[101:103] = [lats[100] + 0.5, lats[100]]
+    lons[101:103] = [lons[100], lons[100]]
+    lats[200:203], lons[200:203] = lats[100:103], lons[100:103]
+    with freeze_time("2021-01-01 12:00:00"):
+        create_route(uuid)
+        add_way_points_to_routes(
+            (uuid, D(repr(lat)), D(repr(lon)))
+            for lat, lon in zip(lats[:measured], lons[:measured])
+        )
+        monkeypatch.setattr(crud.config, "INGEST_STATISTICS", False)
+        add_way_points_to_routes(
+            (uuid, D(repr(lat)), D(repr(lon)))
+            for lat, lon in zip(lats[measured:], lons[measured:])
+        )
+    route = get_routes_db().get(uuid)
+    assert len(route.path_lengths_um) == max(measured - 1, 0)
+
+    measured_paths = []
+    crud_calculate_pair_lengths_um = crud.calculate_pair_lengths_um
+
+    def calculate_pair_lengths_um(lats1, *args, **kwargs):
+        measured_paths.append(len(lats1))
+        return crud_calculate_pair_lengths_um(lats1, *args, **kwargs)
+
+    monkeypatch.setattr(crud, "calculate_pair_lengths_um", calculate_pair_lengths_um)
+    assert crud.longest_paths_prunable(route)
+    longest_paths = crud.find_longest_paths(route)
+    assert len(route.path_lengths_um) == max(measured - 1, 0)
+    assert measured_paths[0] < 10
+
+    monkeypatch.setattr(crud.config, "LONGEST_PATHS_PRUNING", False)
+    assert longest_paths == get_route_longest_paths(uuid)
+    assert [path["km"] for path in longest_paths] == [longest_paths[0]["km"]] * 4
+    assert not crud.longest_paths_prunable(route)
+
+
+def test_find_longest_paths__measured_paths_longer(monkeypatch):
+    uuid = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    with freeze_time("2021-01-01 12:00:00"):
+        create_route(uuid)
+        add_way_points_to_routes([(uuid, D("50"), D("20")), (uuid, D("51"), D("20"))])
+        monkeypatch.setattr(crud.config, "INGEST_STATISTICS", False)
+        add_way_points_to_routes(
+            (uuid, D("51") + D("0.001") * i, D("20")) for i in range(1, 20)
+        )
+    route = get_routes_db().get(uuid)
+
+    assert crud.find_longest_paths(route) == [
+        {
+            "km": D("111.238680860"),
+            "start": {"lat": D("50.0"), "lon": D("20.0")},
+            "stop": {"lat": D("51.0"), "lon": D("20.0")},
+        }
+    ]
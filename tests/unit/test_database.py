@@ -0,0 +1,123 @@
+import datetime
+from decimal import Decimal
+from uuid import UUID
+
+import pytest
+from freezegun import freeze_time
+
+from core import crud, database
+from core.database import MemoryRouteStore, RouteLocks, SQLiteRouteStore
+from core.models import Route
+
+D = Decimal
+UUID_1 = UUID("e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e")
+
+
+@pytest.fixture
+def sqlite_path(tmp_path):
+    return str(tmp_path / "routes.sqlite3")
+
+
+@pytest.fixture
+def sqlite_routes_db(sqlite_path, monkeypatch):
+    routes_db = SQLiteRouteStore(sqlite_path)
+    monkeypatch.setattr(database, "routes_db", routes_db)
+    return routes_db
+
+
+def test_route_locks():
+    route_lock = RouteLocks(4)
+    assert route_lock(UUID_1) is route_lock(str(UUID_1).upper())
+    assert len({route_lock(UUID(int=i)) for i in range(8)}) == 4
+
+
+def test_memory_route_store():
+    routes_db = MemoryRouteStore()
+    route = Route(UUID_1)
+    routes_db[UUID_1] = route
+    routes_db.append_way_points(route, [(11.11, 0.13), (50.11, 20.13)])
+
+    assert UUID_1 in routes_db
+    assert list(routes_db.values()) == [route]
+    assert list(route.lons) == [0.13, 20.13]
+
+
+def test_sqlite_route_store(sqlite_path):
+    routes_db = SQLiteRouteStore(sqlite_path)
+    assert routes_db.get(UUID_1) is None
+
+    routes_db[UUID_1] = Route(UUID_1)
+    route = routes_db[UUID_1]
+    routes_db.append_way_points(route, [(11.11, 0.13), (50.11, 20.13)])
+
+    assert UUID_1 in routes_db
+    assert route.route_id == UUID_1
+    assert route.created == datetime.date.today()
+    assert list(route.lats) == [11.11, 50.11]
+
+    with pytest.raises(ValueError):
+        routes_db[UUID_1] = Route(UUID_1)
+
+
+def test_sqlite_route_store__shared_between_processes(sqlite_path):
+    worker_1 = SQLiteRouteStore(sqlite_path)
+    worker_2 = SQLiteRouteStore(sqlite_path)
+
+    worker_1[UUID_1] = Route(UUID_1)
+    worker_1.append_way_points(worker_1[UUID_1], [(11.11, 0.13)])
+    worker_2.append_way_points(worker_2[UUID_1], [(50.11, 20.13)])
+    worker_1.append_way_points(worker_1[UUID_1], [(44.11, 15.13)])
+
+    for routes_db in (worker_1, worker_2, SQLiteRouteStore(sqlite_path)):
+        assert list(routes_db[UUID_1].lats) == [11.11, 50.11, 44.11]
+
+
+def test_crud_with_sqlite_route_store(sqlite_routes_db, sqlite_path):
+    with freeze_time("2021-01-01 12:00:00"):
+        crud.create_route(UUID_1)
+        crud.add_way_point_to_route(UUID_1, D("50.11"), D("20.13"))
+        crud.add_way_points_to_routes(
+            [(UUID_1, D("11.11"), D("0.13")), (UUID_1, D("50.11"), D("20.13"))]
+        )
+
+    # A restarted process sees the same route
+    database.routes_db = SQLiteRouteStore(sqlite_path)
+    assert crud.get_route_length_km(UUID_1) == D("9395.796698692")
+    assert len(crud.get_route_longest_paths(UUID_1)) == 2
+
+
+def test_sqlite_route_store__unfinalized_routes(sqlite_path):
+    uuid_too_short = UUID("e84fee1e-fd4f-40f6-85b5-52ff46cccc6e")
+    uuid_open = UUID("e84fee1e-fd4f-40f6-85b5-52ff46dddd6e")
+    routes_db = SQLiteRouteStore(sqlite_path)
+    with freeze_time("2021-01-01 12:00:00"):
+        for route_id in (UUID_1, uuid_too_short):
+            routes_db[route_id] = Route(route_id)
+        routes_db.append_way_points(routes_db[UUID_1], [(11.11, 0.13), (50.11, 20.13)])
+        routes_db.append_way_points(routes_db[uuid_too_short], [(11.11, 0.13)])
+    routes_db[uuid_open] = Route(uuid_open)
+    routes_db.append_way_points(routes_db[uuid_open], [(11.11, 0.13), (50.11, 20.13)])
+
+    worker_2 = SQLiteRouteStore(sqlite_path)
+    assert [route.route_id for route in worker_2.unfinalized_routes()] == [UUID_1]
+    # Only the routes returned are read
+    assert list(worker_2._routes) == [str(UUID_1)]
+
+    worker_2.set_finalized(worker_2[UUID_1])
+    assert routes_db.unfinalized_routes() == []
+
+
+def test_search_routes_with_sqlite_route_store(sqlite_routes_db, sqlite_path):
+    uuid_2 = UUID("b2bd3e1b-ef4b-4fe8-b2e5-5a5d6a5a3e39")
+    crud.create_route(UUID_1)
+    crud.add_way_point_to_route(UUID_1, D("50.0"), D("20.0"))
+    assert crud.search_routes_near(50.0, 20.0, 1) == [UUID_1]
+
+    # Routes created and extended by another worker are indexed too
+    worker_2 = SQLiteRouteStore(sqlite_path)
+    worker_2[uuid_2] = Route(uuid_2)
+    worker_2.append_way_points(worker_2[uuid_2], [(52.2, 21.0)])
+    worker_2.append_way_points(worker_2[UUID_1], [(50.0, 20.2)])
+    assert crud.search_routes_near(52.2, 21.0, 1) == [uuid_2]
+    # Along the path from the way point before
+    assert crud.search_routes_near(50.0, 20.1, 1) == [UUID_1]
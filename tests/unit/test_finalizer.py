@@ -0,0 +1,116 @@
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from decimal import Decimal
+
+from freezegun import freeze_time
+
+from core.crud import create_route, add_way_point_to_route
+from core.database import get_routes_db
+from core.finalizer import RouteFinalizer
+from core.models import WayPoint
+
+D = Decimal
+
+
+def test_run_once():
+    uuid_closed = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    uuid_too_short = "e84fee1e-fd4f-40f6-85b5-52ff46cccc6e"
+    uuid_open = "e84fee1e-fd4f-40f6-85b5-52ff46dddd6e"
+    with freeze_time("2021-01-01 12:00:00"):
+        create_route(uuid_closed)
+        add_way_point_to_route(uuid_closed, D("50.11"), D("20.13"))
+        add_way_point_to_route(uuid_closed, D("11.11"), D("0.13"))
+        create_route(uuid_too_short)
+        add_way_point_to_route(uuid_too_short, D("50.11"), D("20.13"))
+    create_route(uuid_open)
+    add_way_point_to_route(uuid_open, D("50.11"), D("20.13"))
+    add_way_point_to_route(uuid_open, D("11.11"), D("0.13"))
+
+    finalizer = RouteFinalizer(workers=1)
+    finalizer.run_once()
+
+    routes_db = get_routes_db()
+    assert routes_db[uuid_closed].length_km == D("4697.898349346")
+    assert len(routes_db[uuid_closed].longest_paths) == 1
+    assert routes_db[uuid_too_short].longest_paths is None
+    assert routes_db[uuid_open].longest_paths is None
+    assert finalizer.status() == {
+        "running": False,
+        "runs": 1,
+        "finalized": 1,
+        "failed": 0,
+        "backlog": 0,
+        "last_run": finalizer.last_run,
+    }
+
+    finalizer.run_once()
+    assert finalizer.finalized == 1
+
+
+def test_run_once__missing_paths_on_process_pool():
+    uuid = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+    with freeze_time("2021-01-01 12:00:00"):
+        create_route(uuid)
+        route = get_routes_db()[uuid]
+        for lat, lon in [
+            (D("50.11"), D("20.13")),
+            (D("11.11"), D("0.13")),
+            (D("50.11"), D("20.13")),
+        ]:
+            route.way_points.append(WayPoint(lat=lat, lon=lon))
+
+    finalizer = RouteFinalizer(workers=1)
+    try:
+        finalizer.run_once()
+    finally:
+        finalizer.stop()
+
+    assert list(route.path_lengths_um) == [4697898349346, 4697898349346]
+    assert route.length_km == D("9395.796698692")
+    assert len(route.longest_paths) == 2
+    assert finalizer.finalized == 1
+
+
+def test_start_stop():
+    finalizer = RouteFinalizer(workers=1)
+    finalizer.start()
+    assert finalizer.running
+    finalizer.stop()
+    assert not finalizer.running
+
+
+def test_run__survives_failed_runs(monkeypatch):
+    finalizer = RouteFinalizer(workers=1, interval_seconds=0.001)
+    finalizer._executor = "broken"
+    errors = [OSError("No space left on device"), BrokenProcessPool()]
+    done = threading.Event()
+
+    def run_once():
+        if errors:
+            raise errors.pop(0)
+        done.set()
+
+    monkeypatch.setattr(finalizer, "run_once", run_once)
+    finalizer.start()
+    try:
+        assert done.wait(5)
+        assert finalizer.running
+    finally:
+        finalizer.stop()
+    assert finalizer.failed == 2
+    # A broken pool is replaced on the next run
+    assert finalizer._executor is None
+
+
+def test_run__single_finalizer_per_lock(tmp_path):
+    lock_path = str(tmp_path / "routes.sqlite3.finalizer.lock")
+    worker_1 = RouteFinalizer(workers=1, lock_path=lock_path)
+    worker_2 = RouteFinalizer(workers=1, lock_path=lock_path)
+    assert worker_1._acquire_lock()
+    assert worker_1._acquire_lock()
+    assert not worker_2._acquire_lock()
+
+    # Another worker takes over once the lock is released
+    worker_1.stop()
+    assert worker_2._acquire_lock()
+    worker_2.stop()
@@ -0,0 +1,109 @@
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from geopy.distance import geodesic
+
+from core import geodesic as geodesic_module
+from core.geodesic import (
+    geodesic_lengths_km,
+    geodesic_pair_lengths_km,
+    spherical_bounds_km,
+)
+from core.util import round_
+
+
+def assert_matches_geopy(lats, lons):
+    lengths_km = geodesic_lengths_km(lats, lons)
+
+    assert lengths_km.shape == (len(lats) - 1,)
+    for i, length_km in enumerate(lengths_km.tolist()):
+        expected = geodesic((lats[i], lons[i]), (lats[i + 1], lons[i + 1])).km
+        assert round_(Decimal(length_km)) == round_(Decimal(expected)), (i, expected)
+
+
+def test_geodesic_lengths_km__random_points():
+    rng = np.random.default_rng(0)
+    assert_matches_geopy(rng.uniform(-90, 90, 2000), rng.uniform(-180, 180, 2000))
+
+
+def test_geodesic_lengths_km__gps_trace():
+    rng = np.random.default_rng(0)
+    lats = 59.3258414 + np.cumsum(rng.normal(0, 0.0005, 2000))
+    lons = 17.70188 + np.cumsum(rng.normal(0, 0.0005, 2000))
+    assert_matches_geopy(lats, lons)
+
+
+@pytest.mark.parametrize(
+    "lats, lons",
+    [
+        # coincident points
+        ([44.11, 44.11], [15.13, 15.13]),
+        # along a meridian and over a pole
+        ([-10.0, 50.0, 90.0, 80.0, -90.0], [20.13, 20.13, 0.0, 180.0, 0.0]),
+        # along the equator, including nearly antipodal points
+        ([0.0, 0.0, 0.0, 0.0], [0.0, 90.0, -179.5, 0.3]),
+        # across the antimeridian
+        ([10.0, 10.0, -10.0], [179.9, -179.9, 170.0]),
+        # nearly antipodal points
+        ([30.0, -30.0, 0.5, -0.5], [0.0, 179.8, 0.0, 179.9]),
+        # lengths a few nanometres from a tie of rounding to micrometres
+        (
+            [
+                59.295046744104894,
+                59.29486858943068,
+                59.3993110143281,
+                59.39918084601314,
+            ],
+            [
+                17.687004576093496,
+                17.686371656450405,
+                17.770662472790995,
+                17.77057456298523,
+            ],
+        ),
+    ],
+)
+def test_geodesic_lengths_km__special_cases(monkeypatch, lats, lons):
+    monkeypatch.setattr(geodesic_module, "VECTORIZE_MIN_SEGMENTS", 0)
+    assert_matches_geopy(np.array(lats), np.array(lons))
+
+
+@pytest.mark.parametrize("lats, lons", [([], []), ([11.11], [0.13])])
+def test_geodesic_lengths_km__no_segments(lats, lons):
+    assert geodesic_lengths_km(np.array(lats), np.array(lons)).shape == (0,)
+
+
+@pytest.mark.parametrize("scale", [1e-5, 0.01, 1, None])
+def test_spherical_bounds_km(scale):
+    rng = np.random.default_rng(0)
+    lats = rng.uniform(-90, 90, 5000)
+    lons = rng.uniform(-180, 180, 5000)
+    if scale is not None:
+        lats = np.clip(lats[0] + np.cumsum(rng.normal(0, scale, 5000)), -90, 90)
+        lons = lons[0] + np.cumsum(rng.normal(0, scale, 5000))
+
+    lower_km, upper_km = spherical_bounds_km(lats, lons)
+    lengths_km = geodesic_lengths_km(lats, lons)
+
+    assert (lower_km <= lengths_km).all()
+    assert (lengths_km <= upper_km).all()
+
+
+def test_geodesic_pair_lengths_km__vectorized(monkeypatch):
+    calls = []
+
+    def inverse(lats1, lons1, lats2, lons2):
+        calls.append(len(lats1))
+        return np.ones(len(lats1)), np.zeros(len(lats1), dtype=bool)
+
+    monkeypatch.setattr(geodesic_module, "_inverse", inverse)
+    lats1, lons1, lats2, lons2 = [50.0] * 12, [20.0] * 12, [50.1] * 12, [20.1] * 12
+
+    geodesic_pair_lengths_km(lats1[:1], lons1[:1], lats2[:1], lons2[:1])
+    geodesic_pair_lengths_km(lats1, lons1, lats2, lons2, vectorized=False)
+    assert calls == []
+
+    geodesic_pair_lengths_km(lats1, lons1, lats2, lons2)
+    geodesic_pair_lengths_km(lats1[:1], lons1[:1], lats2[:1], lons2[:1], True)
+    assert calls == [12, 1]
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from core import geometry
+
+
+def encode(media_type, lats, lons, precision, chunk_size=2):
+    lats, lons = np.array(lats), np.array(lons)
+    chunks = [
+        (lats[start : start + chunk_size], lons[start : start + chunk_size])
+        for start in range(0, len(lats), chunk_size)
+    ]
+    return b"".join(geometry.encode(media_type, chunks, len(lats), precision))
+
+
+def test_encode__polyline():
+    # The example of Google's polyline algorithm documentation
+    lats, lons = [38.5, 40.7, 43.252], [-120.2, -120.95, -126.453]
+
+    data = encode(geometry.POLYLINE, lats, lons, 5)
+
+    assert data == b"_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    assert geometry.decode_polyline(data) == list(zip(lats, lons))
+
+
+def test_encode__packed():
+    rng = np.random.default_rng(0)
+    lats = np.round(rng.uniform(-90, 90, 1001), 7)
+    lons = np.round(rng.uniform(-180, 180, 1001), 7)
+
+    data = encode(geometry.PACKED, lats, lons, 7, chunk_size=100)
+
+    assert data[:4] == b"RGEO"
+    assert geometry.decode_packed(data) == list(zip(lats.tolist(), lons.tolist()))
+    with pytest.raises(ValueError):
+        geometry.decode_packed(data[:-1])
+
+
+def test_encode__empty():
+    assert encode(geometry.POLYLINE, [], [], 5) == b""
+    assert geometry.decode_packed(encode(geometry.PACKED, [], [], 7)) == []
+
+
+@pytest.mark.parametrize(
+    "accept, expected",
+    [
+        (None, geometry.POLYLINE),
+        ("*/*", geometry.POLYLINE),
+        ("application/octet-stream", geometry.PACKED),
+        ("text/html, application/*;q=0.5", geometry.POLYLINE),
+        (
+            "application/vnd.google.polyline;q=0.5, application/octet-stream",
+            geometry.PACKED,
+        ),
+        ("application/octet-stream;q=0, */*;q=0.1", geometry.POLYLINE),
+        ("application/json", None),
+    ],
+)
+def test_negotiate(accept, expected):
+    assert geometry.negotiate(accept) == expected
@@ -0,0 +1,98 @@
+import asyncio
+import datetime
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+
+from core import crud
+from core.crud import create_route
+from core.database import get_routes_db
+from core.excpetions import IngestQueueFullException, RouteException
+from core.ingest import IngestQueue
+
+D = Decimal
+UUID_1 = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+UUID_2 = "b2bd3e1b-ef4b-4fe8-b2e5-5a5d6a5a3e39"
+
+
+@pytest.fixture
+def routes():
+    create_route(UUID_1)
+    create_route(UUID_2)
+    return get_routes_db().get(UUID_1), get_routes_db().get(UUID_2)
+
+
+def test_put__batches(routes):
+    ingest_queue = IngestQueue(flush_size=4, flush_seconds=60)
+    add_way_points_to_routes = mock.Mock(wraps=crud.add_way_points_to_routes)
+
+    async def put():
+        for index in range(8):
+            ingest_queue.put(UUID_1 if index % 2 else UUID_2, D(index), D(index))
+        assert len(ingest_queue) == 8
+        # Full batches are written without waiting for flush_seconds
+        await asyncio.wait_for(wait_until_appended(ingest_queue, 8), 1)
+
+    with mock.patch.object(crud, "add_way_points_to_routes", add_way_points_to_routes):
+        asyncio.run(put())
+
+    assert add_way_points_to_routes.call_count == 2
+    assert (ingest_queue.batches, ingest_queue.written) == (2, 8)
+    assert list(routes[0].lats) == [1, 3, 5, 7]
+    assert list(routes[1].lats) == [0, 2, 4, 6]
+    assert len(routes[0].path_lengths_um) == 3
+
+
+def test_put__flush_seconds(routes):
+    ingest_queue = IngestQueue(flush_size=1000, flush_seconds=0.01)
+
+    async def put():
+        ingest_queue.put(UUID_1, D("50.1"), D("20.1"))
+        await asyncio.sleep(0)
+        assert len(ingest_queue) == 1
+        await asyncio.wait_for(wait_until_appended(ingest_queue, 1), 1)
+
+    asyncio.run(put())
+    assert list(routes[0].lats) == [50.1]
+
+
+def test_put__sync_ack(routes):
+    routes[1].created -= datetime.timedelta(days=1)
+    ingest_queue = IngestQueue(flush_size=1000, flush_seconds=0.01, sync_ack=True)
+
+    async def put():
+        return await asyncio.gather(
+            ingest_queue.put(UUID_1, D("50.1"), D("20.1")),
+            ingest_queue.put(UUID_2, D("50.1"), D("20.1")),
+        )
+
+    appended, closed = asyncio.run(put())
+    assert appended is None
+    assert isinstance(closed, RouteException)
+    assert (ingest_queue.batches, ingest_queue.written, ingest_queue.rejected) == (
+        1,
+        1,
+        1,
+    )
+
+
+def test_put__full(routes):
+    ingest_queue = IngestQueue(max_size=2, flush_seconds=60)
+
+    async def put():
+        ingest_queue.put(UUID_1, D("50.1"), D("20.1"))
+        ingest_queue.put(UUID_1, D("50.2"), D("20.2"))
+        with pytest.raises(IngestQueueFullException):
+            ingest_queue.put(UUID_1, D("50.3"), D("20.3"))
+        await ingest_queue.stop()
+
+    asyncio.run(put())
+    assert ingest_queue.refused == 1
+    assert list(routes[0].lats) == [50.1, 50.2]
+
+
+async def wait_until_appended(ingest_queue, count):
+    while ingest_queue.written + ingest_queue.rejected < count:
+        await asyncio.sleep(0.001)
+    await ingest_queue.stop()
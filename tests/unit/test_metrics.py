@@ -0,0 +1,85 @@
+import pytest
+
+from core import crud, metrics
+from core.cache import segment_cache
+from core.database import get_routes_db
+
+UUID_1 = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.clear()
+
+
+def test_histogram():
+    metrics.request_seconds.observe(0.0003, "GET", '/a"b', "200")
+    metrics.request_seconds.observe(2, "GET", '/a"b', "200")
+    lines = metrics.request_seconds.collect()
+    labels = 'method="GET",route="/a\\"b",status="200"'
+
+    assert lines[:2] == [
+        "# HELP http_request_duration_seconds"
+        " Time spent serving HTTP requests, by route template.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    assert f'http_request_duration_seconds_bucket{{{labels},le="0.0001"}} 0' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="0.0005"}} 1' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="5.0"}} 2' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in lines
+    assert f"http_request_duration_seconds_sum{{{labels}}} 2.0003" in lines
+    assert f"http_request_duration_seconds_count{{{labels}}} 2" in lines
+
+
+def test_histogram__disabled(monkeypatch):
+    monkeypatch.setattr(metrics.config, "METRICS_ENABLED", False)
+    with metrics.geodesic_seconds.time():
+        pass
+    assert "route_geodesic_seconds_count 0" in metrics.geodesic_seconds.collect()
+
+
+@pytest.mark.parametrize("enabled", [True, False])
+def test_histogram__request_stages(monkeypatch, enabled):
+    monkeypatch.setattr(metrics.config, "METRICS_ENABLED", enabled)
+    stages = {}
+    token = metrics.request_stages.set(stages)
+    try:
+        metrics.geodesic_seconds.observe(0.25)
+        metrics.geodesic_seconds.observe(0.5)
+        metrics.serialization_seconds.observe(1)
+    finally:
+        metrics.request_stages.reset(token)
+    metrics.geodesic_seconds.observe(2)
+
+    assert stages == {"route_geodesic_seconds": 0.75, "route_serialization_seconds": 1}
+
+
+def test_render():
+    crud.create_route(UUID_1)
+    for lat, lon in [(50.11, 20.13), (11.11, 0.13), (50.11, 20.13)]:
+        crud.add_way_point_to_route(UUID_1, lat, lon)
+
+    text = metrics.render()
+
+    assert "route_geodesic_seconds_count 2\n" in text
+    assert "route_longest_paths_seconds_count 0\n" in text
+    assert "routes 1\n" in text
+    assert "route_way_points 3\n" in text
+    route = get_routes_db().get(UUID_1)
+    assert f"route_store_memory_bytes {route.memory_bytes()}\n" in text
+    assert route.memory_bytes() == 768 + 3 * 24 + 2 * 8
+
+
+def test_render__segment_cache(monkeypatch):
+    monkeypatch.setattr(segment_cache, "max_size", 1000)
+    segment_cache.clear()
+    crud.create_route(UUID_1)
+    for lat, lon in [(50.11, 20.13), (11.11, 0.13), (50.11, 20.13), (11.11, 0.13)]:
+        crud.add_way_point_to_route(UUID_1, lat, lon)
+
+    text = metrics.render()
+
+    assert "# TYPE segment_cache_hits_total counter\n" in text
+    assert "segment_cache_hits_total 1\n" in text
+    assert "segment_cache_misses_total 2\n" in text
+    assert "segment_cache_entries 2\n" in text
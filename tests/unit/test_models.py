@@ -0,0 +1,46 @@
+import datetime
+from array import array
+from decimal import Decimal
+
+import pytest
+from freezegun import freeze_time
+
+from core.models import Route, WayPoint
+
+D = Decimal
+
+
+@freeze_time("2021-01-01 12:00:00.123456")
+def test_route_way_points_round_trip():
+    route = Route("e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e")
+    route.way_points.append(WayPoint(lat=D("-25.4025905"), lon=D("-49.3124416")))
+    route.append_way_point(59.3258414, 17.70188)
+
+    assert route.lats == array("d", [-25.4025905, 59.3258414])
+    assert len(route.way_points) == 2
+
+    first, second = route.way_points
+    assert first.coordinates == (D("-25.4025905"), D("-49.3124416"))
+    assert second.coordinates == (D("59.3258414"), D("17.70188"))
+    assert first.created == second.created == datetime.datetime.now()
+
+    assert route.way_points[-1].coordinates == second.coordinates
+    assert [way_point.lat for way_point in route.way_points[1:]] == [D("59.3258414")]
+    with pytest.raises(IndexError):
+        route.way_points[2]
+
+
+def test_route_paths():
+    route = Route("e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e")
+    assert route.paths is None
+
+    route.append_way_point(11.11, 0.13)
+    route.append_way_point(50.11, 20.13)
+    route.path_lengths_um = array("q", [4697898349346])
+    route.paths_calculated = True
+
+    assert len(route.paths) == 1
+    path = route.paths[0]
+    assert path.length_km == D("4697.898349346")
+    assert path.start.coordinates == (D("11.11"), D("0.13"))
+    assert path.stop.coordinates == (D("50.11"), D("20.13"))
@@ -0,0 +1,94 @@
+import asyncio
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from core import crud
+from core.crud import create_route, get_route_length_km
+from core.database import get_routes_db
+from core.excpetions import ServerBusyException
+from core.models import WayPoint
+from core.offload import ComputePool
+
+D = Decimal
+UUID_1 = "e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e"
+
+
+@pytest.fixture
+def closed_route():
+    create_route(UUID_1)
+    route = get_routes_db().get(UUID_1)
+    route.created -= datetime.timedelta(days=1)
+    for lat, lon in [
+        (D("50.11"), D("20.13")),
+        (D("11.11"), D("0.13")),
+        (D("50.11"), D("20.13")),
+    ]:
+        route.way_points.append(WayPoint(lat=lat, lon=lon))
+    return route
+
+
+@pytest.mark.parametrize("min_way_points", [0, 1000])
+def test_prepare_route(closed_route, min_way_points):
+    compute_pool = ComputePool(workers=1, min_way_points=min_way_points)
+    try:
+        asyncio.run(compute_pool.prepare_route(UUID_1))
+    finally:
+        compute_pool.shutdown()
+
+    assert list(closed_route.path_lengths_um) == [4697898349346, 4697898349346]
+    assert compute_pool.pending == 0
+    assert get_route_length_km(UUID_1) == D("9395.796698692")
+
+
+def test_prepare_route__busy(closed_route):
+    compute_pool = ComputePool(workers=1, max_pending=0, min_way_points=0)
+    with pytest.raises(ServerBusyException):
+        asyncio.run(compute_pool.prepare_route(UUID_1))
+    assert len(closed_route.path_lengths_um) == 0
+
+
+def test_prepare_route__concurrent(closed_route):
+    compute_pool = ComputePool(workers=1, min_way_points=0)
+    calculate_lengths_um = compute_pool.calculate_lengths_um
+    calls = []
+
+    async def counted_calculate_lengths_um(lats, lons):
+        calls.append(len(lats))
+        return await calculate_lengths_um(lats, lons)
+
+    async def prepare_twice():
+        await asyncio.gather(
+            compute_pool.prepare_route(UUID_1), compute_pool.prepare_route(UUID_1)
+        )
+
+    compute_pool.calculate_lengths_um = counted_calculate_lengths_um
+    try:
+        asyncio.run(prepare_twice())
+    finally:
+        compute_pool.shutdown()
+
+    assert calls == [3]
+    assert list(closed_route.path_lengths_um) == [4697898349346, 4697898349346]
+    assert not compute_pool._updating
+
+
+def test_find_longest_paths__concurrent(closed_route, monkeypatch):
+    compute_pool = ComputePool(workers=1)
+    calls = []
+
+    def counted_find_longest_paths(route):
+        calls.append(route.route_id)
+        return ["longest paths"]
+
+    async def find_twice():
+        return await asyncio.gather(
+            compute_pool.find_longest_paths(closed_route),
+            compute_pool.find_longest_paths(closed_route),
+        )
+
+    monkeypatch.setattr(crud, "find_longest_paths", counted_find_longest_paths)
+    assert asyncio.run(find_twice()) == [["longest paths"]] * 2
+    assert len(calls) == 1
+    assert not compute_pool._finding
@@ -0,0 +1,163 @@
+import datetime
+import os
+from decimal import Decimal
+from uuid import UUID
+
+import pytest
+from freezegun import freeze_time
+
+from core import crud, database
+from core.database import LoggedMemoryRouteStore, MemoryRouteStore
+from core.retention import RouteRetention
+from core.waypoint_log import WayPointLog
+
+D = Decimal
+UUID_1 = UUID("e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e")
+UUID_2 = UUID("b2bd3e1b-ef4b-4fe8-b2e5-5a5d6a5a3e39")
+
+
+@pytest.fixture
+def spill_dir(tmp_path):
+    return str(tmp_path / "spill")
+
+
+@pytest.fixture
+def routes_db(monkeypatch, spill_dir):
+    routes_db = MemoryRouteStore(RouteRetention(spill_dir))
+    monkeypatch.setattr(database, "routes_db", routes_db)
+    return routes_db
+
+
+def add_finalized_route(route_id):
+    with freeze_time("2021-01-01 12:00:00"):
+        crud.create_route(route_id)
+        for lat, lon in [("50.11", "20.13"), ("11.11", "0.13"), ("50.11", "20.13")]:
+            crud.add_way_point_to_route(route_id, D(lat), D(lon))
+    with freeze_time("2021-01-02 12:00:00"):
+        return crud.get_calculated_route_data(route_id)
+
+
+def test_spill(routes_db, spill_dir):
+    route = add_finalized_route(UUID_1)
+    memory_bytes = route.memory_bytes()
+
+    with freeze_time("2021-01-02 12:00:00"):
+        routes_db.apply_retention()
+
+    assert os.listdir(spill_dir) == [f"{UUID_1}.route"]
+    assert route.spilled
+    # Way points and path lengths
+    assert route.memory_bytes() == memory_bytes - 3 * 24 - 2 * 8
+    assert route.way_point_count == 3
+    assert crud.get_route_length_km(UUID_1) == D("9395.796698692")
+
+    # Geometry comes back on access
+    assert list(route.lats) == [50.11, 11.11, 50.11]
+    assert not route.spilled
+    assert list(route.path_lengths_um) == [4697898349346, 4697898349346]
+
+
+def test_ttl(routes_db, spill_dir):
+    add_finalized_route(UUID_1)
+    routes_db.retention.ttl_days = 7
+
+    with freeze_time("2021-01-08 12:00:00"):
+        routes_db.apply_retention()
+        assert UUID_1 in routes_db
+
+    with freeze_time("2021-01-09 12:00:00"):
+        routes_db.apply_retention()
+        assert UUID_1 not in routes_db
+        assert os.listdir(spill_dir) == []
+        assert routes_db.retention.expired == 1
+
+
+def test_memory_budget(routes_db, spill_dir):
+    route_1 = add_finalized_route(UUID_1)
+    route_2 = add_finalized_route(UUID_2)
+    routes_db.retention.memory_budget_bytes = route_2.memory_bytes() + 1
+
+    with freeze_time("2021-01-02 13:00:00"):
+        routes_db.get(UUID_1)
+        routes_db.apply_retention()
+
+    # The least recently used route is unloaded
+    assert list(routes_db.keys()) == [UUID_1]
+    assert routes_db.retention.unloaded == 1
+
+    with freeze_time("2021-01-02 12:00:00"):
+        route = routes_db[UUID_2]
+        assert route is not route_2
+        assert route.created == datetime.date(2021, 1, 1)
+        assert list(route.lons) == [20.13, 0.13, 20.13]
+        assert route.longest_path_indexes == [0, 1]
+        assert crud.get_route_longest_paths(UUID_2) == route_2.longest_paths
+        with pytest.raises(ValueError):
+            crud.create_route(UUID_2)
+    assert route_1 is routes_db[UUID_1]
+
+
+def test_ttl__unloaded_routes(routes_db, spill_dir):
+    add_finalized_route(UUID_1)
+    add_finalized_route(UUID_2)
+    routes_db.retention.memory_budget_bytes = 1
+    with freeze_time("2021-01-02 12:00:00"):
+        routes_db.apply_retention()
+    assert list(routes_db.keys()) == []
+    routes_db.retention.ttl_days = 7
+
+    with freeze_time("2021-01-09 12:00:00"):
+        # Loading an unloaded route past the TTL deletes its file
+        assert routes_db.get(UUID_1) is None
+        assert sorted(os.listdir(spill_dir)) == [f"{UUID_2}.route"]
+        assert routes_db.retention.expired == 1
+
+        # And so does applying retention to the files of the others
+        routes_db.apply_retention()
+        assert os.listdir(spill_dir) == []
+        assert routes_db.retention.expired == 2
+        assert UUID_2 not in routes_db
+
+
+def test_logged_route_store(monkeypatch, tmp_path, spill_dir):
+    def open_store():
+        routes_db = LoggedMemoryRouteStore(
+            WayPointLog(str(tmp_path / "log")), RouteRetention(spill_dir, ttl_days=7)
+        )
+        monkeypatch.setattr(database, "routes_db", routes_db)
+        return routes_db
+
+    routes_db = open_store()
+    route = add_finalized_route(UUID_1)
+    with freeze_time("2021-01-02 12:00:00"):
+        routes_db.compact()
+        routes_db.apply_retention()
+        routes_db.log.close()
+
+        # Spilled routes are not rebuilt from the snapshot,
+        # but read back from their file
+        routes_db = open_store()
+        assert list(routes_db.keys()) == []
+        assert crud.get_route_longest_paths(UUID_1) == route.longest_paths
+
+        # and left out of the next snapshot
+        routes_db.apply_retention()
+        routes_db.compact()
+        assert os.listdir(tmp_path / "log") == []
+
+    with freeze_time("2021-01-09 12:00:00"):
+        routes_db = open_store()
+        assert UUID_1 not in routes_db
+        assert os.listdir(spill_dir) == []
+
+
+def test_search_routes__unloaded_routes(routes_db):
+    add_finalized_route(UUID_1)
+    assert crud.search_routes_near(50.11, 20.13, 1) == [UUID_1]
+    routes_db.retention.memory_budget_bytes = 1
+    with freeze_time("2021-01-02 12:00:00"):
+        routes_db.apply_retention()
+
+    # Unloaded routes are checked against their file without loading them
+    assert crud.search_routes_near(11.11, 0.13, 1) == [UUID_1]
+    assert list(routes_db.keys()) == []
@@ -0,0 +1,98 @@
+import uuid
+
+import numpy as np
+import pytest
+
+from core.spatial import (
+    SpatialIndex,
+    passes_through_box,
+    passes_within,
+    radius_box,
+    split_box,
+)
+
+ROUTE_1 = uuid.UUID("e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e")
+ROUTE_2 = uuid.UUID("e84fee1e-fd4f-40f6-85b5-52ff46cccc6e")
+
+
+def test_spatial_index():
+    index = SpatialIndex(cell_degrees=1)
+    index.add(ROUTE_1, [50.5, 50.5, 52.5], [20.5, 21.5, 21.5])
+    index.add(ROUTE_2, [10.5], [10.5])
+
+    assert index.candidates(50, 20, 50.9, 20.9) == {ROUTE_1}
+    # Inside the bounding box of the segment from (50.5, 21.5) to (52.5, 21.5)
+    assert index.candidates(51.1, 21.1, 51.2, 21.2) == {ROUTE_1}
+    assert index.candidates(10, 10, 11, 11) == {ROUTE_2}
+    assert index.candidates(-50, -50, 0, 0) == set()
+    assert index.candidates(-90, -180, 90, 180) == {ROUTE_1, ROUTE_2}
+
+    index.discard([ROUTE_1])
+    assert index.candidates(-90, -180, 90, 180) == {ROUTE_2}
+
+
+def test_spatial_index__long_segment():
+    index = SpatialIndex(cell_degrees=1)
+    index.add(ROUTE_1, [10, 60], [10, 60])
+
+    assert index.candidates(-50, -50, -40, -40) == {ROUTE_1}
+
+
+@pytest.mark.parametrize(
+    "lats, lons, expected",
+    [
+        ([0.5], [0.5], True),
+        ([2, 3], [2, 3], False),
+        # Crosses the box without a way point in it
+        ([-1, 2], [0.5, 0.5], True),
+        # Bounding boxes overlap, the segment passes by a corner
+        ([0, 2.5], [2.5, 0], False),
+        ([], [], False),
+    ],
+)
+def test_passes_through_box(lats, lons, expected):
+    assert passes_through_box(lats, lons, 0, 0, 1, 1) == expected
+
+
+@pytest.mark.parametrize(
+    "lats, lons, expected",
+    [
+        ([50.05], [20.0], True),
+        ([50.1], [20.0], False),
+        # Passes the centre between two distant way points
+        ([49.5, 50.5], [20.0, 20.0], True),
+        ([49.5, 50.5], [20.2, 20.2], False),
+        ([50.0, 50.0], [179.99, -179.99], False),
+    ],
+)
+def test_passes_within(lats, lons, expected):
+    assert passes_within(lats, lons, 50.0, 20.0, 10) == expected
+
+
+def test_split_box():
+    assert split_box(0, 10, 1, 20) == [(0, 10, 1, 20)]
+    assert split_box(0, 170, 1, -170) == [(0, 170, 1, 180), (0, -180, 1, -170)]
+    assert split_box(0, 170, 1, 190) == [(0, 170, 1, 180), (0, -180, 1, -170)]
+
+
+def test_radius_box():
+    [(min_lat, min_lon, max_lat, max_lon)] = radius_box(0, 0, 111.19508)
+    assert (min_lat, max_lat) == pytest.approx((-1, 1))
+    assert (min_lon, max_lon) == pytest.approx((-1, 1))
+    assert len(radius_box(0, 179.5, 100)) == 2
+    assert radius_box(89.99, 0, 100)[0][1:4:2] == (-180, 180)
+
+
+def test_spatial_index__vectorized():
+    rng = np.random.default_rng(0)
+    lats = np.cumsum(rng.normal(0, 0.5, 200)).clip(-90, 90)
+    lons = np.cumsum(rng.normal(0, 3, 200)).clip(-180, 180)
+    one_by_one, at_once = SpatialIndex(cell_degrees=1), SpatialIndex(cell_degrees=1)
+
+    for point in range(len(lats)):
+        start = max(point - 1, 0)
+        one_by_one.add(ROUTE_1, lats[start : point + 1], lons[start : point + 1])
+    at_once.add(ROUTE_1, lats, lons)
+
+    assert at_once._cells == one_by_one._cells
+    assert at_once._long_routes == one_by_one._long_routes == {ROUTE_1}
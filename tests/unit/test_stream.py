@@ -0,0 +1,34 @@
+import struct
+
+import pytest
+
+from core import stream
+
+
+def test_decode_frame__text():
+    assert stream.decode_frame("[[50.1, 20.1], [-1, 180]]") == [[50.1, 20.1], [-1, 180]]
+    assert stream.decode_frame("[]") == []
+
+
+def test_decode_frame__binary():
+    data = struct.pack("<4d", 50.1, 20.1, -1.0, 180.0)
+    assert stream.decode_frame(data) == [(50.1, 20.1), (-1.0, 180.0)]
+    assert stream.decode_frame(b"") == []
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        "[[50.1, 20.1",
+        '{"lat": 50.1, "lon": 20.1}',
+        "[50.1, 20.1]",
+        "[[50.1, 20.1, 0]]",
+        '[["50.1", "20.1"]]',
+        "[[true, false]]",
+        struct.pack("<3d", 50.1, 20.1, -1.0),
+        struct.pack("<d", 0.0) * 2 * (stream.MAX_FRAME_WAY_POINTS + 1),
+    ],
+)
+def test_decode_frame__malformed(data):
+    with pytest.raises(ValueError):
+        stream.decode_frame(data)
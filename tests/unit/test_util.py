@@ -1,9 +1,17 @@
+from array import array
 from decimal import Decimal
 
+import numpy as np
 import pytest
 
-from core.models import WayPoint
-from core.util import calculate_length_km
+from core.cache import segment_cache
+from core.models import WayPoint, km_to_um
+from core.util import (
+    calculate_length_km,
+    calculate_lengths_um,
+    round_,
+    round_km_to_um,
+)
 
 
 @pytest.mark.parametrize(
@@ -21,3 +29,59 @@ def test_calculate_length_km(start_lat, start_lon, stop_lat, stop_lon, expected)
     result = calculate_length_km(start, stop)
 
     assert result == Decimal(expected)
+
+
+def test_calculate_lengths_um():
+    lats = array("d", [52.2296756, 52.406374, 52.406374])
+    lons = array("d", [21.0122287, 16.9251681, 16.9251681])
+
+    assert calculate_lengths_um(lats, lons) == array("q", [279352901604, 0])
+
+
+def test_calculate_lengths_um__cached(monkeypatch):
+    monkeypatch.setattr(segment_cache, "max_size", 1000)
+    segment_cache.clear()
+    lats = array("d", [52.2296756, 52.406374, 52.2296756, 52.406374])
+    lons = array("d", [21.0122287, 16.9251681, 21.0122287, 16.9251681])
+
+    first = calculate_lengths_um(lats, lons)
+    second = calculate_lengths_um(lats, lons)
+
+    assert first == second == array("q", [279352901604] * 3)
+    assert segment_cache.stats()["hits"] == 3
+    assert segment_cache.stats()["misses"] == 3
+    assert len(segment_cache) == 2
+
+
+def test_calculate_lengths_um__cache_disabled(monkeypatch):
+    monkeypatch.setattr(segment_cache, "max_size", 0)
+    segment_cache.clear()
+    lats = array("d", [52.2296756, 52.406374, 52.2296756])
+    lons = array("d", [21.0122287, 16.9251681, 21.0122287])
+
+    assert calculate_lengths_um(lats, lons) == array("q", [279352901604] * 2)
+    assert len(segment_cache) == 0
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("scale", [1e-9, 1e-6, 0.01, 1, 20000])
+def test_round_km_to_um__matches_decimal(seed, scale):
+    rng = np.random.default_rng(seed)
+    lengths_km = rng.random(10000) * scale
+
+    assert round_km_to_um(lengths_km).tolist() == [
+        km_to_um(round_(Decimal(km))) for km in lengths_km.tolist()
+    ]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_round_km_to_um__near_ties(seed):
+    rng = np.random.default_rng(seed)
+    ties = (rng.integers(0, 2 ** 44, 10000) + 0.5) / 1e9
+    lengths_km = np.concatenate(
+        [ties, np.nextafter(ties, 0), np.nextafter(ties, np.inf), [0.0, 5e-10]]
+    )
+
+    assert round_km_to_um(lengths_km).tolist() == [
+        km_to_um(round_(Decimal(km))) for km in lengths_km.tolist()
+    ]
@@ -0,0 +1,188 @@
+import datetime
+import os
+import time
+from decimal import Decimal
+from uuid import UUID
+
+import pytest
+from freezegun import freeze_time
+
+from core import crud, database
+from core.database import LoggedMemoryRouteStore
+from core.models import Route
+from core.waypoint_log import RECORD, WayPointLog
+
+D = Decimal
+UUID_1 = UUID("e84fee1e-fd4f-40f6-85b5-52ff46cbbb6e")
+UUID_2 = UUID("b2bd3e1b-ef4b-4fe8-b2e5-5a5d6a5a3e39")
+CREATED = datetime.datetime(2021, 1, 1, 12)
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    return str(tmp_path / "log")
+
+
+def open_store(log_dir, **kwargs):
+    return LoggedMemoryRouteStore(WayPointLog(log_dir, **kwargs))
+
+
+def log_files(log_dir):
+    return sorted(os.listdir(log_dir))
+
+
+def test_replay(log_dir):
+    routes_db = open_store(log_dir, segment_bytes=3 * RECORD.size)
+    for route_id in (UUID_1, UUID_2):
+        routes_db[route_id] = Route(route_id)
+    routes_db.append_way_points(routes_db[UUID_1], [(11.11, 0.13), (50.11, 20.13)])
+    routes_db.append_way_points(routes_db[UUID_2], [(-1.5, 2.5), (3.5, -4.5)], CREATED)
+    routes_db.append_way_points(routes_db[UUID_1], [(44.11, 15.13)])
+    routes_db.log.close()
+
+    # Batches are split across segments
+    assert log_files(log_dir) == [
+        "segment-00000001.log",
+        "segment-00000002.log",
+        "segment-00000003.log",
+    ]
+    replayed = open_store(log_dir)
+    assert list(replayed.keys()) == [UUID_1, UUID_2]
+    assert list(replayed[UUID_1].lats) == [11.11, 50.11, 44.11]
+    assert list(replayed[UUID_1].lons) == [0.13, 20.13, 15.13]
+    assert replayed[UUID_1].created == datetime.date.today()
+    assert replayed[UUID_2].way_point(1).created == CREATED
+    assert replayed[UUID_2].way_point(0).coordinates == (D("-1.5"), D("2.5"))
+
+
+def test_replay__stops_at_unwritten_record(log_dir):
+    routes_db = open_store(log_dir)
+    routes_db[UUID_1] = Route(UUID_1)
+    routes_db.append_way_points(routes_db[UUID_1], [(11.11, 0.13), (50.11, 20.13)])
+    # A torn write never sets the type byte of its record
+    segment = routes_db.log._segment
+    segment.map[segment.records * RECORD.size + 8] = 0xFF
+    segment.map[segment.records * RECORD.size] = 0
+    segment.map.flush()
+
+    replayed = open_store(log_dir)
+    assert list(replayed[UUID_1].lats) == [11.11, 50.11]
+
+
+def test_flush__timer(log_dir):
+    log = WayPointLog(log_dir, flush_records=1000, flush_interval_seconds=0.2)
+    routes_db = LoggedMemoryRouteStore(log)
+    routes_db[UUID_1] = Route(UUID_1)
+    routes_db.append_way_points(routes_db[UUID_1], [(11.11, 0.13)])
+    assert log._segment.unflushed == 2
+
+    # No later write crosses a threshold, the timer flushes them
+    for _ in range(200):
+        if not log._segment.unflushed:
+            break
+        time.sleep(0.01)
+    assert log._segment.unflushed == 0
+    assert log._flush_timer is None
+
+    routes_db.append_way_points(routes_db[UUID_1], [(50.11, 20.13)])
+    log.close()
+    assert log._flush_timer is None
+
+
+def test_compact(log_dir):
+    with freeze_time("2021-01-01 12:00:00"):
+        routes_db = open_store(log_dir)
+        routes_db[UUID_1] = Route(UUID_1)
+        routes_db.append_way_points(routes_db[UUID_1], [(11.11, 0.13), (50.11, 20.13)])
+
+    with freeze_time("2021-01-02 12:00:00"):
+        routes_db.compact()
+        assert log_files(log_dir) == ["snapshot-00000001.snap"]
+
+        routes_db[UUID_2] = Route(UUID_2)
+        routes_db.append_way_points(routes_db[UUID_2], [(-1.5, 2.5)])
+        # Segments with open routes are kept
+        routes_db.compact()
+        assert log_files(log_dir) == ["segment-00000002.log", "snapshot-00000001.snap"]
+
+        replayed = open_store(log_dir)
+        assert replayed[UUID_1].created == datetime.date(2021, 1, 1)
+        assert list(replayed[UUID_1].lats) == [11.11, 50.11]
+        assert list(replayed[UUID_2].lats) == [-1.5]
+
+
+def test_compact__interrupted_before_removing_segments(log_dir):
+    with freeze_time("2021-01-01 12:00:00"):
+        routes_db = open_store(log_dir)
+        routes_db[UUID_1] = Route(UUID_1)
+        routes_db.append_way_points(routes_db[UUID_1], [(11.11, 0.13), (50.11, 20.13)])
+        routes_db.log.close()
+
+    with freeze_time("2021-01-02 12:00:00"):
+        routes_db.log._write_snapshot([routes_db[UUID_1]])
+
+        replayed = open_store(log_dir)
+        assert list(replayed[UUID_1].lats) == [11.11, 50.11]
+
+
+def test_crud_with_logged_route_store(log_dir, monkeypatch):
+    monkeypatch.setattr(database, "routes_db", open_store(log_dir))
+    with freeze_time("2021-01-01 12:00:00"):
+        crud.create_route(UUID_1)
+        crud.add_way_point_to_route(UUID_1, D("50.11"), D("20.13"))
+        crud.add_way_points_to_routes(
+            [(UUID_1, D("11.11"), D("0.13")), (UUID_1, D("50.11"), D("20.13"))]
+        )
+        database.routes_db.log.close()
+
+    # A restarted process sees the same route
+    database.routes_db = open_store(log_dir)
+    assert crud.get_route_length_km(UUID_1) == D("9395.796698692")
+
+
+def test_compact__merges_snapshots(log_dir):
+    with freeze_time("2021-01-01 12:00:00"):
+        routes_db = open_store(log_dir)
+        routes_db[UUID_1] = Route(UUID_1)
+        routes_db.append_way_points(routes_db[UUID_1], [(11.11, 0.13), (50.11, 20.13)])
+
+    with freeze_time("2021-01-02 12:00:00"):
+        routes_db.compact()
+        routes_db[UUID_2] = Route(UUID_2)
+        routes_db.append_way_points(routes_db[UUID_2], [(-1.5, 2.5)])
+
+    with freeze_time("2021-01-03 12:00:00"):
+        routes_db.compact()
+        assert log_files(log_dir) == ["snapshot-00000002.snap"]
+        # Nothing changed
+        routes_db.compact()
+        assert log_files(log_dir) == ["snapshot-00000002.snap"]
+
+        # Routes the store no longer holds are left out
+        dict.pop(routes_db, UUID_1)
+        routes_db.compact()
+        assert log_files(log_dir) == ["snapshot-00000003.snap"]
+        replayed = open_store(log_dir)
+        assert list(replayed.keys()) == [UUID_2]
+        assert list(replayed[UUID_2].lats) == [-1.5]
+
+
+def test_compact__drops_routes_still_in_segments(log_dir):
+    with freeze_time("2021-01-01 12:00:00"):
+        routes_db = open_store(log_dir, segment_bytes=3 * RECORD.size)
+        routes_db[UUID_1] = Route(UUID_1)
+        routes_db.append_way_points(
+            routes_db[UUID_1], [(11.11, 0.13), (50.11, 20.13), (44.11, 15.13)]
+        )
+
+    with freeze_time("2021-01-02 12:00:00"):
+        routes_db[UUID_2] = Route(UUID_2)
+        routes_db.compact()
+        # The second segment holds the last way point of the closed route
+        assert log_files(log_dir) == ["segment-00000002.log", "snapshot-00000001.snap"]
+
+        dict.pop(routes_db, UUID_1)
+        routes_db.compact()
+        assert log_files(log_dir) == ["segment-00000002.log", "snapshot-00000002.snap"]
+        replayed = open_store(log_dir)
+        assert list(replayed.keys()) == [UUID_2]